@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Browser Lifecycle Manager
+
+Decides when the browser should be restarted and lets the scrape loop do it
+at a safe point (between listings or cities) instead of a timer thread
+replacing the driver underneath a running scrap_link.
+
+Restart triggers, checked at most every check_interval seconds:
+- age:       browser running longer than max_age_minutes
+- memory:    resident memory of Chrome + chromedriver above max_rss_mb
+- renderers: more than max_renderers renderer processes
+- latency:   median page load over the recent window degraded to
+             latency_factor x the median right after launch
+
+Process metrics come from psutil when installed and from /proc otherwise;
+for a Remote WebDriver (no local processes) only age and latency apply.
+
+With a WarmSpare, a second browser is launched and validated in the
+background shortly before a restart is due (spare_lead_minutes before the
+age limit, or at 80% of the memory limit) and swapped in at the safe point,
+so the scrape does not wait for Chrome startup, Remote WebDriver connect
+retries or proxy auth. A local spare needs its own user data dir (Chrome
+locks a profile while running); on Selenium Grid / standalone-chrome the
+node must allow two sessions (SE_NODE_MAX_SESSIONS=2).
+"""
+
+import os
+import time
+import threading
+import statistics
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_children_map() -> Dict[int, List[int]]:
+    """ppid -> [pid] for every process in /proc"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+            # The command name may contain spaces; fields after it are space separated
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree_metrics(root_pid: int) -> Optional[Dict]:
+    """Total RSS (bytes), process count and renderer count of root_pid and all its descendants"""
+    if psutil is not None:
+        try:
+            root = psutil.Process(root_pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        rss = 0
+        renderers = 0
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+                if "--type=renderer" in " ".join(process.cmdline()):
+                    renderers += 1
+            except psutil.Error:
+                continue
+        return {"rss": rss, "processes": len(processes), "renderers": renderers}
+
+    if not os.path.isdir("/proc"):
+        return None
+    children = _proc_children_map()
+    pids = [root_pid]
+    i = 0
+    while i < len(pids):
+        pids.extend(children.get(pids[i], []))
+        i += 1
+
+    rss = 0
+    renderers = 0
+    counted = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm", "r") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"--type=renderer" in f.read():
+                    renderers += 1
+            counted += 1
+        except (OSError, IndexError, ValueError):
+            continue
+    if not counted:
+        return None
+    return {"rss": rss, "processes": counted, "renderers": renderers}
+
+
+def driver_process_pid(browser) -> Optional[int]:
+    """PID of the local chromedriver service (Chrome runs as its descendant), None for Remote WebDriver"""
+    try:
+        return browser.service.process.pid
+    except AttributeError:
+        return None
+
+
+class WarmSpare:
+    """A replacement browser launched and validated in a background thread"""
+
+    def __init__(self, factory: Callable[[], Tuple], validate: Callable, launch_timeout: float = 180, log=print):
+        """
+        Args:
+            factory: Launches a browser, returns (driver, profile)
+            validate: driver -> True if the browser is usable
+            launch_timeout: Longest a restart waits for a launch already in progress
+            log: Logging callable
+        """
+        self.factory = factory
+        self.validate = validate
+        self.launch_timeout = launch_timeout
+        self.log = log
+        self.lock = threading.Lock()
+        self.thread = None
+        self.spare = None
+        self.launches = 0
+        self.failures = 0
+        self.last_launch_seconds = 0.0
+
+    def prepare(self):
+        """Start launching a spare unless one is ready or on its way"""
+        with self.lock:
+            if self.spare is not None or self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._launch, name="warm-spare", daemon=True)
+            self.thread.start()
+
+    def _launch(self):
+        start = time.time()
+        self.log("INFO: Launching warm spare browser in the background")
+        spare = None
+        try:
+            spare = self.factory()
+            if not self.validate(spare[0]):
+                raise RuntimeError("validation failed")
+            self.last_launch_seconds = time.time() - start
+            self.log(f"SUCCESS: Warm spare browser ready after {self.last_launch_seconds:.1f}s")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"WARNING: Warm spare browser failed: {str(e)}")
+            if spare is not None:
+                _quit_quietly(spare[0])
+            spare = None
+        with self.lock:
+            self.launches += 1
+            self.spare = spare
+            self.thread = None
+
+    def ready(self) -> bool:
+        with self.lock:
+            return self.spare is not None
+
+    def take(self) -> Optional[Tuple]:
+        """Hand over the spare (driver, profile), waiting for a launch in progress; None if there is none"""
+        with self.lock:
+            thread = self.thread
+        if thread is not None:
+            thread.join(self.launch_timeout)
+        with self.lock:
+            spare, self.spare = self.spare, None
+        return spare
+
+    def discard(self):
+        """Quit an unused spare (shutdown)"""
+        spare = self.take()
+        if spare is not None:
+            _quit_quietly(spare[0])
+
+
+def _quit_quietly(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+class BrowserLifecycle:
+    """Resource-aware restart decisions, applied only at safe points"""
+
+    def __init__(self, restart_fn: Callable[[str], bool], get_browser: Callable, max_age_minutes: float = 180,
+                 max_rss_mb: float = 2500, max_renderers: int = 12, latency_factor: float = 3.0,
+                 latency_window: int = 20, check_interval: float = 30, spare: Optional[WarmSpare] = None,
+                 spare_lead_minutes: float = 10, log=print):
+        """
+        Args:
+            restart_fn: Restarts the browser, called with the cause and a (driver, profile)
+                replacement from the warm spare (or None to relaunch); returns True on success
+            get_browser: Returns the current driver
+            max_age_minutes: Restart after this much browser uptime (0 disables)
+            max_rss_mb: Restart when Chrome's resident memory exceeds this (0 disables)
+            max_renderers: Restart when more renderer processes are alive (0 disables)
+            latency_factor: Restart when recent median page load exceeds baseline by this factor (0 disables)
+            latency_window: Page loads in the baseline and in the recent window
+            check_interval: Minimum seconds between process measurements
+            spare: Optional warm spare swapped in on restart
+            spare_lead_minutes: Start the spare this long before the age limit
+            log: Logging callable
+        """
+        self.restart_fn = restart_fn
+        self.get_browser = get_browser
+        self.max_age_seconds = max_age_minutes * 60
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.max_renderers = max_renderers
+        self.latency_factor = latency_factor
+        self.latency_window = latency_window
+        self.check_interval = check_interval
+        self.spare = spare
+        self.spare_lead_seconds = spare_lead_minutes * 60
+        self.log = log
+
+        self.restart_counts: Dict[str, int] = {}
+        self.last_metrics: Optional[Dict] = None
+        self.requested_cause: Optional[str] = None
+        self.downtimes: List[Tuple[float, bool]] = []
+        self.browser_started()
+
+    def browser_started(self):
+        """Reset per-browser state after a launch"""
+        self.started_at = time.time()
+        self.last_check = 0.0
+        self.baseline_loads: List[float] = []
+        self.recent_loads = deque(maxlen=self.latency_window)
+
+    def record_page_load(self, seconds: float):
+        """Feed a listing page load time; the first latency_window loads form the baseline"""
+        if len(self.baseline_loads) < self.latency_window:
+            self.baseline_loads.append(seconds)
+        else:
+            self.recent_loads.append(seconds)
+
+    def request_restart(self, cause: str):
+        """Restart at the next safe point regardless of measurements"""
+        self.requested_cause = cause
+
+    def check(self) -> Optional[str]:
+        """Cause of a due restart, or None"""
+        if self.requested_cause:
+            return self.requested_cause
+
+        age = time.time() - self.started_at
+        if self.max_age_seconds and age >= self.max_age_seconds:
+            return "age"
+        if self.spare and self.max_age_seconds and age >= self.max_age_seconds - self.spare_lead_seconds:
+            self.spare.prepare()
+
+        if (self.latency_factor and len(self.baseline_loads) >= self.latency_window
+                and len(self.recent_loads) >= self.latency_window):
+            baseline = statistics.median(self.baseline_loads)
+            recent = statistics.median(self.recent_loads)
+            if baseline > 0 and recent > baseline * self.latency_factor:
+                self.log(f"INFO: Page loads degraded: median {recent:.1f}s vs {baseline:.1f}s after launch")
+                return "latency"
+
+        now = time.time()
+        if now - self.last_check < self.check_interval:
+            return None
+        self.last_check = now
+
+        pid = driver_process_pid(self.get_browser())
+        metrics = process_tree_metrics(pid) if pid else None
+        self.last_metrics = metrics
+        if metrics:
+            if self.spare and self.max_rss_bytes and metrics["rss"] > self.max_rss_bytes * 0.8:
+                self.spare.prepare()
+            if self.max_rss_bytes and metrics["rss"] > self.max_rss_bytes:
+                self.log(f"INFO: Chrome resident memory {metrics['rss'] / (1024 * 1024):.0f} MB "
+                         f"exceeds {self.max_rss_bytes / (1024 * 1024):.0f} MB")
+                return "memory"
+            if self.max_renderers and metrics["renderers"] > self.max_renderers:
+                self.log(f"INFO: {metrics['renderers']} renderer processes exceed {self.max_renderers}")
+                return "renderers"
+        return None
+
+    def maybe_restart(self) -> bool:
+        """Call at a safe point - restarts the browser if any trigger fired"""
+        cause = self.check()
+        if not cause:
+            return False
+
+        self.log(f"INFO: Restarting browser at safe point (cause: {cause}, "
+                 f"uptime {(time.time() - self.started_at) / 60:.0f} min)")
+        self.requested_cause = None
+        self.restart_counts[cause] = self.restart_counts.get(cause, 0) + 1
+
+        # Downtime: from the safe point until a usable browser is back, including any wait for the spare
+        start = time.time()
+        replacement = self.spare.take() if self.spare else None
+        restarted = self.restart_fn(cause, replacement)
+        downtime = time.time() - start
+        self.downtimes.append((downtime, replacement is not None))
+        self.log(f"INFO: Browser {'swapped to warm spare' if replacement else 'relaunched'}, "
+                 f"scraping paused {downtime:.1f}s")
+        if restarted:
+            self.browser_started()
+        return restarted
+
+    def close(self):
+        """Quit the warm spare, if any"""
+        if self.spare:
+            self.spare.discard()
+
+    def stats(self) -> Dict:
+        metrics = self.last_metrics or {}
+        return {
+            "uptime_minutes": round((time.time() - self.started_at) / 60, 1),
+            "rss_mb": round(metrics.get("rss", 0) / (1024 * 1024), 1),
+            "renderers": metrics.get("renderers", 0),
+            "restarts": dict(self.restart_counts),
+            "warm_restarts": sum(1 for _, warm in self.downtimes if warm),
+            "cold_restarts": sum(1 for _, warm in self.downtimes if not warm),
+            "downtime_seconds": round(sum(seconds for seconds, _ in self.downtimes), 1),
+            "max_downtime_seconds": round(max((seconds for seconds, _ in self.downtimes), default=0.0), 1),
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        restarts = ", ".join(f"{cause}={count}" for cause, count in sorted(stats["restarts"].items())) or "none"
+        return (f"Browser lifecycle: uptime {stats['uptime_minutes']:.0f} min, RSS {stats['rss_mb']:.0f} MB, "
+                f"{stats['renderers']} renderers, restarts: {restarts} "
+                f"({stats['warm_restarts']} warm, {stats['cold_restarts']} cold, "
+                f"downtime {stats['downtime_seconds']:.1f}s total, {stats['max_downtime_seconds']:.1f}s max)")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Crash-Safe Scrape Checkpoints
+
+Persists what a restarted process needs to pick up exactly where it stopped:
+- The harvested link queue of the city being scraped (after known/out-of-scope
+  filtering), so a restart does not scroll the marketplace again
+- Publication IDs already processed or failed in that city, so they are not
+  scraped again
+- The current row of the input.csv cycle
+
+Processed/failed IDs are appended to a line log next to the checkpoint
+(checkpoint.json.marks, one ["city", "processed" | "failed", "id"] per line)
+instead of rewriting the whole file per listing. Every other change rewrites
+the checkpoint atomically (temp file, fsync, os.replace) with the marks folded
+in, then truncates the log; loading folds in whatever the log still holds:
+    {"cycle": {"row": 3, "updated_at": 1718400000},
+     "cities": {"los-angeles": {"links": {...}, "link_texts": {...}, "processed": [...],
+                                "failed": [...], "links_found": 412, "known_links_skipped": 80,
+                                "feed_head": [...], "harvested_at": 1718400000}}}
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHECKPOINT_FILE = os.path.join(SCRIPT_DIR, "state", "checkpoint.json")
+
+
+class CheckpointStore:
+    """Persisted link queue, processed/failed IDs per city and input cycle position"""
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_FILE, max_age_hours: float = 6, log=print):
+        """
+        Args:
+            path: JSON checkpoint file
+            max_age_hours: Harvested links older than this are re-collected instead of resumed
+            log: Logging callable
+        """
+        self.path = path
+        self.max_age_seconds = max_age_hours * 3600
+        self.log = log
+        self.lock = threading.Lock()
+        self.marks_path = f"{path}.marks"
+        self.marks_file = None
+        self.data = self._load()
+        self.data.setdefault("cycle", {"row": 0})
+        self.data.setdefault("cities", {})
+        if self._fold_marks():
+            with self.lock:
+                self._save()
+
+    def _load(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"WARNING: Could not read checkpoint from {self.path}: {str(e)}")
+            return {}
+
+    def _fold_marks(self) -> int:
+        """Apply marks logged after the last full save; returns how many were read"""
+        if not os.path.exists(self.marks_path):
+            return 0
+        count = 0
+        try:
+            with open(self.marks_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        city_code, key, product_id = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of a crashed process
+                    count += 1
+                    entry = self.data["cities"].get(city_code)
+                    if entry is not None and product_id not in entry[key]:
+                        entry[key].append(product_id)
+        except OSError as e:
+            self.log(f"WARNING: Could not read checkpoint marks from {self.marks_path}: {str(e)}")
+        return count
+
+    def _save(self):
+        """Atomic write - a crash leaves either the old or the new checkpoint, never a torn one"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.log(f"WARNING: Could not save checkpoint: {str(e)}")
+            return
+
+        # The marks are part of the checkpoint now
+        if self.marks_file is not None:
+            self.marks_file.close()
+            self.marks_file = None
+        try:
+            if os.path.exists(self.marks_path):
+                os.remove(self.marks_path)
+        except OSError as e:
+            self.log(f"WARNING: Could not truncate checkpoint marks: {str(e)}")
+
+    # --- input cycle ---------------------------------------------------------
+
+    def cycle_row(self) -> int:
+        """Row of input.csv the previous process was working on"""
+        with self.lock:
+            return int(self.data["cycle"].get("row", 0))
+
+    def set_cycle_row(self, row: int):
+        with self.lock:
+            self.data["cycle"] = {"row": row, "updated_at": int(time.time())}
+            self._save()
+
+    # --- per-city link queue -------------------------------------------------
+
+    def save_links(self, city_code: str, links: Dict[str, str], link_texts: Optional[Dict[str, str]] = None,
+                   links_found: int = 0, known_links_skipped: int = 0, feed_head: Optional[List[str]] = None):
+        """Record the filtered link queue of a city right after harvesting (feed_head: newest IDs, for the watermark)"""
+        with self.lock:
+            self.data["cities"][city_code] = {
+                "links": dict(links),
+                "link_texts": {pid: text for pid, text in (link_texts or {}).items() if pid in links},
+                "processed": [],
+                "failed": [],
+                "links_found": links_found,
+                "known_links_skipped": known_links_skipped,
+                "feed_head": list(feed_head or []),
+                "harvested_at": int(time.time()),
+            }
+            self._save()
+
+    def restore_links(self, city_code: str) -> Optional[Dict]:
+        """
+        Checkpointed queue of a city with processed/failed IDs removed.
+
+        Returns:
+            {"links", "link_texts", "links_found", "known_links_skipped", "feed_head", "done"} or None
+            if there is no checkpoint for the city or it is older than max_age_hours
+        """
+        with self.lock:
+            entry = self.data["cities"].get(city_code)
+            if not entry:
+                return None
+            if time.time() - entry.get("harvested_at", 0) > self.max_age_seconds:
+                del self.data["cities"][city_code]
+                self._save()
+                return None
+
+            done = set(entry.get("processed", [])) | set(entry.get("failed", []))
+            return {
+                "links": {pid: href for pid, href in entry["links"].items() if pid not in done},
+                "link_texts": dict(entry.get("link_texts", {})),
+                "links_found": entry.get("links_found", len(entry["links"])),
+                "known_links_skipped": entry.get("known_links_skipped", 0),
+                "feed_head": list(entry.get("feed_head", [])),
+                "done": len(done),
+            }
+
+    def mark_processed(self, city_code: str, product_id):
+        self._mark(city_code, product_id, "processed")
+
+    def mark_failed(self, city_code: str, product_id):
+        self._mark(city_code, product_id, "failed")
+
+    def _mark(self, city_code: str, product_id, key: str):
+        with self.lock:
+            entry = self.data["cities"].get(city_code)
+            if entry is None:
+                return
+            entry[key].append(str(product_id))
+            try:
+                if self.marks_file is None:
+                    os.makedirs(os.path.dirname(self.marks_path), exist_ok=True)
+                    self.marks_file = open(self.marks_path, "a", encoding="utf-8")
+                self.marks_file.write(json.dumps([city_code, key, str(product_id)]) + "\n")
+                self.marks_file.flush()
+            except OSError as e:
+                self.log(f"WARNING: Could not save checkpoint mark: {str(e)}")
+
+    def close(self):
+        """Fold the marks log into the checkpoint"""
+        with self.lock:
+            if self.marks_file is not None:
+                self._save()
+
+    def complete_city(self, city_code: str):
+        """The city's queue is fully processed - nothing left to resume"""
+        self.discard_city(city_code)
+
+    def discard_city(self, city_code: str):
+        """Drop a city's checkpoint so its next visit starts over (e.g. after a failed run)"""
+        with self.lock:
+            if self.data["cities"].pop(city_code, None) is not None:
+                self._save()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Yield-Driven City Scheduler
+
+The standalone loop used to walk input.csv in fixed order, so a city that
+produced nothing new got the same browser time as a high-churn metro. The
+scheduler picks the next city by the new listings a visit is expected to
+produce per browser-minute:
+
+    arrival rate (new listings/hour, from the sink's created count over the
+    time since the previous visit) x hours since that visit
+    / expected visit duration (minutes)
+
+Both the arrival rate and the visit duration are exponentially smoothed over
+visits. On top of the ranking:
+- min_revisit_minutes: a city is not visited again sooner than this
+- a city is not visited before at least min_expected new listings are
+  expected there, so low-churn cities do not fill the gaps between visits of
+  busy ones
+- cold cities (no arrival rate yet - fewer than two visits) go first
+- cities not visited for max_revisit_hours are due regardless of yield
+- with probability `explore` a random eligible city is picked instead of the
+  best one, so low-yield estimates get refreshed
+
+State is persisted as JSON (state/city_schedule.json), including the city in
+progress, which is picked again first after a crash so the checkpoint can
+resume its link queue.
+
+Usage:
+    python city_scheduler.py --show
+"""
+
+import os
+import json
+import time
+import heapq
+import random
+import argparse
+import threading
+from typing import Dict, Iterator, Optional, Tuple, TypeVar
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCHEDULE_FILE = os.path.join(SCRIPT_DIR, "state", "city_schedule.json")
+
+T = TypeVar("T")
+
+
+class CityScheduler:
+    """Picks the next city to scrape by expected new listings per browser-minute"""
+
+    def __init__(self, path: str = DEFAULT_SCHEDULE_FILE, min_revisit_minutes: float = 30,
+                 max_revisit_hours: float = 24, explore: float = 0.1, min_expected: float = 1.0,
+                 smoothing: float = 0.3, seed: Optional[int] = None, log=print):
+        """
+        Args:
+            path: JSON file holding per-city yield statistics
+            min_revisit_minutes: Minimum time between two visits of the same city
+            max_revisit_hours: Cities not visited for this long are due regardless of yield
+            explore: Probability of picking a random eligible city instead of the best one
+            min_expected: New listings that must be expected before a city is visited again
+            smoothing: Weight of the newest visit in the smoothed rate and duration
+            seed: Random seed for exploration (None for non-deterministic)
+            log: Logging callable
+        """
+        self.path = path
+        self.min_revisit_seconds = min_revisit_minutes * 60
+        self.max_revisit_seconds = max_revisit_hours * 3600
+        self.explore = explore
+        self.min_expected = min_expected
+        self.smoothing = smoothing
+        self.random = random.Random(seed)
+        self.log = log
+        self.lock = threading.Lock()
+        data = self._load()
+        self.cities: Dict[str, Dict] = data.get("cities", {})
+        self.current: Optional[str] = data.get("current")
+
+    def _load(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"WARNING: Could not read city schedule from {self.path}: {str(e)}")
+            return {}
+
+    def save(self):
+        """Write the schedule to disk atomically"""
+        with self.lock:
+            data = {"current": self.current, "cities": self.cities}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.log(f"WARNING: Could not save city schedule: {str(e)}")
+
+    # --- ranking -------------------------------------------------------------
+
+    def expected_new(self, city_code: str, now: Optional[float] = None) -> Optional[float]:
+        """New listings expected in a city since its last visit; None for cold cities"""
+        stats = self.cities.get(city_code)
+        if not stats or stats.get("rate_per_hour") is None:
+            return None
+        now = now or time.time()
+        return stats["rate_per_hour"] * max(0.0, now - stats["last_start"]) / 3600
+
+    def score(self, city_code: str, now: Optional[float] = None) -> Optional[float]:
+        """Expected new listings per browser-minute if the city were visited now; None for cold cities"""
+        expected = self.expected_new(city_code, now)
+        if expected is None or not self.cities[city_code].get("duration_s"):
+            return None
+        return expected / (self.cities[city_code]["duration_s"] / 60)
+
+    def next_city(self, candidates: Dict[str, T], now: Optional[float] = None) -> Tuple[Optional[str], str, float]:
+        """
+        Choose among candidate cities (city_code -> input row, in input order).
+
+        Returns:
+            (city_code, reason, 0) with reason one of resume/cold/overdue/explore/yield,
+            or (None, "wait", seconds until the next city becomes eligible)
+        """
+        now = now or time.time()
+        with self.lock:
+            if self.current in candidates:
+                return self.current, "resume", 0.0
+
+            ranked = []
+            eligible = []
+            soonest = None
+            for order, city_code in enumerate(candidates):
+                stats = self.cities.get(city_code)
+                since = now - stats["last_start"] if stats and stats.get("last_start") else None
+                score = self.score(city_code, now)
+
+                # Seconds until the city may be visited again (0 = now)
+                wait = 0.0
+                if since is not None and since < self.min_revisit_seconds:
+                    wait = self.min_revisit_seconds - since
+                elif score is not None and since < self.max_revisit_seconds:
+                    missing = self.min_expected - self.expected_new(city_code, now)
+                    if missing > 0:
+                        rate = stats["rate_per_hour"]
+                        wait = min(missing / rate * 3600 if rate else self.max_revisit_seconds - since,
+                                   self.max_revisit_seconds - since)
+                if wait > 0:
+                    soonest = wait if soonest is None else min(soonest, wait)
+                    continue
+                eligible.append(city_code)
+
+                if score is None:
+                    # Cold cities first, in input order
+                    heapq.heappush(ranked, (0, order, 0.0, city_code, "cold"))
+                elif since >= self.max_revisit_seconds:
+                    heapq.heappush(ranked, (1, -since, 0.0, city_code, "overdue"))
+                else:
+                    heapq.heappush(ranked, (2, -score, order, city_code, "yield"))
+
+            if not ranked:
+                return None, "wait", soonest or self.min_revisit_seconds
+
+            tier, _, _, city_code, reason = ranked[0]
+            if tier == 2 and len(eligible) > 1 and self.random.random() < self.explore:
+                return self.random.choice(eligible), "explore", 0.0
+            return city_code, reason, 0.0
+
+    def picks(self, candidates: Dict[str, T], count: int, sleep=time.sleep) -> Iterator[Tuple[str, T]]:
+        """Yield up to count (city_code, candidate) picks, sleeping while every city is within min_revisit"""
+        for _ in range(count):
+            while True:
+                city_code, reason, wait = self.next_city(candidates)
+                if city_code is not None:
+                    break
+                self.log(f"INFO: No city is due yet (min revisit {self.min_revisit_seconds / 60:.0f} minutes, "
+                         f"{self.min_expected:g} new listings expected), waiting {wait:.0f}s")
+                sleep(wait)
+            score = self.score(city_code)
+            self.log(f"INFO: Scheduling {city_code} ({reason}"
+                     f"{f', {score:.2f} new/min expected' if score is not None else ''})")
+            yield city_code, candidates[city_code]
+
+    # --- updates -------------------------------------------------------------
+
+    def begin(self, city_code: str):
+        """Mark a city as in progress, so a crashed run picks it again first"""
+        with self.lock:
+            self.current = city_code
+        self.save()
+
+    def record(self, city_code: str, created: int, duplicates: int, started_at: float,
+               finished_at: Optional[float] = None):
+        """Fold a finished visit into the city's smoothed arrival rate and duration"""
+        finished_at = finished_at or time.time()
+        with self.lock:
+            stats = self.cities.setdefault(city_code, {"visits": 0, "rate_per_hour": None, "duration_s": None,
+                                                       "created": 0, "duplicates": 0, "last_start": None})
+            previous_start = stats["last_start"]
+            if previous_start and started_at > previous_start:
+                # New listings since the previous visit; the first visit has no interval to divide by
+                rate = created / ((started_at - previous_start) / 3600)
+                stats["rate_per_hour"] = self._smooth(stats["rate_per_hour"], rate)
+            stats["duration_s"] = self._smooth(stats["duration_s"], max(1.0, finished_at - started_at))
+            stats["visits"] += 1
+            stats["created"] += created
+            stats["duplicates"] += duplicates
+            stats["last_start"] = started_at
+            stats["last_created"] = created
+            stats["last_duplicates"] = duplicates
+            if self.current == city_code:
+                self.current = None
+        self.save()
+
+    def _smooth(self, previous: Optional[float], sample: float) -> float:
+        if previous is None:
+            return sample
+        return self.smoothing * sample + (1 - self.smoothing) * previous
+
+    def forget(self, city_code: str):
+        with self.lock:
+            self.cities.pop(city_code, None)
+            if self.current == city_code:
+                self.current = None
+        self.save()
+
+    # --- reporting -----------------------------------------------------------
+
+    def summary(self, limit: int = 5) -> str:
+        now = time.time()
+        with self.lock:
+            scored = [(self.score(city_code, now), city_code) for city_code in self.cities]
+        ranked = sorted(((score, city) for score, city in scored if score is not None), reverse=True)[:limit]
+        cold = sum(1 for score, _ in scored if score is None)
+        top = ", ".join(f"{city} {score:.2f}/min" for score, city in ranked) or "none yet"
+        return f"City schedule: {top} ({cold} cities without a yield estimate)"
+
+    def table(self):
+        """Rows for --show, best expected yield first"""
+        now = time.time()
+        rows = []
+        for city_code, stats in self.cities.items():
+            processed = stats["created"] + stats["duplicates"]
+            rows.append({
+                "city_code": city_code,
+                "visits": stats["visits"],
+                "rate_per_hour": stats.get("rate_per_hour"),
+                "duration_min": stats["duration_s"] / 60 if stats.get("duration_s") else None,
+                "duplicate_share": stats["duplicates"] / processed if processed else None,
+                "minutes_since": (now - stats["last_start"]) / 60 if stats.get("last_start") else None,
+                "score": self.score(city_code, now),
+            })
+        rows.sort(key=lambda row: (row["score"] is not None, row["score"] or 0), reverse=True)
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the yield statistics behind the city schedule")
+    parser.add_argument("--show", action="store_true", help="Print per-city rate, duration and score")
+    parser.add_argument("--forget", type=str, help="Drop a city's statistics so it is explored again")
+    args = parser.parse_args()
+
+    scheduler = CityScheduler()
+    if args.forget:
+        scheduler.forget(args.forget)
+        print(f"Forgot {args.forget}")
+        return
+    if not args.show:
+        parser.print_help()
+        return
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    print(f"{'city':<24}{'visits':>7}{'new/h':>9}{'min/visit':>11}{'dup %':>7}{'min since':>11}{'new/min':>9}")
+    for row in scheduler.table():
+        dup = row["duplicate_share"] * 100 if row["duplicate_share"] is not None else None
+        print(f"{row['city_code']:<24}{row['visits']:>7}{fmt(row['rate_per_hour'], '.1f'):>9}"
+              f"{fmt(row['duration_min'], '.1f'):>11}{fmt(dup, '.0f'):>7}"
+              f"{fmt(row['minutes_since'], '.0f'):>11}{fmt(row['score'], '.2f'):>9}")
+
+
+if __name__ == "__main__":
+    main()
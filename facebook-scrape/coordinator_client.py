@@ -4,13 +4,25 @@ Coordinator Client for Facebook Marketplace Scraper
 
 This module handles communication with the AutoHunterPro coordinator API
 for job assignment and status reporting.
+
+Requests go through one pooled keep-alive session. Transient failures
+(connection errors, timeouts, 429 and 5xx responses) are retried with bounded
+exponential backoff and jitter; report-status calls carry an idempotency key
+so a retried report is applied only once.
 """
 
 import os
+import time
+import uuid
+import random
+import threading
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict, Any
 
+from firestore_sink import CREATED, DUPLICATE
+
 # Configuration
 COORDINATOR_BASE_URL = os.environ.get(
     'COORDINATOR_URL',
@@ -18,44 +30,201 @@ COORDINATOR_BASE_URL = os.environ.get(
 )
 API_SECRET = os.environ.get('INTERNAL_API_SECRET', '')
 
+REQUEST_TIMEOUT = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+HEARTBEAT_INTERVAL = 60  # seconds; the coordinator re-leases jobs silent for 10 minutes
+
+
+class JobProgress:
+    """
+    Per-job counters and resume cursor, shared between the scrape loop and the heartbeat thread.
+
+    Only publications resolved by the Firestore sink (written or confirmed duplicate) enter the
+    cursor, so a resumed run never skips a publication that was still sitting in a write buffer.
+    """
+
+    def __init__(self, job: Optional[Dict[str, Any]] = None):
+        job = job or {}
+        progress = job.get('progress') or {}
+        cursor = job.get('resumeCursor') or {}
+        self.lock = threading.Lock()
+        self.processed = progress.get('processed', 0)
+        self.created = progress.get('created', 0)
+        self.duplicates = progress.get('duplicates', 0)
+        self.failed = progress.get('failed', 0)
+        self.done_ids = set(cursor.get('processedIds') or [])
+        self.last_publication_id = cursor.get('lastPublicationId')
+        self.resumed = bool(self.done_ids or self.processed)
+
+    def record(self, doc_id, result, publication=None):
+        """Sink listener - count a resolved publication and advance the cursor"""
+        with self.lock:
+            self.processed += 1
+            if result == CREATED:
+                self.created += 1
+            elif result == DUPLICATE:
+                self.duplicates += 1
+            else:
+                self.failed += 1
+                return
+            self.done_ids.add(str(doc_id))
+            self.last_publication_id = str(doc_id)
+
+    def record_failure(self):
+        """A listing that could not be scraped (it stays out of the cursor and is retried on resume)"""
+        with self.lock:
+            self.processed += 1
+            self.failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'progress': {
+                    'processed': self.processed,
+                    'created': self.created,
+                    'duplicates': self.duplicates,
+                    'failed': self.failed,
+                },
+                'resumeCursor': {
+                    'lastPublicationId': self.last_publication_id,
+                    'processedIds': sorted(self.done_ids),
+                },
+            }
+
 
 class CoordinatorClient:
     """Client for communicating with the scraper coordinator API"""
 
-    def __init__(self, vps_id: str, api_secret: Optional[str] = None):
+    def __init__(self, vps_id: str, api_secret: Optional[str] = None, max_attempts: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0, pool_size: int = 4):
+        """
+        Args:
+            vps_id: VPS identifier (e.g., vps-1)
+            api_secret: Coordinator API secret (default: INTERNAL_API_SECRET)
+            max_attempts: Tries per request, including the first one
+            backoff_base: Backoff ceiling in seconds before the first retry (doubles per retry)
+            backoff_max: Upper bound on a single backoff
+            pool_size: Keep-alive connections kept to the coordinator
+        """
         self.vps_id = vps_id
         self.api_secret = api_secret or API_SECRET
         self.base_url = COORDINATOR_BASE_URL
         self.current_job = None
-
-        if not self.api_secret:
-            print("WARNING: No API secret configured. Set INTERNAL_API_SECRET environment variable.")
-
-    def _make_request(self, endpoint: str, method: str = 'POST', data: Optional[Dict] = None) -> Dict[str, Any]:
-        """Make a request to the coordinator API"""
-        url = f"{self.base_url}/{endpoint}"
-        headers = {
+        self.next_available_in = None
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
             'Content-Type': 'application/json',
             'x-api-secret': self.api_secret
-        }
+        })
 
-        try:
-            if method == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=30)
-            else:
-                response = requests.get(url, headers=headers, timeout=30)
+        self.stats_lock = threading.Lock()
+        self.stats = {}
 
-            response.raise_for_status()
-            return response.json()
+        self.heartbeat_thread = None
+        self.heartbeat_stop = threading.Event()
 
-        except requests.exceptions.RequestException as e:
-            print(f"ERROR: Coordinator request failed: {e}")
-            return {'error': str(e), 'success': False}
+        if not self.api_secret:
+            print("WARNING: No API secret configured. Set INTERNAL_API_SECRET environment variable.")
 
-    def get_job(self) -> Optional[Dict[str, Any]]:
+    def _backoff(self, attempt: int, response=None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, endpoint: str, elapsed: float, error: bool, retries: int):
+        with self.stats_lock:
+            stats = self.stats.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            elapsed_ms = elapsed * 1000
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if error:
+                stats['errors'] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint call count, errors, retries and latency (avg/max ms)"""
+        with self.stats_lock:
+            result = {}
+            for endpoint, stats in self.stats.items():
+                result[endpoint] = dict(stats)
+                result[endpoint]['avg_ms'] = round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else 0.0
+            return result
+
+    def stats_summary(self) -> str:
+        """Human-readable per-endpoint transport stats"""
+        stats = self.get_stats()
+        if not stats:
+            return "Coordinator requests: none"
+        lines = ["Coordinator requests per endpoint:"]
+        for endpoint, endpoint_stats in sorted(stats.items()):
+            lines.append(f"  {endpoint}: n={endpoint_stats['calls']} errors={endpoint_stats['errors']} "
+                         f"retries={endpoint_stats['retries']} avg={endpoint_stats['avg_ms']:.0f}ms "
+                         f"max={endpoint_stats['max_ms']:.0f}ms")
+        return "\n".join(lines)
+
+    def _make_request(self, endpoint: str, method: str = 'POST', data: Optional[Dict] = None,
+                      idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Make a request to the coordinator API, retrying transient failures"""
+        url = f"{self.base_url}/{endpoint}"
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+
+        start = time.time()
+        last_error = None
+        for attempt in range(self.max_attempts):
+            response = None
+            try:
+                if method == 'POST':
+                    response = self.session.post(url, json=data, headers=headers, timeout=REQUEST_TIMEOUT)
+                else:
+                    response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    self._record(endpoint, time.time() - start, False, attempt)
+                    return response.json()
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} Server Error for url: {url}", response=response)
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+            except requests.exceptions.RequestException as e:
+                # Client errors (4xx) and malformed responses will not improve on retry
+                print(f"ERROR: Coordinator request failed: {e}")
+                self._record(endpoint, time.time() - start, True, attempt)
+                return {'error': str(e), 'success': False}
+
+            if attempt + 1 < self.max_attempts:
+                delay = self._backoff(attempt, response)
+                print(f"WARNING: Coordinator {endpoint} attempt {attempt + 1}/{self.max_attempts} failed ({last_error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+        print(f"ERROR: Coordinator request failed after {self.max_attempts} attempts: {last_error}")
+        self._record(endpoint, time.time() - start, True, self.max_attempts - 1)
+        return {'error': str(last_error), 'success': False}
+
+    def _report_status(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST report-status with one idempotency key shared by all retries of this report"""
+        return self._make_request('report-status', 'POST', payload, idempotency_key=str(uuid.uuid4()))
+
+    def get_job(self, set_current: bool = True) -> Optional[Dict[str, Any]]:
         """
         Request a job from the coordinator.
 
+        Args:
+            set_current: Make the job the current one (False when prefetching the next job)
+
         Returns:
             Job details including city and state, or None if no jobs available
         """
@@ -64,10 +233,12 @@ class CoordinatorClient:
         print(f"{'='*60}")
 
         result = self._make_request('get-job', 'POST', {'vpsId': self.vps_id})
+        self.next_available_in = None
 
         if result.get('success') and result.get('job'):
-            self.current_job = result['job']
             job = result['job']
+            if set_current:
+                self.current_job = job
             print(f"JOB ASSIGNED:")
             print(f"  City: {job.get('city')}")
             print(f"  State: {job.get('state')}")
@@ -75,6 +246,7 @@ class CoordinatorClient:
             print(f"  Is New: {job.get('isNewJob', False)}")
             return job
         elif result.get('success') and result.get('job') is None:
+            self.next_available_in = result.get('nextAvailableInSeconds')
             print(f"No jobs available: {result.get('message', 'All cities on cooldown')}")
             return None
         else:
@@ -87,7 +259,7 @@ class CoordinatorClient:
             print("WARNING: No current job to report progress for")
             return False
 
-        result = self._make_request('report-status', 'POST', {
+        result = self._report_status({
             'vpsId': self.vps_id,
             'jobId': self.current_job['jobId'],
             'status': 'in_progress'
@@ -100,6 +272,51 @@ class CoordinatorClient:
         print(f"ERROR reporting in_progress: {result.get('error')}")
         return False
 
+    def report_progress(self, progress: JobProgress, job: Optional[Dict[str, Any]] = None) -> bool:
+        """Renew the job lease and store partial counters plus the resume cursor"""
+        job = job or self.current_job
+        if not job:
+            return False
+
+        payload = {
+            'vpsId': self.vps_id,
+            'jobId': job['jobId'],
+            'status': 'in_progress',
+            'heartbeat': True,
+        }
+        payload.update(progress.snapshot())
+        result = self._report_status(payload)
+
+        if result.get('success'):
+            return True
+
+        print(f"WARNING: Heartbeat for job {job['jobId']} failed: {result.get('error')}")
+        return False
+
+    def start_heartbeat(self, progress: JobProgress, interval: float = HEARTBEAT_INTERVAL):
+        """Report progress for the current job every interval seconds until stop_heartbeat()"""
+        self.stop_heartbeat()
+        job = self.current_job
+        if not job:
+            print("WARNING: No current job to send heartbeats for")
+            return
+
+        self.heartbeat_stop = threading.Event()
+        stop = self.heartbeat_stop
+
+        def beat():
+            while not stop.wait(interval):
+                self.report_progress(progress, job)
+
+        self.heartbeat_thread = threading.Thread(target=beat, name="coordinator-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        if self.heartbeat_thread is not None:
+            self.heartbeat_stop.set()
+            self.heartbeat_thread.join(REQUEST_TIMEOUT)
+            self.heartbeat_thread = None
+
     def report_completed(self, listings_found: int, new_listings: int, duplicates_skipped: int, duration_seconds: float) -> bool:
         """
         Report successful job completion.
@@ -114,7 +331,7 @@ class CoordinatorClient:
             print("WARNING: No current job to report completion for")
             return False
 
-        result = self._make_request('report-status', 'POST', {
+        result = self._report_status({
             'vpsId': self.vps_id,
             'jobId': self.current_job['jobId'],
             'status': 'completed',
@@ -144,7 +361,7 @@ class CoordinatorClient:
             print("WARNING: No current job to report failure for")
             return False
 
-        result = self._make_request('report-status', 'POST', {
+        result = self._report_status({
             'vpsId': self.vps_id,
             'jobId': self.current_job['jobId'],
             'status': 'failed',
@@ -187,6 +404,7 @@ def main():
     elif args.action == 'health':
         health = client.check_health()
         print(f"\nHealth check: {json.dumps(health, indent=2)}")
+        print(client.stats_summary())
 
     elif args.action == 'test-cycle':
         # Test a full job cycle
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Per-City Crawl Watermarks
+
+The marketplace feed is sorted by creation_time_descend, so the newest
+publication IDs seen on the previous pass of a city mark where the last crawl
+started. An incremental crawl stops scrolling once it runs into a streak of
+already-known IDs instead of always scrolling max_scrolls times.
+
+Watermarks are persisted as JSON:
+    {"los-angeles": {"ids": ["1234...", ...], "updated_at": 1718400000}}
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterable, List
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WATERMARK_FILE = os.path.join(SCRIPT_DIR, "state", "watermarks.json")
+
+
+class CrawlWatermarks:
+    """Persisted newest-seen publication IDs per city_code"""
+
+    def __init__(self, path: str = DEFAULT_WATERMARK_FILE, keep: int = 100):
+        """
+        Args:
+            path: JSON file holding the watermarks
+            keep: How many of the newest IDs to remember per city
+        """
+        self.path = path
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.cities: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not read crawl watermarks from {self.path}: {str(e)}")
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.cities, f)
+        os.replace(tmp_path, self.path)
+
+    def known_ids(self, city_code: str) -> set:
+        """IDs at the top of the feed on the previous pass of this city"""
+        with self.lock:
+            return set(self.cities.get(city_code, {}).get("ids", []))
+
+    def last_crawled(self, city_code: str):
+        """Unix time of the previous pass, or None if the city was never crawled"""
+        with self.lock:
+            return self.cities.get(city_code, {}).get("updated_at")
+
+    def update(self, city_code: str, newest_ids: Iterable[str]):
+        """Record the newest IDs (feed order) seen on this pass"""
+        ids: List[str] = []
+        for product_id in newest_ids:
+            if product_id not in ids:
+                ids.append(str(product_id))
+            if len(ids) >= self.keep:
+                break
+        if not ids:
+            return
+
+        with self.lock:
+            self.cities[city_code] = {"ids": ids, "updated_at": int(time.time())}
+            try:
+                self._save()
+            except OSError as e:
+                print(f"WARNING: Could not save crawl watermarks: {str(e)}")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+WebDriver Command Accounting
+
+Every Selenium command (find_element, get_attribute, execute_script, ...) goes
+through WebDriver.execute, which is one HTTP round trip to chromedriver or the
+Remote WebDriver. CommandCounter wraps execute on a driver instance so callers
+can measure how many round trips a scroll or a listing costs.
+"""
+
+import threading
+from collections import Counter
+
+
+class CommandCounter:
+    """Counts WebDriver commands issued through an instrumented driver"""
+
+    def __init__(self):
+        self.total = 0
+        self.by_command = Counter()
+        self.lock = threading.Lock()
+
+    def install(self, driver):
+        """Wrap driver.execute so every command is counted (safe to call again after a restart)"""
+        if getattr(driver, "_command_counter", None) is self:
+            return
+        original_execute = driver.execute
+
+        def counted_execute(driver_command, params=None):
+            with self.lock:
+                self.total += 1
+                self.by_command[driver_command] += 1
+            return original_execute(driver_command, params)
+
+        driver.execute = counted_execute
+        driver._command_counter = self
+
+    def mark(self) -> int:
+        """Current total, to be passed to since()"""
+        return self.total
+
+    def since(self, mark: int) -> int:
+        """Commands issued since mark()"""
+        return self.total - mark
+
+
+class CommandBudget:
+    """Per-listing WebDriver command counts held against a budget"""
+
+    def __init__(self, budget: int = 25):
+        """
+        Args:
+            budget: Commands a listing may cost before it is reported as over budget (0 disables)
+        """
+        self.budget = budget
+        self.reset()
+
+    def record(self, commands: int) -> bool:
+        """Add one listing's count; returns False if it exceeded the budget"""
+        self.listings += 1
+        self.total += commands
+        self.max = max(self.max, commands)
+        within = not self.budget or commands <= self.budget
+        if not within:
+            self.over_budget += 1
+        return within
+
+    def reset(self):
+        self.listings = 0
+        self.total = 0
+        self.max = 0
+        self.over_budget = 0
+
+    def summary(self) -> str:
+        average = self.total / self.listings if self.listings else 0.0
+        return (f"WebDriver commands per listing: avg {average:.1f}, max {self.max}, "
+                f"{self.over_budget}/{self.listings} over budget of {self.budget}")
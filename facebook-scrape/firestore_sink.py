@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Buffered Firestore Sink for Scraped Publications
+
+Publications are accumulated in memory and written in batches instead of one
+get() + set() round trip pair per listing:
+- Existence of a whole batch is resolved with a single multi-get (get_all)
+- Only new documents are committed, through WriteBatch commits
+- Every document resolves to CREATED, DUPLICATE or FAILED so the caller can
+  report real duplicate counts to the coordinator
+- A background timer flushes publications that have waited flush_interval,
+  so breaks and slow listings do not hold them back
+"""
+
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Per-document results
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+# Firestore rejects WriteBatch commits with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+
+class FirestoreSink:
+    """Accumulates publications and flushes them to Firestore in batches"""
+
+    def __init__(self, db, collection: str = 'vehicles_initial', flush_size: int = 20,
+                 flush_interval: float = 30.0, log: Callable[[str], None] = print):
+        """
+        Args:
+            db: Firestore client (None means every flush fails)
+            collection: Target collection name
+            flush_size: Number of buffered publications that triggers a flush
+            flush_interval: Max seconds a publication stays buffered (0 disables the timer)
+            log: Logging callable, e.g. fbm_scraper.print_and_log
+        """
+        self.db = db
+        self.collection = collection
+        self.flush_size = max(1, min(int(flush_size), MAX_BATCH_SIZE))
+        self.flush_interval = flush_interval
+        self.log = log
+
+        self.pending: Dict[str, dict] = {}
+        self.oldest_pending = None
+        self.listeners: List[Callable[[str, str, dict], None]] = []
+        self.counts = {CREATED: 0, DUPLICATE: 0, FAILED: 0}
+        self.lock = threading.Lock()
+        # One flush at a time: a caller's flush() returns only after a timed flush in progress has resolved
+        self.flush_lock = threading.Lock()
+
+        self.stop_event = threading.Event()
+        self.timer = None
+        if flush_interval and flush_interval > 0:
+            self.timer = threading.Thread(target=self._run_timer, name="sink-flush-timer", daemon=True)
+            self.timer.start()
+
+    def _run_timer(self):
+        while not self.stop_event.wait(min(1.0, self.flush_interval)):
+            try:
+                self.flush_if_due()
+            except Exception as e:
+                self.log(f"WARNING: Timed sink flush failed: {str(e)}")
+
+    def close(self):
+        """Stop the flush timer (buffered publications are not flushed)"""
+        self.stop_event.set()
+        if self.timer is not None:
+            self.timer.join(2)
+            self.timer = None
+
+    def add_listener(self, callback: Callable[[str, str, dict], None]):
+        """Register callback(doc_id, result, publication) called for every resolved document"""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, str, dict], None]):
+        """Unregister a callback added with add_listener"""
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def add(self, doc_id, publication: dict) -> List[Tuple[str, str]]:
+        """
+        Buffer a publication for upload.
+
+        Returns:
+            (doc_id, result) pairs for every document resolved by this call.
+            Usually empty, unless the buffer reached flush_size or flush_interval.
+        """
+        doc_id = str(doc_id)
+        with self.lock:
+            already_pending = doc_id in self.pending
+            if not already_pending:
+                if not self.pending:
+                    self.oldest_pending = time.time()
+                self.pending[doc_id] = publication
+
+        if already_pending:
+            # Same listing queued twice in one batch - the first copy wins
+            self._resolve([(doc_id, DUPLICATE, publication)])
+            return [(doc_id, DUPLICATE)]
+
+        if len(self.pending) >= self.flush_size or self.flush_due():
+            return self.flush()
+        return []
+
+    def skip(self, doc_id, publication: dict) -> List[Tuple[str, str]]:
+        """Resolve a publication as DUPLICATE without writing it (e.g. a repost of a stored listing)"""
+        return self._resolve([(str(doc_id), DUPLICATE, publication)])
+
+    def flush_due(self) -> bool:
+        """Whether the oldest buffered publication has waited longer than flush_interval"""
+        oldest = self.oldest_pending
+        return bool(self.pending) and oldest is not None and (time.time() - oldest) >= self.flush_interval
+
+    def flush_if_due(self) -> List[Tuple[str, str]]:
+        """Flush only if the flush interval has elapsed"""
+        if self.flush_due():
+            return self.flush()
+        return []
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """Write all buffered publications and return their (doc_id, result) pairs"""
+        with self.flush_lock:
+            return self._flush()
+
+    def _flush(self) -> List[Tuple[str, str]]:
+        with self.lock:
+            batch_items = list(self.pending.items())
+            self.pending = {}
+            self.oldest_pending = None
+
+        if not batch_items:
+            return []
+
+        if not self.db:
+            self.log("ERROR: Firestore not initialized")
+            return self._resolve([(doc_id, FAILED, pub) for doc_id, pub in batch_items])
+
+        collection_ref = self.db.collection(self.collection)
+        refs = {doc_id: collection_ref.document(doc_id) for doc_id, _ in batch_items}
+
+        # One multi-get for the whole batch instead of a get() per document
+        try:
+            existing = {snap.id for snap in self.db.get_all(list(refs.values())) if snap.exists}
+        except Exception as e:
+            self.log(f"ERROR: Failed to check existing publications in Firestore: {str(e)}")
+            return self._resolve([(doc_id, FAILED, pub) for doc_id, pub in batch_items])
+
+        outcomes = []
+        new_items = []
+        for doc_id, pub in batch_items:
+            if doc_id in existing:
+                self.log(f"SKIP: Publication {doc_id} already exists in Firestore, skipping duplicate")
+                outcomes.append((doc_id, DUPLICATE, pub))
+            else:
+                new_items.append((doc_id, pub))
+
+        for start in range(0, len(new_items), MAX_BATCH_SIZE):
+            chunk = new_items[start:start + MAX_BATCH_SIZE]
+            try:
+                batch = self.db.batch()
+                for doc_id, pub in chunk:
+                    batch.set(refs[doc_id], pub)
+                batch.commit()
+                outcomes.extend((doc_id, CREATED, pub) for doc_id, pub in chunk)
+            except Exception as e:
+                self.log(f"ERROR: Failed to commit batch of {len(chunk)} publications: {str(e)}")
+                outcomes.extend((doc_id, FAILED, pub) for doc_id, pub in chunk)
+
+        created = sum(1 for _, result, _ in outcomes if result == CREATED)
+        self.log(f"SUCCESS: Flushed {len(batch_items)} publications to Firestore "
+                 f"({created} created, {len(existing)} duplicates, {len(outcomes) - created - len(existing)} failed)")
+        return self._resolve(outcomes)
+
+    def _resolve(self, outcomes) -> List[Tuple[str, str]]:
+        """Update counters and notify listeners"""
+        with self.lock:
+            for _, result, _ in outcomes:
+                self.counts[result] += 1
+
+        for doc_id, result, pub in outcomes:
+            for callback in self.listeners:
+                try:
+                    callback(doc_id, result, pub)
+                except Exception as e:
+                    self.log(f"WARNING: Sink listener failed for {doc_id}: {str(e)}")
+
+        return [(doc_id, result) for doc_id, result, _ in outcomes]
+
+    def reset_counts(self) -> Dict[str, int]:
+        """Return counters accumulated since the last reset and zero them"""
+        with self.lock:
+            counts = self.counts
+            self.counts = {CREATED: 0, DUPLICATE: 0, FAILED: 0}
+        return counts
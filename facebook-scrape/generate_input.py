@@ -12,13 +12,31 @@ Usage:
 
 Each VPS will only scrape cities in its assigned regions, preventing overlap
 and maximizing coverage efficiency.
+
+Balanced planning:
+    python generate_input.py --plan --stats state/city_schedule.json scraper.log
+    python generate_input.py --vps-id vps-1 --from-plan plans/load_report.json
+
+--plan ignores the hand-written states lists and splits the cities of the
+enabled VPS instances so that the longest predicted cycle (makespan) is as
+short as possible. The load of a city is its historical browser-minutes per
+visit, read from city_scheduler statistics (state/city_schedule.json) and/or
+JSON-lines scraper logs (--log-format json); cities without history get the
+median. States are kept whole on one VPS - neighbouring cities overlap, and
+the near-duplicate index and seller cache are per VPS - unless a state is
+heavier than half a VPS's fair share, in which case its cities are placed
+individually. Placement is longest-processing-time first onto the VPS that
+finishes earliest, followed by move/swap passes off the busiest VPS.
 """
 
+import re
 import json
 import csv
 import argparse
+import datetime
 import os
 import sys
+import statistics
 
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -26,6 +44,14 @@ CONFIG_DIR = os.path.join(SCRIPT_DIR, "config")
 CITIES_FILE = os.path.join(CONFIG_DIR, "cities.json")
 VPS_CONFIG_FILE = os.path.join(CONFIG_DIR, "vps_config.json")
 OUTPUT_FILE = os.path.join(SCRIPT_DIR, "input.csv")
+PLAN_DIR = os.path.join(SCRIPT_DIR, "plans")
+PLAN_REPORT_FILE = "load_report.json"
+
+# Browser-minutes per visit assumed when no city has any history
+DEFAULT_VISIT_MINUTES = 10.0
+
+SUMMARY_COUNTS_RE = re.compile(r"SUMMARY: (\d+) new, (\d+) duplicates")
+VISIT_START_RE = re.compile(r"Starting scraping process for ")
 
 
 def load_cities():
@@ -53,40 +79,28 @@ def get_cities_for_vps(vps_id, cities_config, vps_config):
         print(f"WARNING: VPS '{vps_id}' is disabled in configuration")
 
     assigned_states = vps_settings.get("states", [])
-    cities_list = []
-
-    # Collect cities from all regions
-    for region_name, region_data in cities_config["regions"].items():
-        for state_name, state_cities in region_data["states"].items():
-            if state_name in assigned_states:
-                for city in state_cities:
-                    cities_list.append({
-                        "city": city,
-                        "state": state_name,
-                        "region": region_name
-                    })
+    cities_list = all_cities(cities_config, assigned_states)
 
     return cities_list, vps_settings
 
 
-def generate_input_csv(vps_id):
-    """Generate input.csv for the specified VPS"""
-    print(f"\n{'='*60}")
-    print(f"Generating input.csv for {vps_id}")
-    print(f"{'='*60}\n")
-
-    # Load configurations
-    cities_config = load_cities()
-    vps_config = load_vps_config()
+def get_cities_from_plan(vps_id, cities_config, vps_config, plan_file):
+    """Get list of cities assigned to this VPS by a --plan report"""
+    with open(plan_file, "r") as f:
+        plan = json.load(f)
+    if vps_id not in plan["assignments"]:
+        print(f"ERROR: VPS ID '{vps_id}' not found in plan {plan_file}")
+        print(f"Planned VPS IDs: {list(plan['assignments'].keys())}")
+        sys.exit(1)
 
-    # Get cities and settings for this VPS
-    cities_list, vps_settings = get_cities_for_vps(vps_id, cities_config, vps_config)
+    city_index = {city["city"]: city for city in all_cities(cities_config)}
+    cities_list = [city_index.get(city_code, {"city": city_code, "state": "unknown", "region": "unknown"})
+                   for city_code in plan["assignments"][vps_id]["cities"]]
+    return cities_list, vps_config["vps_instances"].get(vps_id, {})
 
-    if not cities_list:
-        print("ERROR: No cities found for this VPS configuration")
-        sys.exit(1)
 
-    # Get account and proxy settings
+def get_vps_account(vps_settings, vps_config):
+    """(email, password, proxy, threshold) for a VPS, resolving PROXY_N from the proxy pool"""
     account = vps_settings.get("account", {})
     email = account.get("email", "")
     password = account.get("password", "")
@@ -104,6 +118,46 @@ def generate_input_csv(vps_id):
             proxy = ""
 
     threshold = vps_settings.get("threshold", vps_config["default_settings"]["threshold"])
+    return email, password, proxy, threshold
+
+
+def write_input_csv(path, cities_list, email, password, threshold, proxy):
+    """Write input.csv rows for the given cities"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for city_info in cities_list:
+            # Format: email, password, city_code, threshold, proxy, change_language
+            writer.writerow([
+                email,
+                password,
+                city_info["city"],
+                threshold,
+                proxy,
+                "true"
+            ])
+
+
+def generate_input_csv(vps_id, plan_file=None):
+    """Generate input.csv for the specified VPS"""
+    print(f"\n{'='*60}")
+    print(f"Generating input.csv for {vps_id}")
+    print(f"{'='*60}\n")
+
+    # Load configurations
+    cities_config = load_cities()
+    vps_config = load_vps_config()
+
+    # Get cities and settings for this VPS
+    if plan_file:
+        cities_list, vps_settings = get_cities_from_plan(vps_id, cities_config, vps_config, plan_file)
+    else:
+        cities_list, vps_settings = get_cities_for_vps(vps_id, cities_config, vps_config)
+
+    if not cities_list:
+        print("ERROR: No cities found for this VPS configuration")
+        sys.exit(1)
+
+    email, password, proxy, threshold = get_vps_account(vps_settings, vps_config)
 
     # Validate credentials
     if not email or email.startswith("ACCOUNT_"):
@@ -131,18 +185,7 @@ def generate_input_csv(vps_id):
         print(f"  - {state}: {count} cities")
 
     # Write CSV
-    with open(OUTPUT_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        for city_info in cities_list:
-            # Format: email, password, city_code, threshold, proxy, change_language
-            writer.writerow([
-                email,
-                password,
-                city_info["city"],
-                threshold,
-                proxy,
-                "true"
-            ])
+    write_input_csv(OUTPUT_FILE, cities_list, email, password, threshold, proxy)
 
     print(f"\n{'='*60}")
     print(f"SUCCESS: Generated {OUTPUT_FILE}")
@@ -164,6 +207,262 @@ def generate_input_csv(vps_id):
             print(f"  {display_row}")
 
 
+def all_cities(cities_config, states=None):
+    """Every city in cities.json (optionally only the given states) as {city, state, region}"""
+    cities_list = []
+    for region_name, region_data in cities_config["regions"].items():
+        for state_name, state_cities in region_data["states"].items():
+            if states is None or state_name in states:
+                for city in state_cities:
+                    cities_list.append({"city": city, "state": state_name, "region": region_name})
+    return cities_list
+
+
+def load_schedule_stats(path):
+    """Per-city [(visits, minutes per visit, new listings per visit)] from a city_scheduler state file"""
+    with open(path, "r") as f:
+        data = json.load(f)
+    stats = {}
+    for city_code, city in data.get("cities", {}).items():
+        if city.get("visits") and city.get("duration_s"):
+            stats[city_code] = [(city["visits"], city["duration_s"] / 60, city.get("created", 0) / city["visits"])]
+    return stats
+
+
+def load_log_stats(path):
+    """
+    Per-city [(1, minutes, new listings)] per visit from a JSON-lines scraper log.
+
+    A visit is a run of consecutive records with the same city_code, ended by
+    the city's "SUMMARY: N new, M duplicates" record (which gives its new
+    listings). Its duration is the time between its first record and that
+    SUMMARY. The end-of-city reports logged after the SUMMARY are ignored until
+    the city changes or a new "Starting scraping process" record begins a
+    back-to-back visit of the same city; visits without a SUMMARY (crashed or
+    interrupted) are not counted.
+    """
+    stats = {}
+    skipped = 0
+    visit = None
+    finished = None  # city whose SUMMARY was the last record seen
+
+    def close(visit):
+        if visit["end"] > visit["start"]:
+            minutes = (visit["end"] - visit["start"]).total_seconds() / 60
+            stats.setdefault(visit["city"], []).append((1, minutes, visit["created"]))
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                ts = datetime.datetime.fromisoformat(record["ts"])
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            city_code = record.get("city_code")
+            if not city_code:
+                continue
+            message = record.get("message", "")
+            if city_code == finished and not VISIT_START_RE.search(message):
+                continue
+            finished = None
+            if visit is None or visit["city"] != city_code:
+                visit = {"city": city_code, "start": ts, "end": ts}
+            visit["end"] = ts
+            match = SUMMARY_COUNTS_RE.search(message)
+            if match:
+                visit["created"] = int(match.group(1))
+                close(visit)
+                visit = None
+                finished = city_code
+
+    if skipped and not stats:
+        print(f"WARNING: {path} has no JSON log records (run the scraper with --log-format json)")
+    return stats
+
+
+def load_history(paths):
+    """Merge per-city history from schedule files and JSON logs into {city: {visits, minutes, created}}"""
+    samples = {}
+    for path in paths:
+        try:
+            if path.endswith(".json"):
+                source = load_schedule_stats(path)
+            else:
+                source = load_log_stats(path)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not read history from {path}: {str(e)}")
+            continue
+        for city_code, rows in source.items():
+            samples.setdefault(city_code, []).extend(rows)
+
+    history = {}
+    for city_code, rows in samples.items():
+        visits = sum(weight for weight, _, _ in rows)
+        history[city_code] = {
+            "visits": visits,
+            "minutes": sum(weight * minutes for weight, minutes, _ in rows) / visits,
+            "created": sum(weight * created for weight, _, created in rows) / visits,
+        }
+    return history
+
+
+def city_loads(cities_list, history):
+    """Attach predicted minutes and new listings per visit to each city; unknown cities get the median"""
+    known = [history[city["city"]] for city in cities_list if city["city"] in history]
+    default_minutes = statistics.median(h["minutes"] for h in known) if known else DEFAULT_VISIT_MINUTES
+    default_created = statistics.median(h["created"] for h in known) if known else 0.0
+    loaded = []
+    for city in cities_list:
+        h = history.get(city["city"])
+        loaded.append(dict(city,
+                           minutes=h["minutes"] if h else default_minutes,
+                           created=h["created"] if h else default_created,
+                           estimated=h is None))
+    return loaded
+
+
+def build_jobs(cities_list, split_above, unit="state"):
+    """Units of placement: whole states, or single cities for states heavier than split_above minutes"""
+    by_state = {}
+    for city in cities_list:
+        by_state.setdefault(city["state"], []).append(city)
+
+    jobs = []
+    for state_name, state_cities in by_state.items():
+        minutes = sum(city["minutes"] for city in state_cities)
+        if unit == "city" or minutes > split_above:
+            jobs.extend({"name": city["city"], "minutes": city["minutes"], "cities": [city]} for city in state_cities)
+        else:
+            jobs.append({"name": state_name, "minutes": minutes, "cities": state_cities})
+    return jobs
+
+
+def lpt_partition(jobs, speeds):
+    """Longest job first onto the VPS that would finish it earliest"""
+    assignment = {vps_id: [] for vps_id in speeds}
+    loads = {vps_id: 0.0 for vps_id in speeds}
+    for job in sorted(jobs, key=lambda job: job["minutes"], reverse=True):
+        vps_id = min(speeds, key=lambda v: ((loads[v] + job["minutes"]) / speeds[v], loads[v]))
+        assignment[vps_id].append(job)
+        loads[vps_id] += job["minutes"]
+    return assignment
+
+
+def improve_partition(assignment, speeds, max_rounds=1000):
+    """Move or swap jobs off the busiest VPS while that shortens its cycle without creating a longer one"""
+    def finish(vps_id):
+        return sum(job["minutes"] for job in assignment[vps_id]) / speeds[vps_id]
+
+    for _ in range(max_rounds):
+        worst = max(assignment, key=finish)
+        worst_finish = finish(worst)
+        improved = False
+        for job in sorted(assignment[worst], key=lambda job: job["minutes"], reverse=True):
+            for other in assignment:
+                if other == worst:
+                    continue
+                other_load = finish(other) * speeds[other]
+                if (other_load + job["minutes"]) / speeds[other] < worst_finish - 1e-9:
+                    assignment[worst].remove(job)
+                    assignment[other].append(job)
+                    improved = True
+                    break
+                for smaller in assignment[other]:
+                    delta = job["minutes"] - smaller["minutes"]
+                    if delta > 0 and (other_load + delta) / speeds[other] < worst_finish - 1e-9:
+                        assignment[worst].remove(job)
+                        assignment[other].remove(smaller)
+                        assignment[worst].append(smaller)
+                        assignment[other].append(job)
+                        improved = True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+        if not improved:
+            break
+    return assignment
+
+
+def plan_partition(history_paths, output_dir=PLAN_DIR, unit="state", all_states=False):
+    """Balance cities across enabled VPS instances and write per-VPS CSVs plus a load report"""
+    cities_config = load_cities()
+    vps_config = load_vps_config()
+    enabled = {vps_id: settings for vps_id, settings in vps_config["vps_instances"].items()
+               if settings.get("enabled", True)}
+    if not enabled:
+        print("ERROR: No enabled VPS instances in configuration")
+        sys.exit(1)
+    # Relative throughput of each VPS ("speed" in vps_config.json, default 1)
+    speeds = {vps_id: float(settings.get("speed", 1.0)) for vps_id, settings in enabled.items()}
+
+    states = None if all_states else {state for settings in enabled.values() for state in settings.get("states", [])}
+    history = load_history(history_paths)
+    cities_list = city_loads(all_cities(cities_config, states), history)
+    if not cities_list:
+        print("ERROR: No cities to plan")
+        sys.exit(1)
+
+    total = sum(city["minutes"] for city in cities_list)
+    fair_share = total / sum(speeds.values())
+    jobs = build_jobs(cities_list, split_above=fair_share * max(speeds.values()) / 2, unit=unit)
+    assignment = improve_partition(lpt_partition(jobs, speeds), speeds)
+
+    # The hand-written states lists, for comparison
+    loads_by_city = {city["city"]: city["minutes"] for city in cities_list}
+    current = {vps_id: sum(loads_by_city.get(city["city"], 0.0) for city in all_cities(cities_config, settings.get("states", [])))
+               / speeds[vps_id] for vps_id, settings in enabled.items()}
+
+    report = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "sources": list(history_paths),
+        "unit": unit,
+        "cities": len(cities_list),
+        "cities_with_history": sum(1 for city in cities_list if not city["estimated"]),
+        "lower_bound_minutes": round(max(fair_share, max(job["minutes"] / max(speeds.values()) for job in jobs)), 1),
+        "current_makespan_minutes": round(max(current.values()), 1),
+        "assignments": {},
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    for vps_id, vps_jobs in assignment.items():
+        planned = sorted((city for job in vps_jobs for city in job["cities"]),
+                         key=lambda city: city["minutes"], reverse=True)
+        minutes = sum(city["minutes"] for city in planned)
+        states_summary = {}
+        for city in planned:
+            states_summary[city["state"]] = states_summary.get(city["state"], 0) + 1
+        report["assignments"][vps_id] = {
+            "cities": [city["city"] for city in planned],
+            "states": states_summary,
+            "cycle_minutes": round(minutes / speeds[vps_id], 1),
+            "new_per_cycle": round(sum(city["created"] for city in planned), 1),
+            "estimated_cities": sum(1 for city in planned if city["estimated"]),
+            "current_cycle_minutes": round(current[vps_id], 1),
+        }
+        email, password, proxy, threshold = get_vps_account(enabled[vps_id], vps_config)
+        write_input_csv(os.path.join(output_dir, f"input-{vps_id}.csv"), planned, email, password, threshold, proxy)
+    report["makespan_minutes"] = max(a["cycle_minutes"] for a in report["assignments"].values())
+
+    report_path = os.path.join(output_dir, PLAN_REPORT_FILE)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"Balanced plan for {len(enabled)} VPS instances")
+    print(f"{'='*60}\n")
+    print(f"Cities: {report['cities']} ({report['cities_with_history']} with history)")
+    print(f"{'VPS':<10}{'cities':>8}{'states':>8}{'min/cycle':>11}{'new/cycle':>11}{'current':>10}")
+    for vps_id, planned in report["assignments"].items():
+        print(f"{vps_id:<10}{len(planned['cities']):>8}{len(planned['states']):>8}{planned['cycle_minutes']:>11.1f}"
+              f"{planned['new_per_cycle']:>11.1f}{planned['current_cycle_minutes']:>10.1f}")
+    print(f"\nMakespan: {report['makespan_minutes']:.1f} min (lower bound {report['lower_bound_minutes']:.1f}, "
+          f"current states lists {report['current_makespan_minutes']:.1f})")
+    print(f"SUCCESS: Wrote {len(enabled)} input CSVs and {report_path}")
+    print(f"Apply on each VPS with: python generate_input.py --vps-id <vps-id> --from-plan {report_path}")
+
+
 def list_vps_configs():
     """List all available VPS configurations"""
     vps_config = load_vps_config()
@@ -189,6 +488,9 @@ def main():
 Examples:
     python generate_input.py --vps-id vps-1     Generate input.csv for VPS 1
     python generate_input.py --list             List all VPS configurations
+    python generate_input.py --plan --stats state/city_schedule.json scraper.log
+                                                Balanced per-VPS CSVs + load report in plans/
+    python generate_input.py --vps-id vps-1 --from-plan plans/load_report.json
         """
     )
 
@@ -204,15 +506,56 @@ Examples:
         help="List all available VPS configurations"
     )
 
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Balance cities across enabled VPS instances from historical load and write plans/input-<vps>.csv"
+    )
+
+    parser.add_argument(
+        "--stats",
+        nargs="*",
+        default=[],
+        help="History for --plan: city_scheduler state files (.json) and/or JSON-lines scraper logs"
+    )
+
+    parser.add_argument(
+        "--unit",
+        choices=["state", "city"],
+        default="state",
+        help="--plan keeps states whole unless they are too heavy (state), or places every city on its own (city)"
+    )
+
+    parser.add_argument(
+        "--all-states",
+        action="store_true",
+        help="--plan covers every state in cities.json, not just those of enabled VPS instances"
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=PLAN_DIR,
+        help="Directory for the --plan CSVs and load report (default: plans/)"
+    )
+
+    parser.add_argument(
+        "--from-plan",
+        type=str,
+        help="With --vps-id: take the cities from a --plan load report instead of the states lists"
+    )
+
     args = parser.parse_args()
 
     if args.list:
         list_vps_configs()
+    elif args.plan:
+        plan_partition(args.stats, output_dir=args.output_dir, unit=args.unit, all_states=args.all_states)
     elif args.vps_id:
-        generate_input_csv(args.vps_id)
+        generate_input_csv(args.vps_id, plan_file=args.from_plan)
     else:
         parser.print_help()
-        print("\nERROR: Please specify --vps-id or --list")
+        print("\nERROR: Please specify --vps-id, --plan or --list")
         sys.exit(1)
 
 
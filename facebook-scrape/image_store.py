@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Listing Image Store
+
+Listing photos are downloaded through one pooled keep-alive session on a small
+thread pool, concurrently and off the browser thread. Each file is stored once
+under the SHA-256 of its bytes with the extension of its real format:
+
+    images/objects/3f/3f9a...e1.jpg
+
+Two levels of deduplication:
+- URL: scontent URLs carry expiring oe=/oh= signature tokens, so the same
+  photo shows up under a different URL on every page load. The canonical URL
+  (tokens stripped) is remembered with the hash it resolved to, and a known
+  image is not fetched again. The original URL is still what gets fetched -
+  the CDN rejects unsigned requests.
+- Content: sellers reuse the same photo across listings; identical bytes
+  resolve to the existing object instead of a second copy.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGE_ROOT = os.path.join(SCRIPT_DIR, "images")
+
+# Expiring signature parameters of Facebook CDN URLs
+VOLATILE_PARAMS = {"oe", "oh"}
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/heic": ".heic",
+}
+
+
+def canonical_image_url(url: str) -> str:
+    """URL without the expiring oe=/oh= tokens on scontent/fbcdn hosts; other URLs unchanged"""
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if "scontent" not in host and "fbcdn" not in host:
+        return url
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in VOLATILE_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def image_extension(content: bytes, content_type: Optional[str] = None) -> str:
+    """File extension from the magic bytes, falling back to the Content-Type header"""
+    if content.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if content.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return ".webp"
+    if content[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if content[4:12] in (b"ftypheic", b"ftypmif1"):
+        return ".heic"
+    if content_type:
+        return CONTENT_TYPE_EXTENSIONS.get(content_type.split(";")[0].strip().lower(), ".bin")
+    return ".bin"
+
+
+class ImageStore:
+    """Concurrent, deduplicating image downloader backed by a content-addressed directory"""
+
+    def __init__(self, root: str = DEFAULT_IMAGE_ROOT, workers: int = 6, timeout: float = 10,
+                 save_every: int = 50, log=print):
+        """
+        Args:
+            root: Directory holding objects/ and the URL index
+            workers: Concurrent downloads (also the keep-alive pool size)
+            timeout: Per-request timeout in seconds
+            save_every: Persist the URL index after this many new entries
+            log: Logging callable
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "url_index.json")
+        self.timeout = timeout
+        self.save_every = save_every
+        self.log = log
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-fetch")
+
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, threading.Event] = {}
+        self.url_index: Dict[str, str] = self._load_index()
+        self.unsaved = 0
+        self.stats = {"fetched": 0, "url_hits": 0, "content_dupes": 0, "failed": 0, "bytes": 0}
+
+    def _load_index(self) -> Dict[str, str]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"WARNING: Could not read image index from {self.index_path}: {str(e)}")
+            return {}
+
+    def save(self):
+        """Write the canonical URL -> object index atomically"""
+        with self.lock:
+            data = dict(self.url_index)
+            self.unsaved = 0
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            self.log(f"WARNING: Could not save image index: {str(e)}")
+
+    def object_path(self, name: str) -> str:
+        return os.path.join(self.objects_dir, name[:2], name)
+
+    def fetch(self, publication_id, urls: List[str]) -> List[str]:
+        """
+        Download a listing's images concurrently.
+
+        Returns:
+            Object names ("<sha256>.<ext>") in the order of urls, skipping failures
+        """
+        futures = [self.executor.submit(self._fetch_one, publication_id, url) for url in urls]
+        names = [future.result() for future in futures]
+        return [name for name in names if name]
+
+    def _fetch_one(self, publication_id, url: str) -> Optional[str]:
+        canonical = canonical_image_url(url)
+
+        # Another listing may be fetching the same photo right now - wait for it instead of fetching twice
+        while True:
+            with self.lock:
+                name = self.url_index.get(canonical)
+                if name and os.path.exists(self.object_path(name)):
+                    self.stats["url_hits"] += 1
+                    return name
+                pending = self.in_flight.get(canonical)
+                if pending is None:
+                    self.in_flight[canonical] = threading.Event()
+                    break
+            pending.wait(self.timeout * 2)
+
+        try:
+            return self._download(publication_id, url, canonical)
+        finally:
+            with self.lock:
+                self.in_flight.pop(canonical).set()
+
+    def _download(self, publication_id, url: str, canonical: str) -> Optional[str]:
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                raise requests.HTTPError(f"HTTP {response.status_code}")
+            content = response.content
+        except requests.RequestException as e:
+            with self.lock:
+                self.stats["failed"] += 1
+            self.log(f"WARNING: Failed to download image for {publication_id}: {str(e)}")
+            return None
+
+        name = hashlib.sha256(content).hexdigest() + image_extension(content, response.headers.get("Content-Type"))
+        path = self.object_path(name)
+        if os.path.exists(path):
+            duplicate = True
+        else:
+            duplicate = False
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                # Disk full, permissions... - the image is lost, never the listing
+                with self.lock:
+                    self.stats["failed"] += 1
+                self.log(f"WARNING: Could not store image for {publication_id}: {str(e)}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return None
+
+        with self.lock:
+            self.url_index[canonical] = name
+            self.unsaved += 1
+            self.stats["content_dupes" if duplicate else "fetched"] += 1
+            self.stats["bytes"] += len(content)
+            save_due = self.unsaved >= self.save_every
+        if save_due:
+            self.save()
+        return name
+
+    def summary(self) -> str:
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"Images: {stats['fetched']} stored, {stats['url_hits']} known URLs skipped, "
+                f"{stats['content_dupes']} duplicate photos, {stats['failed']} failed, "
+                f"{stats['bytes'] / (1024 * 1024):.1f} MB downloaded")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.save()
+        self.session.close()
@@ -1,4 +1,3 @@
-from bs4 import BeautifulSoup
 from seleniumbase import Driver
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -29,6 +28,30 @@ import shutil
 import argparse
 import threading
 
+from firestore_sink import FirestoreSink, CREATED, DUPLICATE, FAILED
+from seen_index import SeenIndex
+from crawl_watermark import CrawlWatermarks
+from checkpoint_store import CheckpointStore
+from city_scheduler import CityScheduler
+from browser_lifecycle import BrowserLifecycle, WarmSpare
+from driver_metrics import CommandBudget, CommandCounter
+from link_harvester import LinkHarvester, ANCHOR_COUNT_SCRIPT
+from listing_extractor import (SELLER_XPATHS, body_text, click_seller, expand_description, extract_listing,
+                               seller_xpath_union)
+from seller_cache import SellerCache
+from near_dup import NearDupIndex
+from vehicle_parser import parse_publication
+from make_matcher import MakeMatcher
+from text_segmenter import TrimReport, trim_dealership_text, trim_publication_text, utf8_size
+from sprite_extractor import (MILEAGE, FUEL_TYPE_AND_TRANSMISSION, INTERIOR_EXTERIOR_COLOR, CONSUMPTION, DEBT, TITLE,
+                              OWNERS, PAID_OFF, CLEAN_TITLE, extract_attributes, save_snapshot, sprite_positions)
+from pipeline import ScrapePipeline
+from image_store import ImageStore
+from publication_spool import PublicationSpool, SpoolReplayer
+from scraper_logging import configure_logging, get_logger
+from wait_policy import (WaitPolicy, all_of, document_ready, element_gone, element_present, network_idle,
+                         script_value_above, url_changed)
+
 
 VEHICLE_MAKES = [
     "acura", "alfa romeo", "aston martin", "audi", "bentley", "bmw", "buick", "cadillac", 
@@ -40,23 +63,20 @@ VEHICLE_MAKES = [
     "aprilia", "arctic cat", "can-am", "ducati", "harley-davidson", "honda motorcycles", 
     "indian", "kawasaki", "ktm", "polaris", "royal enfield", "suzuki motorcycles", 
     "triumph", "vespa", "yamaha", "freightliner", "hino", "international", "kenworth", 
-    "mack", "peterbilt", "volvo trucks", "western star", "freightliner", "isuzu"
+    "mack", "peterbilt", "volvo trucks", "western star", "isuzu"
 ]
 
+# One automaton for make/year/model detection in titles and card texts
+MAKE_MATCHER = MakeMatcher(VEHICLE_MAKES)
+
 PRODUCT_TITLE_XPATH = '//div[@aria-hidden="false"]/h1'
 PRODUCT_PRICE_XPATH = '//div[@aria-hidden="false"]/span'
 PRODUCT_DESCRIPTION_XPATH = '//div[@aria-hidden="false"]/span'
 PRODUCT_IMAGE_XPATH = "//img[contains(@alt, 'Product photo of')]"
 
-MILEAGE = "background-position: -21px -63px;"
-FUEL_TYPE_AND_TRANSMISSION = "background-position: -42px -63px;"
-INTERIOR_EXTERIOR_COLOR = "background-position: -84px -21px;"
-CONSUMPTION = "background-position: -84px -63px;"
-DEBT = "background-position: -84px -63px;"
-TITLE = "background-position: -84px -105px;"
-OWNERS = 'background-position: -21px -181px;'
-PAID_OFF = 'background-position: 0px 0px;'
-CLEAN_TITLE = 'background-position: -63px -105px;'
+# Attribute name -> normalized sprite background-position, passed to the extraction script
+SPRITE_POSITIONS = sprite_positions()
+
 
 abs_path = os.path.abspath(__file__)
 dir_path = os.path.dirname(abs_path)
@@ -159,248 +179,413 @@ def test_proxy(proxy_string):
         return False
 
 
+def firestore_client(log=print):
+    """Firestore client from the first available credentials, or None (the error is logged)"""
+    try:
+        # Check if Firebase app is already initialized
+        if not firebase_admin._apps:
+            # Try environment variables first (like API routes)
+            project_id = os.environ.get('FIREBASE_PROJECT_ID') or os.environ.get('NEXT_PUBLIC_FIREBASE_PROJECT_ID')
+            client_email = os.environ.get('FIREBASE_CLIENT_EMAIL')
+            private_key = os.environ.get('FIREBASE_PRIVATE_KEY')
+
+            if project_id and client_email and private_key:
+                # Use individual env vars
+                cred = credentials.Certificate({
+                    "type": "service_account",
+                    "project_id": project_id.strip(),
+                    "client_email": client_email.strip(),
+                    "private_key": private_key.replace('\\n', '\n'),
+                    "token_uri": "https://oauth2.googleapis.com/token",
+                })
+            elif os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
+                cred = credentials.ApplicationDefault()
+            elif os.path.exists("serviceAccountKey.json"):
+                # Use service account key file as fallback
+                cred = credentials.Certificate("serviceAccountKey.json")
+            else:
+                raise Exception("No Firebase credentials found. Set FIREBASE_PROJECT_ID, FIREBASE_CLIENT_EMAIL, and FIREBASE_PRIVATE_KEY env vars.")
+
+            firebase_admin.initialize_app(cred)
+
+        return firestore.client()
+
+    except Exception as e:
+        log(f"ERROR: Failed to initialize Firestore: {str(e)}")
+        return None
+
+
 class fbm_scraper():
-    def scrap_link(self, link):
-        """Simple scraping method that gets publication and profile data"""
+    def scrap_link(self, link, enrich=True):
+        """
+        Scrape a listing in a single visit.
+
+        Runs as a small state machine: load -> expand -> capture -> profile -> finalize.
+        Body text, image URLs and the seller link are all captured on the first load of
+        the listing, then the seller profile is visited once; the listing is never reloaded.
+        Per-step timings (ms) and the number of WebDriver commands are recorded on the
+        returned publication; listings above the command budget are logged.
+        """
         publication_id = link.split("/")[5]
-        
+        visit = {
+            "link": link,
+            "publication_id": publication_id,
+            "publication_text": "",
+            "dealership_text": "",
+            "image_urls": [],
+            "profile_element": None,
+            "seller_found": False,
+            "seller_link": None,
+            "attributes": {},
+            "seller_cache_hit": False,
+            "near_duplicate": None,
+            "profile_navigation_success": False,
+            "enrich": enrich,
+            "timings": {},
+        }
+        steps = {
+            "load": self._visit_load,
+            "expand": self._visit_expand,
+            "capture": self._visit_capture,
+            "profile": self._visit_profile,
+            "finalize": self._visit_finalize,
+        }
+
+        commands_before = self.command_counter.mark()
         try:
-            self.browser.get(link)
-            time.sleep(3)
-            
-            # Store original URL for comparison
-            original_url = self.browser.current_url
-            
-            # Get the full publication page text
-# --- PART A: Click the first "See more" if present (optional) ---
+            step = "load"
+            while step:
+                step_start = time.time()
+                next_step = steps[step](visit)
+                visit["timings"][f"{step}_ms"] = int((time.time() - step_start) * 1000)
+                step = next_step
+
+            commands = self.command_counter.since(commands_before)
+            visit["data"]["webdriverCommands"] = commands
+            if not self.command_budget.record(commands):
+                self.print_and_log(f"WARNING: Publication {publication_id} took {commands} WebDriver commands "
+                                   f"(budget {self.command_budget.budget})", publication_id=publication_id)
+            self.print_and_log(f"INFO: Successfully processed publication {publication_id}",
+                               publication_id=publication_id, stage="scrap_link",
+                               duration_ms=sum(visit["timings"].values()), webdriver_commands=commands,
+                               text_bytes_before=visit["text_bytes"][0], text_bytes_after=visit["text_bytes"][1])
+            return visit["data"]
 
+        except Exception as e:
+            self.print_and_log(f"ERROR: Critical error scraping {publication_id}: {str(e)}",
+                               publication_id=publication_id, stage=step)
+            # The capture step may already have indexed the listing for near-dup matching
+            if self.near_dup:
+                self.near_dup.discard(publication_id)
+            return None
+
+    def _visit_load(self, visit):
+        """Load the listing page"""
+        load_start = time.time()
+        self.browser.get(visit["link"])
+        self.waits.wait("listing_load", all_of(document_ready(), element_present(PRODUCT_TITLE_XPATH)), timeout=10)
+        self.lifecycle.record_page_load(time.time() - load_start)
+
+        # Store original URL for comparison (the extraction script returns it in script mode)
+        if self.extract_mode == "legacy":
+            visit["original_url"] = self.browser.current_url
+        return "expand"
+
+    def _visit_expand(self, visit):
+        """Click the first "See more" if present (optional)"""
+        if self.extract_mode == "script":
             try:
-                see_more_xpath = ("//span[normalize-space(.)='See more']/ancestor::div[@role='button'][1] "
-                                "| //span[normalize-space(.)='See more']/ancestor::div[1][@role='button']")
-                see_more_el = None
-                try:
-                    see_more_el = WebDriverWait(self.browser, 3).until(
-                        EC.presence_of_element_located((By.XPATH, see_more_xpath))
-                    )
-                    try:
-                        see_more_el.click()
-                    except Exception:
-                        self.browser.execute_script("arguments[0].click();", see_more_el)
+                if expand_description(self.browser):
                     self.print_and_log("INFO: Clicked 'See more'")
-                except TimeoutException:
-                    pass
             except Exception as e:
                 self.print_and_log(f"WARNING: Unexpected error clicking 'See more': {str(e)}")
-            # --- PART A end ---
+            return "capture"
+
+        try:
+            see_more_xpath = ("//span[normalize-space(.)='See more']/ancestor::div[@role='button'][1] "
+                            "| //span[normalize-space(.)='See more']/ancestor::div[1][@role='button']")
+            # The title is already rendered, so "See more" is either there now or not at all
+            see_more_els = self.browser.find_elements(By.XPATH, see_more_xpath)
+            if see_more_els:
+                see_more_el = see_more_els[0]
+                try:
+                    see_more_el.click()
+                except Exception:
+                    self.browser.execute_script("arguments[0].click();", see_more_el)
+                self.print_and_log("INFO: Clicked 'See more'")
+        except Exception as e:
+            self.print_and_log(f"WARNING: Unexpected error clicking 'See more': {str(e)}")
+        return "capture"
+
+    def _visit_capture(self, visit):
+        """Capture body text, image URLs and the seller link while still on the listing"""
+        publication_id = visit["publication_id"]
+        if self.extract_mode == "script":
+            self._capture_with_script(visit)
+        else:
+            self._capture_with_elements(visit)
 
+        # One page_source round trip; attribute rows are parsed from it off the browser thread
+        if self.snapshot_html:
             try:
-                publication_text = self.browser.find_element(By.TAG_NAME, "body").text
-                self.print_and_log(f"INFO: Captured {len(publication_text)} characters from publication page")
+                visit["page_source"] = self.browser.page_source
             except Exception as e:
-                self.print_and_log(f"WARNING: Could not capture publication text for {publication_id}: {str(e)}")
-                publication_text = ""
-            
-            # Navigate to seller profile and get text
-            dealership_text = ""
-            profile_navigation_success = False
-            
-            try:
-                # Try to find and click profile link
-                profile_element = None
-                profile_xpaths = [
-                    "//a[contains(@href, '/marketplace/profile')]",
-                    "//a[contains(@href, '/profile.php')]",
-                    "//a[contains(@href, '/user/')]",
-                    "//a[contains(@aria-label, 'profile')]",
-                    "//span[contains(text(), 'Seller information')]/following::a[1]"
-                ]
-                
-                # First try to find profile link without scrolling
-                for xpath in profile_xpaths:
-                    try:
-                        profile_element = self.browser.find_element(By.XPATH, xpath)
-                        if profile_element:
-                            self.print_and_log(f"INFO: Found profile element using xpath: {xpath}")
-                            break
-                    except:
-                        continue
-                
-                # If not found, scroll down and try again
-                if not profile_element:
+                self.print_and_log(f"WARNING: Could not snapshot page source for {publication_id}: {str(e)}")
+
+        if self.near_dup:
+            self._check_near_duplicate(visit)
+
+        if not visit["seller_found"]:
+            self.print_and_log(f"WARNING: Could not find profile link for {publication_id}")
+            return "finalize"
+
+        # Known seller - reuse the cached dealership text instead of opening the profile
+        cached_text = self.seller_cache.get(visit["seller_link"])
+        if cached_text is not None:
+            visit["dealership_text"] = cached_text
+            visit["seller_cache_hit"] = True
+            visit["profile_navigation_success"] = True
+            self.print_and_log(f"INFO: Seller cache hit for {publication_id}, skipping profile navigation")
+            return "finalize"
+        if visit["near_duplicate"]:
+            self.print_and_log(f"INFO: Skipping profile navigation for repost {publication_id}")
+            return "finalize"
+        return "profile"
+
+    def _check_near_duplicate(self, visit):
+        """Compare the captured title, price and description against the near-duplicate index"""
+        publication_id = visit["publication_id"]
+        try:
+            fields = parse_publication(visit["publication_text"])
+            title = fields["product_title"] or visit["attributes"].get("title")
+            match = self.near_dup.check(publication_id, title, fields["product_price"],
+                                        fields["publication_description"], city=self.city_code)
+        except Exception as e:
+            self.print_and_log(f"WARNING: Near-duplicate check failed for {publication_id}: {str(e)}")
+            return
+        if match:
+            visit["near_duplicate"] = match
+            self.print_and_log(f"INFO: Publication {publication_id} is a repost of {match['doc_id']} "
+                               f"({match['city'] or 'unknown city'}, similarity {match['similarity']:.2f})",
+                               publication_id=publication_id, near_duplicate_of=match["doc_id"])
+
+    def _capture_with_script(self, visit):
+        """One extraction script call per attempt; scrolls page-side while the seller section is not loaded"""
+        publication_id = visit["publication_id"]
+        try:
+            result = extract_listing(self.browser, PRODUCT_IMAGE_XPATH, PRODUCT_TITLE_XPATH,
+                                     SPRITE_POSITIONS, scroll_by=500)
+            for scroll_attempt in range(3):
+                if result.get("sellerFound"):
+                    break
+                if scroll_attempt == 0:
                     self.print_and_log(f"INFO: Profile link not visible, scrolling down to find it...")
-                    # Scroll down in increments to find profile link
-                    for scroll_attempt in range(3):
-                        self.browser.execute_script("window.scrollBy(0, 500);")
-                        time.sleep(1)
-                        
-                        for xpath in profile_xpaths:
-                            try:
-                                profile_element = self.browser.find_element(By.XPATH, xpath)
-                                if profile_element:
-                                    self.print_and_log(f"INFO: Found profile element after scrolling using xpath: {xpath}")
-                                    break
-                            except:
-                                continue
-                        
-                        if profile_element:
-                            break
-                
-                if profile_element:
-                    # Click the profile link
-                    self.print_and_log(f"INFO: Clicking profile link for {publication_id}")
-                    self.browser.execute_script("arguments[0].click();", profile_element)
-                    
-                    # Wait for navigation
-                    max_wait_attempts = 10
-                    for attempt in range(max_wait_attempts):
-                        time.sleep(1)
-                        current_url = self.browser.current_url
-                        
-                        # Check if we successfully navigated to profile
-                        profile_indicators = [
-                            "/marketplace/profile/",
-                            "/profile.php",
-                            "/user/",
-                            "profile_id=",
-                            "id=" in current_url and current_url != original_url
-                        ]
-                        
-                        if any(indicator in current_url or indicator for indicator in profile_indicators):
-                            profile_navigation_success = True
-                            self.print_and_log(f"SUCCESS: Navigated to profile page: {current_url}")
-                            break
-                        elif attempt == max_wait_attempts - 1:
-                            self.print_and_log(f"WARNING: Failed to navigate to profile after {max_wait_attempts} attempts")
-                            break
-                    
-                    if profile_navigation_success:
-                        # Additional wait for profile page to fully load
-                        time.sleep(2)
-                        
-                        # Get the full profile page text
-                        try:
-                            dealership_text = self.browser.find_element(By.TAG_NAME, "body").text
-                            self.print_and_log(f"SUCCESS: Captured {len(dealership_text)} characters from profile page")
-                            
-                        except Exception as e:
-                            self.print_and_log(f"ERROR: Could not capture profile text: {str(e)}")
-                            dealership_text = ""
-                            profile_navigation_success = False
-                    
-                else:
-                    self.print_and_log(f"WARNING: Could not find profile link for {publication_id}")
-                    
-            except Exception as e:
-                self.print_and_log(f"ERROR: Error accessing profile for {publication_id}: {str(e)}")
-            word = "Today's picks"
-            index = publication_text.find(word)
-            if index != -1:
-                publication_text = publication_text[:index]
-           
-           
-            word = "buy and sell groups"
-            index = publication_text.find(word)
-
-            if index != -1:
-                # Keep only the part AFTER the word
-                publication_text = publication_text[index + len(word):].strip()
-            
-            word = "Joined Facebook"
-            index = dealership_text.rfind(word) # Changed from .find() to .rfind()
+                self.waits.wait("profile_link_scroll", element_present(seller_xpath_union()), timeout=1)
+                result = extract_listing(self.browser, PRODUCT_IMAGE_XPATH, PRODUCT_TITLE_XPATH,
+                                         SPRITE_POSITIONS, scroll_by=500 if scroll_attempt < 2 else 0)
+        except Exception as e:
+            self.print_and_log(f"ERROR: Extraction script failed for {publication_id}: {str(e)}")
+            return
+
+        visit["original_url"] = result.get("url")
+        visit["publication_text"] = result["text"]
+        visit["image_urls"] = result["images"]
+        visit["attributes"] = dict(result["attributes"])
+        if result.get("title"):
+            visit["attributes"]["title"] = result["title"]
+        visit["seller_found"] = bool(result.get("sellerFound"))
+        visit["seller_link"] = result.get("sellerLink")
+        self.print_and_log(f"INFO: Captured {len(visit['publication_text'])} characters from publication page")
+
+    def _capture_with_elements(self, visit):
+        """Legacy capture through element handles (one round trip per lookup and attribute)"""
+        publication_id = visit["publication_id"]
+        try:
+            visit["publication_text"] = self.browser.find_element(By.TAG_NAME, "body").text
+            self.print_and_log(f"INFO: Captured {len(visit['publication_text'])} characters from publication page")
+        except Exception as e:
+            self.print_and_log(f"WARNING: Could not capture publication text for {publication_id}: {str(e)}")
 
-            if index != -1:
-                # Keep only the part AFTER the last occurrence of the word
-                dealership_text = dealership_text[index + len(word):].strip()
-                    
-            # Create data structure
-            data = {
-                "publication_id": int(publication_id),
-                "publicationText": publication_text,
-                "dealershipBody": dealership_text,
-                "profileNavigationSuccess": profile_navigation_success,
-                "images": [],
-                "scraped_at": firestore.SERVER_TIMESTAMP,
-                "city_code": self.city_code,
-                "userId": "r1LfHSvzLZUkLVbrQGov1BAPvh02",
-                "publication_link": f"https://www.facebook.com/marketplace/item/{publication_id}/"
-            }
-            
-            # Scrape images if profile navigation was successful
-            if profile_navigation_success:
+        # Images are read now, so the listing never has to be loaded a second time
+        try:
+            visit["image_urls"] = self.scrap_images(publication_id)
+        except Exception as e:
+            self.print_and_log(f"WARNING: Error scraping images for {publication_id}: {str(e)}")
+
+        try:
+            profile_element = self.find_profile_element()
+            if profile_element:
+                visit["profile_element"] = profile_element
+                visit["seller_found"] = True
                 try:
-                    # Navigate back to publication page for image scraping
-                    self.browser.get(link)
-                    time.sleep(2)
-                    image_urls = self.scrap_images(publication_id, download_images=self.download_images)
-                    data["images"] = image_urls
-                except Exception as e:
-                    self.print_and_log(f"WARNING: Error scraping images for {publication_id}: {str(e)}")
-            
-            self.print_and_log(f"INFO: Successfully processed publication {publication_id}")
-            return data
-            
+                    visit["seller_link"] = profile_element.get_attribute("href")
+                except Exception:
+                    pass
         except Exception as e:
-            self.print_and_log(f"ERROR: Critical error scraping {publication_id}: {str(e)}")
-            return None
+            self.print_and_log(f"ERROR: Error accessing profile for {publication_id}: {str(e)}")
 
-    def upload_to_firestore(self, product_id, publication):
-        """Upload text data and images to Firestore with deduplication check"""
-        if not self.db:
-            self.print_and_log("ERROR: Firestore not initialized")
-            return False
+    def find_profile_element(self):
+        """Find the seller profile link, scrolling down if it is not visible yet"""
+        profile_xpaths = SELLER_XPATHS
 
-        try:
-            # Convert product_id to string if it's not already
-            doc_id = str(product_id)
+        def try_xpaths(context):
+            for xpath in profile_xpaths:
+                try:
+                    element = self.browser.find_element(By.XPATH, xpath)
+                    if element:
+                        self.print_and_log(f"INFO: Found profile element {context}using xpath: {xpath}")
+                        return element
+                except:
+                    continue
+            return None
 
-            # Check if document already exists (deduplication)
-            doc_ref = self.db.collection('vehicles_initial').document(doc_id)
-            existing_doc = doc_ref.get()
+        # First try to find profile link without scrolling
+        profile_element = try_xpaths("")
+        if profile_element:
+            return profile_element
+
+        # If not found, scroll down in increments and try again
+        self.print_and_log(f"INFO: Profile link not visible, scrolling down to find it...")
+        for scroll_attempt in range(3):
+            self.browser.execute_script("window.scrollBy(0, 500);")
+            self.waits.wait("profile_link_scroll", element_present(" | ".join(profile_xpaths)), timeout=1)
+            profile_element = try_xpaths("after scrolling ")
+            if profile_element:
+                return profile_element
+        return None
+
+    def _visit_profile(self, visit):
+        """Open the seller profile once and capture its text"""
+        publication_id = visit["publication_id"]
+        try:
+            # Click the profile link
+            self.print_and_log(f"INFO: Clicking profile link for {publication_id}")
+            if self.extract_mode == "script":
+                if not click_seller(self.browser):
+                    self.print_and_log(f"WARNING: Profile link for {publication_id} is no longer on the page")
+                    return "finalize"
+            else:
+                self.browser.execute_script("arguments[0].click();", visit["profile_element"])
 
-            if existing_doc.exists:
-                self.print_and_log(f"SKIP: Publication {doc_id} already exists in Firestore, skipping duplicate")
-                return True  # Return True since this isn't an error, just a skip
+            # Wait for navigation away from the listing
+            if self.waits.wait("profile_navigation", url_changed(visit["original_url"]), timeout=10):
+                visit["profile_navigation_success"] = True
+                self.print_and_log(f"SUCCESS: Navigated to profile page: {self.browser.current_url}")
+            else:
+                self.print_and_log(f"WARNING: Failed to navigate to profile within 10 seconds")
 
-            # Upload to Firestore vehicles_initial collection
-            doc_ref.set(publication)
+            if visit["profile_navigation_success"]:
+                # Wait for the profile page to finish loading
+                self.waits.wait("profile_load", all_of(document_ready(), network_idle()), timeout=5)
 
-            image_count = len(publication.get('images', []))
-            self.print_and_log(f"SUCCESS: Uploaded text data and {image_count} images for publication {doc_id} to Firestore")
-            return True
+                # Get the full profile page text
+                try:
+                    if self.extract_mode == "script":
+                        visit["dealership_text"] = body_text(self.browser)
+                    else:
+                        visit["dealership_text"] = self.browser.find_element(By.TAG_NAME, "body").text
+                    self.print_and_log(f"SUCCESS: Captured {len(visit['dealership_text'])} characters from profile page")
+                except Exception as e:
+                    self.print_and_log(f"ERROR: Could not capture profile text: {str(e)}")
+                    visit["dealership_text"] = ""
+                    visit["profile_navigation_success"] = False
 
         except Exception as e:
-            self.print_and_log(f"ERROR: Failed to upload to Firestore: {str(e)}")
-            return False
-
-    def scrap_images(self, publication_id, download_images=False):
-        """Scrape images with error handling"""
+            self.print_and_log(f"ERROR: Error accessing profile for {publication_id}: {str(e)}")
+        return "finalize"
+
+    def _visit_finalize(self, visit):
+        """Trim captured text and build the publication document"""
+        publication_id = visit["publication_id"]
+
+        # Keep only the listing/seller regions; cached dealership text is already trimmed (no-op)
+        publication_text = trim_publication_text(visit["publication_text"])
+        dealership_text = trim_dealership_text(visit["dealership_text"])
+        before = utf8_size(visit["publication_text"]) + utf8_size(visit["dealership_text"])
+        after = utf8_size(publication_text) + utf8_size(dealership_text)
+        self.trim_report.record(publication_id, before, after)
+        visit["text_bytes"] = (before, after)
+
+        if visit["profile_navigation_success"] and not visit["seller_cache_hit"]:
+            self.seller_cache.put(visit["seller_link"], dealership_text)
+
+        # Create data structure
+        visit["data"] = {
+            "publication_id": int(publication_id),
+            "publicationText": publication_text,
+            "dealershipBody": dealership_text,
+            "profileNavigationSuccess": visit["profile_navigation_success"],
+            "sellerLink": visit["seller_link"],
+            "sellerCacheHit": visit["seller_cache_hit"],
+            "images": visit["image_urls"],
+            "listingAttributes": visit["attributes"],
+            "scraped_at": firestore.SERVER_TIMESTAMP,
+            "city_code": self.city_code,
+            "userId": "r1LfHSvzLZUkLVbrQGov1BAPvh02",
+            "publication_link": f"https://www.facebook.com/marketplace/item/{publication_id}/",
+            "timings": visit["timings"],
+        }
+        if visit["near_duplicate"]:
+            visit["data"]["nearDuplicateOf"] = int(visit["near_duplicate"]["doc_id"])
+            visit["data"]["nearDuplicateSimilarity"] = visit["near_duplicate"]["similarity"]
+        if visit.get("page_source"):
+            # Consumed (and removed) by enrich_publication before the publication is stored
+            visit["data"]["_page_source"] = visit["page_source"]
+
+        if visit["enrich"]:
+            self.enrich_publication(visit["data"])
+        return None
+
+    def enrich_publication(self, publication):
+        """Add structured vehicle fields (product_title, product_price, vehicle_info, make, ...) and snapshot attribute rows - pipeline parse stage"""
+        publication_id = str(publication["publication_id"])
+        page_source = publication.pop("_page_source", None)
+        if page_source:
+            try:
+                attributes = extract_attributes(page_source)
+                publication["listingAttributes"] = {**attributes, **(publication.get("listingAttributes") or {})}
+                save_snapshot(publication_id, page_source)
+            except Exception as e:
+                self.print_and_log(f"WARNING: Could not extract attributes from snapshot of {publication_id}: {str(e)}")
+        try:
+            publication.update(parse_publication(publication["publicationText"]))
+            match = MAKE_MATCHER.match(publication.get("product_title") or self.link_texts.get(publication_id, ""))
+            publication["make"] = match["make"]
+            publication["model"] = match["model"]
+            publication["year"] = match["year"]
+        except Exception as e:
+            self.print_and_log(f"WARNING: Could not parse vehicle fields for {publication_id}: {str(e)}")
+        return publication
+
+    def store_publication(self, publication):
+        """Buffer a publication in the sink and download its images - pipeline I/O stage"""
+        publication_id = publication["publication_id"]
+        if self.near_dup_action == "skip" and publication.get("nearDuplicateOf"):
+            # Repost of a stored listing - resolved like a duplicate, nothing is uploaded or downloaded
+            self.checkpoint.mark_processed(publication.get("city_code", self.city_code), publication_id)
+            self.sink.skip(publication_id, publication)
+            return
+        # Spool first: once captured, a publication survives a crash or failure in image I/O
+        self.spool.put(publication_id, publication)
+        self.checkpoint.mark_processed(publication.get("city_code", self.city_code), publication_id)
+        if self.image_store and publication.get("images"):
+            publication["imageFiles"] = self.image_store.fetch(publication_id, publication["images"])
+            self.spool.put(publication_id, publication)
+        self.sink.add(publication_id, publication)
+
+    def scrap_images(self, publication_id):
+        """Scrape image URLs with error handling (downloading is left to the pipeline I/O stage)"""
         try:
             image_elements = self.browser.find_elements(By.XPATH, PRODUCT_IMAGE_XPATH)
-            if not os.path.exists(f"{dir_path}/images/{publication_id}"):
-                os.makedirs(f"{dir_path}/images/{publication_id}")
-        
-            image_counts = 0
+
             image_urls = []
             for image_element in image_elements:
                 try:
                     image_url = image_element.get_attribute("src")
                     if "https://scontent" in image_url:
-                        if image_counts >= 3:
+                        if len(image_urls) >= 3:
                             break
-                        
-                        if download_images:
-                            try:
-                                r = requests.get(image_url, stream=True, timeout=10)
-                                if r.status_code == 200:
-                                    with open(f"{dir_path}/images/{publication_id}/{publication_id}_{image_counts}.png", 'wb') as f:
-                                        for chunk in r:
-                                            f.write(chunk)
-                            except Exception as img_error:
-                                self.print_and_log(f"WARNING: Failed to download image {image_counts} for {publication_id}: {str(img_error)}")
-                                continue
-
                         image_urls.append(image_url)
-                        image_counts += 1
                 except Exception as e:
                     self.print_and_log(f"WARNING: Error processing image element for {publication_id}: {str(e)}")
                     continue
@@ -425,7 +610,7 @@ class fbm_scraper():
                 activity = random.choice(activities)
                 self.print_and_log(f"INFO: Performing random activity: {activity.__name__}")
                 activity()
-                time.sleep(random.randint(30, 90))  # Random delay between activities
+                self.waits.pause("break_activity", random.randint(30, 90))  # Random delay between activities
                 
         except Exception as e:
             self.print_and_log(f"WARNING: Error during random activity: {str(e)}")
@@ -434,10 +619,10 @@ class fbm_scraper():
         """Scroll through Facebook newsfeed"""
         try:
             self.browser.get("https://www.facebook.com")
-            time.sleep(3)
+            self.waits.pause("break_activity", 3)
             for _ in range(random.randint(3, 6)):
                 self.browser.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(random.randint(2, 5))
+                self.waits.pause("break_activity", random.randint(2, 5))
         except Exception as e:
             self.print_and_log(f"WARNING: Error scrolling newsfeed: {str(e)}")
 
@@ -445,7 +630,7 @@ class fbm_scraper():
         """Visit own profile page"""
         try:
             self.browser.get("https://www.facebook.com/me")
-            time.sleep(random.randint(3, 7))
+            self.waits.pause("break_activity", random.randint(3, 7))
         except Exception as e:
             self.print_and_log(f"WARNING: Error visiting profile: {str(e)}")
 
@@ -453,7 +638,7 @@ class fbm_scraper():
         """Check notifications"""
         try:
             self.browser.get("https://www.facebook.com/notifications")
-            time.sleep(random.randint(2, 5))
+            self.waits.pause("break_activity", random.randint(2, 5))
         except Exception as e:
             self.print_and_log(f"WARNING: Error checking notifications: {str(e)}")
 
@@ -463,12 +648,12 @@ class fbm_scraper():
             categories = ["electronics", "furniture", "clothing", "books", "home"]
             category = random.choice(categories)
             self.browser.get(f"https://www.facebook.com/marketplace/category/{category}")
-            time.sleep(random.randint(3, 6))
+            self.waits.pause("break_activity", random.randint(3, 6))
             
             # Random scroll on marketplace
             for _ in range(random.randint(2, 4)):
                 self.browser.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(random.randint(1, 3))
+                self.waits.pause("break_activity", random.randint(1, 3))
         except Exception as e:
             self.print_and_log(f"WARNING: Error browsing marketplace: {str(e)}")
 
@@ -479,6 +664,13 @@ class fbm_scraper():
         self.password = password
         self.url_to_scrap = f"https://www.facebook.com/marketplace/{city_code}/vehicles?sortBy=creation_time_descend&exact=true"
         self.links = {}  # Reset links for new account
+        self.link_texts = {}
+        self.feed_head = []
+        self.out_of_scope_skipped = 0
+        self.links_found = 0
+        self.known_links_skipped = 0
+        self.resume_ids = set()
+        self.resumed_links_skipped = 0
         self.successful_scrapes = 0
         self.failed_scrapes = 0
         self.print_and_log(f"INFO: Updated settings for {email} in city {city_code}")
@@ -513,57 +705,24 @@ class fbm_scraper():
         except Exception as e:
             self.print_and_log(f"WARNING: Error during profile cleanup: {str(e)}")
 
-    def print_and_log(self, message):
-        """Print message to console and log to file"""
-        current_time_ts = round(time.time())
-        human_readable_time = datetime.datetime.utcfromtimestamp(current_time_ts).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Print to console
-        print(f"[{human_readable_time}] {message}")
-        
-        # Log to file
-        try:
-            with open("scraper.log", "a", encoding="utf-8") as f:
-                f.write(f"[{human_readable_time}] {message}\n")
-        except Exception as e:
-            print(f"WARNING: Could not write to log file: {str(e)}")
+    def print_and_log(self, message, **fields):
+        """Print message to console and queue it for the log file (written by a background thread)"""
+        fields.setdefault("city_code", getattr(self, "city_code", None))
+        get_logger().log(message, **fields)
     
     def init_firestore(self):
         """Initialize Firestore database connection"""
-        try:
-            # Check if Firebase app is already initialized
-            if not firebase_admin._apps:
-                # Try environment variables first (like API routes)
-                project_id = os.environ.get('FIREBASE_PROJECT_ID') or os.environ.get('NEXT_PUBLIC_FIREBASE_PROJECT_ID')
-                client_email = os.environ.get('FIREBASE_CLIENT_EMAIL')
-                private_key = os.environ.get('FIREBASE_PRIVATE_KEY')
-
-                if project_id and client_email and private_key:
-                    # Use individual env vars
-                    cred = credentials.Certificate({
-                        "type": "service_account",
-                        "project_id": project_id.strip(),
-                        "client_email": client_email.strip(),
-                        "private_key": private_key.replace('\\n', '\n'),
-                        "token_uri": "https://oauth2.googleapis.com/token",
-                    })
-                elif os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
-                    cred = credentials.ApplicationDefault()
-                elif os.path.exists("serviceAccountKey.json"):
-                    # Use service account key file as fallback
-                    cred = credentials.Certificate("serviceAccountKey.json")
-                else:
-                    raise Exception("No Firebase credentials found. Set FIREBASE_PROJECT_ID, FIREBASE_CLIENT_EMAIL, and FIREBASE_PRIVATE_KEY env vars.")
-
-                firebase_admin.initialize_app(cred)
-        
-            # Initialize Firestore client
-            self.db = firestore.client()
+        self.db = firestore_client(log=self.print_and_log)
+        if self.db:
             self.print_and_log("INFO: Firestore initialized successfully.")
-        
-        except Exception as e:
-            self.print_and_log(f"ERROR: Failed to initialize Firestore: {str(e)}")
-            self.db = None
+
+    def reconnect_firestore(self):
+        """Retry Firestore initialization (used by the spool replayer after a failed start)"""
+        if not self.db:
+            self.init_firestore()
+            self.sink.db = self.db
+            self.replay_sink.db = self.db
+        return bool(self.db)
 
     def go_to_marketplace(self, city_code):
         """Navigate directly to marketplace without login"""
@@ -573,7 +732,9 @@ class fbm_scraper():
             # Navigate directly to marketplace URL
             marketplace_url = f"https://www.facebook.com/marketplace/{city_code}/vehicles?sortBy=creation_time_descend&exact=true"
             self.browser.get(marketplace_url)
-            time.sleep(5)  # Wait longer for page to load
+            self.waits.wait("marketplace_load",
+                            all_of(document_ready(), element_present("//a[contains(@href, '/marketplace/item/')]")),
+                            timeout=15)
 
             # Try to close any cookie consent dialogs
             try:
@@ -581,7 +742,7 @@ class fbm_scraper():
                 for btn in cookie_buttons[:2]:  # Click first 2 matching buttons
                     try:
                         btn.click()
-                        time.sleep(1)
+                        self.waits.wait("cookie_dismiss", element_gone(btn), timeout=2)
                     except:
                         pass
             except:
@@ -599,8 +760,7 @@ class fbm_scraper():
         except (InvalidSessionIdException, WebDriverException) as e:
             error_message = str(e)
             if "invalid session id" in error_message.lower():
-                current_time_ts = round(time.time())
-                human_readable_time = datetime.datetime.utcfromtimestamp(current_time_ts).strftime('%Y-%m-%d %H:%M:%S')
+                human_readable_time = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
                 self.print_and_log(f"CRITICAL ERROR: Browser session died at {human_readable_time}")
                 self.print_and_log(f"CRITICAL ERROR: Invalid session ID detected. Browser is dead.")
                 self.print_and_log(f"CRITICAL ERROR: Stopping script now.")
@@ -616,6 +776,10 @@ class fbm_scraper():
         """Execute the main scraping process"""
         try:
             self.print_and_log(f"INFO: Starting scraping process for {self.city_code}")
+
+            # A checkpointed queue for this city means the previous process died mid-city
+            if self.restore_checkpoint():
+                return
             
             # Navigate to marketplace directly (no login required)
             success = self.go_to_marketplace(self.city_code)
@@ -627,16 +791,105 @@ class fbm_scraper():
             self.collect_vehicle_links()
             
             self.print_and_log(f"INFO: Collected {len(self.links)} vehicle links")
+
+            # Drop already-ingested listings before any of them gets a browser visit
+            self.skip_known_links()
+            if self.require_make:
+                self.skip_out_of_scope_links()
+
+            self.checkpoint.save_links(self.city_code, self.links, self.link_texts,
+                                       self.links_found, self.known_links_skipped, self.feed_head)
             
         except Exception as e:
             self.print_and_log(f"ERROR: Failed to execute scraping process: {str(e)}")
+
+    def restore_checkpoint(self):
+        """Resume the link queue of an interrupted run of this city without scrolling again"""
+        restored = self.checkpoint.restore_links(self.city_code)
+        if restored is None:
+            return False
+
+        self.links = restored["links"]
+        self.link_texts.update(restored["link_texts"])
+        self.links_found = restored["links_found"]
+        self.known_links_skipped = restored["known_links_skipped"]
+        self.feed_head = restored["feed_head"]
+        self.print_and_log(f"INFO: Resumed {self.city_code} from checkpoint: {len(self.links)} links left, "
+                           f"{restored['done']} already processed or failed")
+        return True
     
+    def skip_known_links(self):
+        """Remove links processed by an interrupted run of this job, then those already in the seen index"""
+        self.links_found = len(self.links)
+        resumed = [product_id for product_id in self.links if product_id in self.resume_ids]
+        for product_id in resumed:
+            del self.links[product_id]
+        self.resumed_links_skipped = len(resumed)
+        if resumed:
+            self.print_and_log(f"INFO: Resuming job - skipped {len(resumed)} links processed before the interruption")
+
+        known = [product_id for product_id in self.links if product_id in self.seen_index]
+        for product_id in known:
+            del self.links[product_id]
+        self.known_links_skipped = len(known)
+        self.print_and_log(f"INFO: Skipped {len(known)} already-ingested links, {len(self.links)} left to scrape")
+
+    def skip_out_of_scope_links(self):
+        """Remove links whose marketplace card names no known vehicle make"""
+        product_ids = [product_id for product_id in self.links if self.link_texts.get(product_id)]
+        matches = MAKE_MATCHER.match_many(self.link_texts[product_id] for product_id in product_ids)
+        dropped = [product_id for product_id, match in zip(product_ids, matches) if not match["make"]]
+        for product_id in dropped:
+            del self.links[product_id]
+        self.out_of_scope_skipped = len(dropped)
+        self.print_and_log(f"INFO: Skipped {len(dropped)} listings without a known vehicle make, {len(self.links)} left to scrape")
+
+    def complete_city(self, city_code):
+        """The city's queue is done - advance its crawl watermark and drop its checkpoint"""
+        self.watermarks.update(city_code, self.feed_head)
+        self.checkpoint.complete_city(city_code)
+
+    def record_seen(self, doc_id, result, publication):
+        """Sink listener - remember publications confirmed to be in Firestore"""
+        if result in (CREATED, DUPLICATE):
+            self.seen_index.add(doc_id)
+
+    def drop_publication(self, publication):
+        """Pipeline drop callback - a publication that never reaches the sink is not a near-dup candidate"""
+        if self.near_dup:
+            self.near_dup.discard(publication["publication_id"])
+
+    def close(self):
+        """Write what is still buffered, stop the background threads and release the local stores"""
+        if self.closed:
+            return
+        self.closed = True
+        self.pipeline.close(timeout=120)
+        self.sink.flush()
+        steps = [self.spool_replayer.stop, self.replay_sink.close, self.sink.close, self.seen_index.close,
+                 self.lifecycle.close, self.checkpoint.close, self.spool.close]
+        if self.near_dup:
+            steps.append(self.near_dup.close)
+        if self.image_store:
+            steps.append(self.image_store.close)
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                self.print_and_log(f"WARNING: Shutdown step {step.__qualname__} failed: {str(e)}")
+
     def collect_vehicle_links(self):
         """Collect vehicle links from marketplace"""
         try:
             scroll_count = 0
             max_scrolls = 50  # Increased from 10 to get 5x more listings
 
+            # Incremental mode: the feed is newest-first, so a long streak of known IDs
+            # means everything below it was ingested on a previous pass
+            known_ids = self.watermarks.known_ids(self.city_code) if self.incremental_crawl else set()
+            known_run = 0
+            reached_known = False
+
             # Debug: Check page state before scrolling
             page_source = self.browser.page_source
             if "login" in page_source.lower() or "log in" in page_source.lower():
@@ -651,47 +904,153 @@ class fbm_scraper():
             except:
                 pass
 
-            while scroll_count < max_scrolls and len(self.links) < self.threshold:
-                # Scroll down
-                self.browser.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
-
-                # Find vehicle links - try multiple selectors
-                vehicle_links = self.browser.find_elements(By.XPATH, "//a[contains(@href, '/marketplace/item/')]")
+            harvester = LinkHarvester(self.browser)
+            self.link_texts = harvester.card_texts
 
-                # If no links found with first selector, try alternatives
-                if len(vehicle_links) == 0 and scroll_count == 0:
-                    self.print_and_log("DEBUG: No links with primary selector, trying alternatives...")
-                    vehicle_links = self.browser.find_elements(By.CSS_SELECTOR, "a[href*='/marketplace/item/']")
-                    if len(vehicle_links) == 0:
-                        vehicle_links = self.browser.find_elements(By.PARTIAL_LINK_TEXT, "marketplace")
-                
-                for link in vehicle_links:
-                    try:
-                        href = link.get_attribute("href")
-                        if href and "/marketplace/item/" in href:
-                            product_id = href.split("/")[-2] if href.endswith("/") else href.split("/")[-1]
-                            if product_id not in self.links:
-                                self.links[product_id] = href
-                                
-                                if len(self.links) >= self.threshold:
-                                    break
-                    except Exception as e:
+            def add_links(new_links):
+                nonlocal known_run, reached_known
+                for product_id, href in new_links:
+                    if product_id in self.links:
                         continue
+                    self.links[product_id] = href
+
+                    if self.incremental_crawl:
+                        if product_id in known_ids or product_id in self.seen_index:
+                            known_run += 1
+                        else:
+                            known_run = 0
+                        if known_run >= self.known_run_limit:
+                            reached_known = True
+
+                    if len(self.links) >= self.threshold:
+                        break
+
+            while scroll_count < max_scrolls and len(self.links) < self.threshold and not reached_known:
+                calls_before = self.command_counter.mark()
+
+                if self.harvest_mode == "script":
+                    # One script call: return anchors that appeared since the last call, then scroll
+                    add_links(harvester.harvest(scroll=True))
+                    self.waits.wait("scroll", script_value_above(ANCHOR_COUNT_SCRIPT, harvester.anchor_count), timeout=4)
+                else:
+                    add_links(self._harvest_links_legacy(scroll_count))
                 
                 scroll_count += 1
-                self.print_and_log(f"INFO: Scroll {scroll_count}, collected {len(self.links)} links")
+                self.print_and_log(f"INFO: Scroll {scroll_count}, collected {len(self.links)} links "
+                                   f"({self.command_counter.since(calls_before)} WebDriver calls)")
+
+            # Pick up whatever loaded after the final scroll
+            if self.harvest_mode == "script" and len(self.links) < self.threshold and not reached_known:
+                add_links(harvester.harvest(scroll=False))
+
+            if reached_known:
+                self.print_and_log(f"INFO: Reached {known_run} consecutive known listings after {scroll_count} scrolls, stopping early")
+
+            # Top of the feed; it becomes the watermark only once the city is complete, so
+            # listings harvested by a run that dies partway are not skipped next time
+            self.feed_head = list(self.links)[:self.watermarks.keep]
                 
         except Exception as e:
             self.print_and_log(f"ERROR: Failed to collect vehicle links: {str(e)}")
     
-    def __init__(self, city_code, profile, proxy, threshold=100, headless=False, download_images=False, block_images=True, restart_interval_minutes=180):
+    def _harvest_links_legacy(self, scroll_count):
+        """Scroll, then read every item anchor on the page with one get_attribute call each"""
+        self.browser.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        self.waits.pause("feed_scroll", 2)
+
+        # Find vehicle links - try multiple selectors
+        vehicle_links = self.browser.find_elements(By.XPATH, "//a[contains(@href, '/marketplace/item/')]")
+
+        # If no links found with first selector, try alternatives
+        if len(vehicle_links) == 0 and scroll_count == 0:
+            self.print_and_log("DEBUG: No links with primary selector, trying alternatives...")
+            vehicle_links = self.browser.find_elements(By.CSS_SELECTOR, "a[href*='/marketplace/item/']")
+            if len(vehicle_links) == 0:
+                vehicle_links = self.browser.find_elements(By.PARTIAL_LINK_TEXT, "marketplace")
+
+        new_links = []
+        for link in vehicle_links:
+            try:
+                href = link.get_attribute("href")
+                if href and "/marketplace/item/" in href:
+                    product_id = href.split("/")[-2] if href.endswith("/") else href.split("/")[-1]
+                    if product_id not in self.links:
+                        new_links.append((product_id, href))
+            except Exception as e:
+                continue
+        return new_links
+
+    def __init__(self, city_code, profile, proxy, threshold=100, headless=False, download_images=False, block_images=True, restart_interval_minutes=180,
+                 sink_flush_size=20, sink_flush_interval=30, incremental_crawl=True, known_run_limit=20, harvest_mode="script",
+                 pacing_floor=0.5, require_make=False, io_workers=4, checkpoint=None,
+                 max_browser_rss_mb=2500, max_renderers=12, warm_spare=False, extract_mode="script", command_budget=25,
+                 snapshot_html=False, image_workers=6, near_dup="flag", near_dup_threshold=0.8):
         # Initialize Firestore first
         self.init_firestore()
+        self.sink = FirestoreSink(self.db, flush_size=sink_flush_size, flush_interval=sink_flush_interval, log=self.print_and_log)
+
+        # Publications are spooled locally before upload and replayed if Firestore did not take them
+        self.closed = False
+        self.spool = PublicationSpool(log=self.print_and_log)
+        self.sink.add_listener(self.spool.on_resolved)
+        # Replays go through their own sink, so backlog from other cities or runs is not counted for this one
+        self.replay_sink = FirestoreSink(self.db, flush_size=100, flush_interval=0, log=self.print_and_log)
+        self.replay_sink.add_listener(self.spool.on_resolved)
+        self.spool_replayer = SpoolReplayer(self.spool, self.replay_sink, reconnect=self.reconnect_firestore,
+                                            live_sink=self.sink, log=self.print_and_log)
+        self.spool_replayer.start()
+        if len(self.spool):
+            self.print_and_log(f"INFO: {len(self.spool)} publications waiting in the local spool from earlier runs")
+
+        # capture (browser) -> parse -> I/O, so the browser never waits on Firestore or image downloads
+        self.pipeline = ScrapePipeline(self.enrich_publication, self.store_publication, io_workers=io_workers,
+                                       on_drop=self.drop_publication, log=self.print_and_log)
+
+        # Local index of already-ingested publications, kept current by the sink
+        self.seen_index = SeenIndex()
+        self.sink.add_listener(self.record_seen)
+        self.replay_sink.add_listener(self.record_seen)
+        self.links_found = 0
+        self.known_links_skipped = 0
+
+        # Publications already processed by an interrupted run of this job (coordinator resume cursor)
+        self.resume_ids = set()
+        self.resumed_links_skipped = 0
+
+        # Per-city watermarks for incremental crawling, advanced once a city's queue is done
+        self.watermarks = CrawlWatermarks()
+        self.feed_head = []
+        self.incremental_crawl = incremental_crawl
+        self.known_run_limit = known_run_limit
+        self.harvest_mode = harvest_mode
+        self.extract_mode = extract_mode
+        self.snapshot_html = snapshot_html
+        self.require_make = require_make
+        self.link_texts = {}
+        self.out_of_scope_skipped = 0
+
+        # Seller profile text shared across listings, cities and restarts
+        self.seller_cache = SellerCache()
+
+        # Reposts of stored listings under new IDs (overlapping city radii); indexed once the sink confirms them
+        self.near_dup_action = near_dup
+        self.near_dup = NearDupIndex(threshold=near_dup_threshold, log=self.print_and_log) if near_dup != "off" else None
+        if self.near_dup:
+            self.sink.add_listener(self.near_dup.on_resolved)
+
+        # Condition-driven waits with an explicit pacing floor
+        self.waits = WaitPolicy(lambda: self.browser, pacing_floor=pacing_floor)
+
+        # Counts WebDriver round trips so per-scroll/per-listing cost is visible
+        self.command_counter = CommandCounter()
+        self.command_budget = CommandBudget(command_budget)
+        self.trim_report = TrimReport()
 
         # Set up attributes (no longer need unique profiles since we're reusing browser)
         self.threshold = threshold
         self.download_images = download_images
+        # Content-addressed, deduplicated downloads on their own pool; only created when downloading is on
+        self.image_store = ImageStore(workers=image_workers, log=self.print_and_log) if download_images else None
         self.city_code = city_code
         self.successful_scrapes = 0
         self.failed_scrapes = 0
@@ -699,9 +1058,9 @@ class fbm_scraper():
         self.current_profile = profile
         self.original_profile = profile
         self.proxy = proxy
+        self.headless = headless
+        self.block_images = block_images
         self.restart_interval_minutes = restart_interval_minutes
-        self.browser_start_time = time.time()
-        self.restart_timer = None
 
         # Store credentials (though not needed for marketplace access)
         self.email = None
@@ -710,19 +1069,34 @@ class fbm_scraper():
         # Initialize browser only if it doesn't exist
         if not hasattr(self, 'browser') or self.browser is None:
             self.init_browser(profile, proxy, headless, block_images)
-        
-        # Start browser restart timer
-        self.start_restart_timer()
+        self.command_counter.install(self.browser)
+
+        # Restarts happen at safe points between listings (age, memory, renderers, page-load latency)
+        # With warm_spare, the replacement browser is launched in the background ahead of time
+        spare = WarmSpare(self.launch_spare_browser, self.validate_browser, log=self.print_and_log) if warm_spare else None
+        self.lifecycle = BrowserLifecycle(self.restart_browser, lambda: self.browser,
+                                          max_age_minutes=restart_interval_minutes, max_rss_mb=max_browser_rss_mb,
+                                          max_renderers=max_renderers, spare=spare, log=self.print_and_log)
 
         # Initialize other attributes
-        self.checkpoint = []
+        self.checkpoint = checkpoint or CheckpointStore(log=self.print_and_log)
         self.links = {}
         self.url_to_scrap = f"https://www.facebook.com/marketplace/{city_code}/vehicles?sortBy=creation_time_descend&exact=true"
         
         self.print_and_log(f"{self.city_code} INFO: Starting the scrape of city code with profile: {profile}")
     
     def init_browser(self, profile, proxy, headless, block_images):
-        """Initialize browser with proxy support"""
+        """Initialize self.browser with proxy support"""
+        self.browser = self.launch_browser(profile, proxy, headless, block_images)
+        self.browser_profile = profile
+
+    def launch_browser(self, profile, proxy, headless, block_images):
+        """
+        Launch a browser with proxy support and return the driver.
+
+        Does not touch self.browser, so a warm spare can be launched from a
+        background thread while the current browser keeps scraping.
+        """
         try:
             # Check if we should use Remote WebDriver (Docker setup)
             remote_url = os.environ.get('SELENIUM_REMOTE_URL')
@@ -745,19 +1119,18 @@ class fbm_scraper():
                 # Wait for Selenium to be ready
                 for attempt in range(30):
                     try:
-                        self.browser = webdriver.Remote(
+                        browser = webdriver.Remote(
                             command_executor=remote_url,
                             options=chrome_options
                         )
                         self.print_and_log("SUCCESS: Connected to Remote WebDriver")
-                        return
+                        return browser
                     except Exception as e:
                         if attempt < 29:
                             self.print_and_log(f"Waiting for Selenium... ({attempt+1}/30)")
                             time.sleep(2)
                         else:
                             raise e
-                return
 
             # Build Chrome arguments for local browser
             chrome_args = "--disable-background-timer-throttling --disable-backgrounding-occluded-windows --disable-renderer-backgrounding --disable-features=TranslateUI --disable-ipc-flooding-protection --no-sandbox --disable-dev-shm-usage --disable-extensions --disable-plugins --aggressive-cache-discard --memory-pressure-off --max_old_space_size=4096 --disable-background-networking --disable-background-sync --disable-add-to-shelf --disable-client-side-phishing-detection --disable-datasaver-prompt --disable-default-apps --disable-desktop-notifications --disable-domain-reliability --disable-features=VizDisplayCompositor --disable-hang-monitor --disable-prompt-on-repost --disable-sync --disable-translate --metrics-recording-only --no-first-run --safebrowsing-disable-auto-update --disable-component-update"
@@ -783,7 +1156,7 @@ class fbm_scraper():
             
             # Don't use user_data_dir in headless mode (causes issues on Linux VPS)
             if headless:
-                self.browser = Driver(
+                browser = Driver(
                     browser="chrome",
                     window_size="1440,900",
                     block_images=block_images,
@@ -795,7 +1168,7 @@ class fbm_scraper():
                     chromium_arg=chrome_args
                 )
             else:
-                self.browser = Driver(
+                browser = Driver(
                     browser="chrome",
                     user_data_dir=f"./profiles/{profile}",
                     window_size="1440,900",
@@ -809,10 +1182,11 @@ class fbm_scraper():
             
             # If proxy has authentication, handle it via Chrome extension or other method
             if proxy and '@' in proxy:
-                self.setup_proxy_auth(proxy)
+                self.setup_proxy_auth(proxy, browser)
             
             self.print_and_log("SUCCESS: Browser initialized successfully")
-            
+            return browser
+
         except Exception as e:
             self.print_and_log(f"ERROR: Failed to initialize browser: {str(e)}")
             self.print_and_log("Retrying browser initialization...")
@@ -831,7 +1205,7 @@ class fbm_scraper():
             
             # Don't use user_data_dir in headless mode (causes issues on Linux VPS)
             if headless:
-                self.browser = Driver(
+                browser = Driver(
                     browser="chrome",
                     window_size="1440,900",
                     block_images=block_images,
@@ -841,7 +1215,7 @@ class fbm_scraper():
                     chromium_arg=chrome_args
                 )
             else:
-                self.browser = Driver(
+                browser = Driver(
                     browser="chrome",
                     user_data_dir=f"./profiles/{profile}",
                     window_size="1440,900",
@@ -852,10 +1226,12 @@ class fbm_scraper():
                 )
 
             if proxy and '@' in proxy:
-                self.setup_proxy_auth(proxy)
+                self.setup_proxy_auth(proxy, browser)
+            return browser
 
-    def setup_proxy_auth(self, proxy):
+    def setup_proxy_auth(self, proxy, browser=None):
         """Setup proxy authentication by navigating to a test page and handling auth popup"""
+        browser = browser or self.browser
         try:
             auth_part, server_part = proxy.split('@')
             username, password = auth_part.split(':')
@@ -863,12 +1239,12 @@ class fbm_scraper():
             self.print_and_log(f"INFO: Setting up proxy authentication for user: {username}")
             
             # Try to navigate to a simple page to trigger proxy auth
-            self.browser.get("http://httpbin.org/ip")
+            browser.get("http://httpbin.org/ip")
             time.sleep(3)
             
             # Check if we can see the response (indicates successful auth)
             try:
-                page_text = self.browser.find_element(By.TAG_NAME, "body").text
+                page_text = browser.find_element(By.TAG_NAME, "body").text
                 if "origin" in page_text.lower():
                     self.print_and_log("SUCCESS: Proxy authentication appears to be working")
                 else:
@@ -879,71 +1255,59 @@ class fbm_scraper():
         except Exception as e:
             self.print_and_log(f"WARNING: Error setting up proxy authentication: {str(e)}")
     
-    def start_restart_timer(self):
-        """Start timer for browser restart"""
-        if self.restart_timer:
-            self.restart_timer.cancel()
-        
-        restart_seconds = self.restart_interval_minutes * 60
-        self.print_and_log(f"INFO: Browser will restart in {self.restart_interval_minutes} minutes ({restart_seconds} seconds)")
-        
-        self.restart_timer = threading.Timer(restart_seconds, self.restart_browser)
-        self.restart_timer.daemon = True
-        self.restart_timer.start()
-    
-    def restart_browser(self):
-        """Restart the browser and resume operation"""
+    def launch_spare_browser(self):
+        """WarmSpare factory - same launch options, the other of two profile dirs (Chrome locks a dir in use)"""
+        spare_profile = f"{self.original_profile}-spare"
+        profile = self.original_profile if self.browser_profile == spare_profile else spare_profile
+        return self.launch_browser(profile, self.proxy, self.headless, self.block_images), profile
+
+    def validate_browser(self, browser):
+        """A spare is usable once it answers a navigation and a script call"""
+        browser.get("about:blank")
+        return browser.execute_script("return 1") == 1
+
+    def restart_browser(self, cause="age", replacement=None):
+        """
+        Replace the browser, using the warm spare (driver, profile) when one is ready.
+
+        Called by BrowserLifecycle at a safe point between listings, so no scrape is
+        in flight; the next scrap_link or execute_scrap_process navigates on its own.
+        """
+        if replacement is not None:
+            old_browser = self.browser
+            self.browser, self.browser_profile = replacement
+            self.command_counter.install(self.browser)
+            # Quitting the old Chrome can take seconds; scraping continues meanwhile
+            threading.Thread(target=old_browser.quit, name="browser-quit", daemon=True).start()
+            self.print_and_log(f"SUCCESS: Swapped in warm spare browser (cause: {cause})")
+            return True
+
         try:
-            self.print_and_log(f"INFO: Browser restart triggered after {self.restart_interval_minutes} minutes")
-            
-            # Store current state
-            current_url = None
-            try:
-                current_url = self.browser.current_url
-                self.print_and_log(f"INFO: Current URL before restart: {current_url}")
-            except Exception:
-                pass
-            
-            # Close current browser
             try:
                 self.browser.quit()
                 self.print_and_log("INFO: Browser closed successfully")
             except Exception as e:
                 self.print_and_log(f"WARNING: Error closing browser: {str(e)}")
-            
+
             # Wait a moment
-            time.sleep(3)
-            
-            # Reinitialize browser with same settings
-            self.print_and_log("INFO: Reinitializing browser...")
-            self.init_browser(self.current_profile, self.proxy, False, True)  # headless=False, block_images=True
-            
-            # Update start time
-            self.browser_start_time = time.time()
-            
-            # Resume at marketplace if we were there
-            if current_url and "marketplace" in current_url:
-                try:
-                    self.print_and_log("INFO: Resuming at marketplace...")
-                    self.go_to_marketplace(self.city_code)
-                except Exception as e:
-                    self.print_and_log(f"WARNING: Error resuming at marketplace: {str(e)}")
-            
-            # Start next restart timer
-            self.start_restart_timer()
-            
+            self.waits.pause("browser_restart", 3)
+
+            self.print_and_log(f"INFO: Reinitializing browser (cause: {cause})...")
+            self.init_browser(self.browser_profile, self.proxy, self.headless, self.block_images)
+            self.command_counter.install(self.browser)
             self.print_and_log("SUCCESS: Browser restart completed successfully")
-            
+            return True
+
         except Exception as e:
             self.print_and_log(f"ERROR: Critical error during browser restart: {str(e)}")
             self.print_and_log("CRITICAL: Script may need manual intervention")
-    
+            return False
+
     def update_restart_interval(self, new_interval_minutes):
-        """Update the restart interval and reset timer"""
+        """Update the maximum browser age"""
         self.restart_interval_minutes = new_interval_minutes
+        self.lifecycle.max_age_seconds = new_interval_minutes * 60
         self.print_and_log(f"INFO: Browser restart interval updated to {new_interval_minutes} minutes")
-        self.start_restart_timer()
-
 
 # Main execution loop - reuse the same browser
 if __name__ == "__main__":
@@ -952,8 +1316,34 @@ if __name__ == "__main__":
     parser.add_argument('--proxy', type=str, help='Proxy in format: username:password@host:port (e.g., sptnbq06y8:70Gw3nPqraNL3v_duv@isp.decodo.com:10002)')
     parser.add_argument('--restart-interval', type=int, default=180, help='Browser restart interval in minutes (default: 180 minutes = 3 hours)')
     parser.add_argument('--allow-images', action='store_true', help='Allow images to load in browser (default: images are blocked)')
+    parser.add_argument('--flush-size', type=int, default=20, help='Publications buffered before a Firestore batch write (default: 20)')
+    parser.add_argument('--flush-interval', type=float, default=30, help='Max seconds a publication stays buffered before being written (default: 30)')
+    parser.add_argument('--full-crawl', action='store_true', help='Always scroll to max_scrolls/threshold instead of stopping at already-seen listings')
+    parser.add_argument('--known-run', type=int, default=20, help='Consecutive already-seen listings that end an incremental crawl (default: 20)')
+    parser.add_argument('--pacing-floor', type=float, default=0.5, help='Minimum seconds spent in every page wait, even when the page is ready sooner (default: 0.5)')
+    parser.add_argument('--require-make', action='store_true', help='Skip listings whose marketplace card names no known vehicle make')
+    parser.add_argument('--harvest-mode', choices=['script', 'legacy'], default='script', help='Link harvesting: one script call per scroll, or find_elements + get_attribute per anchor (default: script)')
+    parser.add_argument('--extract-mode', choices=['script', 'legacy'], default='script', help='Listing capture: one extraction script call, or find_element/get_attribute per field (default: script)')
+    parser.add_argument('--command-budget', type=int, default=25, help='WebDriver commands a listing may cost before it is logged as over budget, 0 disables (default: 25)')
+    parser.add_argument('--snapshot-html', action='store_true', help='Save a gzipped page_source of every listing to state/snapshots and extract attribute rows from it with lxml')
+    parser.add_argument('--download-images', action='store_true', help='Download listing photos into the content-addressed store under images/objects')
+    parser.add_argument('--image-workers', type=int, default=6, help='Concurrent image downloads when --download-images is set (default: 6)')
+    parser.add_argument('--near-dup', choices=['flag', 'skip', 'off'], default='flag', help='Reposts of stored listings under a new ID: skip the profile visit and upload with nearDuplicateOf (flag), do not upload them (skip), or no check (default: flag)')
+    parser.add_argument('--near-dup-threshold', type=float, default=0.8, help='Estimated title/price/description similarity at which a listing counts as a repost (default: 0.8)')
+    parser.add_argument('--schedule', choices=['adaptive', 'fixed'], default='adaptive', help='City order: by expected new listings per browser-minute, or input.csv order (default: adaptive)')
+    parser.add_argument('--min-revisit', type=float, default=30, help='Minutes before the adaptive schedule visits a city again (default: 30)')
+    parser.add_argument('--max-revisit-hours', type=float, default=24, help='Hours after which a city is visited regardless of its yield (default: 24)')
+    parser.add_argument('--explore', type=float, default=0.1, help='Probability of visiting a random eligible city instead of the best one (default: 0.1)')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text', help='scraper.log format: plain text or JSON lines with structured fields (default: text)')
+    parser.add_argument('--io-workers', type=int, default=4, help='Threads uploading publications and downloading images behind the browser (default: 4)')
+    parser.add_argument('--max-browser-rss-mb', type=int, default=2500, help='Restart the browser between listings once Chrome uses more resident memory than this, 0 disables (default: 2500)')
+    parser.add_argument('--max-renderers', type=int, default=12, help='Restart the browser between listings once more renderer processes are alive, 0 disables (default: 12)')
+    parser.add_argument('--warm-spare', action='store_true', help='Launch the replacement browser in the background before a planned restart and swap it in (needs memory for a second Chrome)')
+    parser.add_argument('--log-max-mb', type=int, default=50, help='Rotate scraper.log once it reaches this size in MB (default: 50)')
     args = parser.parse_args()
 
+    configure_logging(fmt=args.log_format, max_bytes=args.log_max_mb * 1024 * 1024)
+
     # Store CLI proxy if provided and strip any quotes
     cli_proxy = args.proxy.strip('\'"') if args.proxy else None
     restart_interval = args.restart_interval
@@ -983,110 +1373,194 @@ if __name__ == "__main__":
 
     # Create browser instance once and reuse it
     worker = None
+    checkpoint = CheckpointStore()
+    scheduler = None
+    if args.schedule == 'adaptive':
+        scheduler = CityScheduler(min_revisit_minutes=args.min_revisit, max_revisit_hours=args.max_revisit_hours,
+                                  explore=args.explore)
     
-    while True:
-        with open(f"{dir_path}/input.csv", "r") as f:
-            reader = csv.reader(f)
-            lines = list(reader)
-
-        if not os.path.exists(f"{dir_path}/publications"):
-            os.makedirs(f"{dir_path}/publications")
-
-        count = 1
-        for line in lines:
-            try:
-                email, password, city_code, threshold, proxy, change_language = line
-            except:
-                current_time_ts = round(time.time())
-                human_readable_time = datetime.datetime.utcfromtimestamp(current_time_ts).strftime('%Y-%m-%d %H:%M:%S')
-                with open("errors.log", "a") as f:
-                    f.write(f"[{human_readable_time}] ERROR: Could not get any data from input.csv in line {count}.\n")
-                count += 1
-                continue
-            count += 1
-            threshold = int(threshold.strip())
-            city_code = city_code.strip()
-            email = email.strip()
-            profile = get_or_create_profile()  # Use random profile instead of email-based
-            change_language = bool(change_language.capitalize())
-
-            # Use CLI proxy if provided, otherwise use CSV proxy
-            active_proxy = cli_proxy if cli_proxy else proxy
-            print(f"INFO: Active proxy for this session: {active_proxy if active_proxy else 'None'}")
-
-            # Create worker only if it doesn't exist (reuse browser)
-            if worker is None:
-                print(f"INFO: Creating new browser instance for first account")
-                worker = fbm_scraper(city_code, profile, active_proxy, threshold, headless, block_images=block_images, restart_interval_minutes=restart_interval)
+    try:
+        while True:
+            with open(f"{dir_path}/input.csv", "r") as f:
+                reader = csv.reader(f)
+                lines = list(reader)
+
+            if not os.path.exists(f"{dir_path}/publications"):
+                os.makedirs(f"{dir_path}/publications")
+
+            if scheduler:
+                # One cycle is as many visits as there are cities, best expected yield first;
+                # the scheduler picks the city in progress first after a crash
+                candidates = {line[2].strip(): (row, line) for row, line in enumerate(lines) if len(line) > 2}
+                plan = (pick for _, pick in scheduler.picks(candidates, len(candidates)))
+                resume_row = 0
             else:
-                # Update settings for new account but keep same browser
-                print(f"INFO: Reusing browser for {email}")
-                worker.update_account_settings(city_code, email, password)
-                # Update restart interval if it changed
-                if worker.restart_interval_minutes != restart_interval:
-                    worker.update_restart_interval(restart_interval)
+                # After a crash, continue the cycle at the row that was in progress
+                plan = enumerate(lines)
+                resume_row = checkpoint.cycle_row()
+                if resume_row:
+                    print(f"INFO: Resuming input cycle at row {resume_row + 1} of {len(lines)}")
+
+            for row, line in plan:
+                if row < resume_row:
+                    continue
+                checkpoint.set_cycle_row(row)
+                try:
+                    email, password, city_code, threshold, proxy, change_language = line
+                except:
+                    human_readable_time = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                    with open("errors.log", "a") as f:
+                        f.write(f"[{human_readable_time}] ERROR: Could not get any data from input.csv in line {row + 1}.\n")
+                    continue
+                threshold = int(threshold.strip())
+                city_code = city_code.strip()
+                email = email.strip()
+                profile = get_or_create_profile()  # Use random profile instead of email-based
+                change_language = bool(change_language.capitalize())
+
+                # Use CLI proxy if provided, otherwise use CSV proxy
+                active_proxy = cli_proxy if cli_proxy else proxy
+                print(f"INFO: Active proxy for this session: {active_proxy if active_proxy else 'None'}")
+
+                # Create worker only if it doesn't exist (reuse browser)
+                if worker is None:
+                    print(f"INFO: Creating new browser instance for first account")
+                    worker = fbm_scraper(city_code, profile, active_proxy, threshold, headless, block_images=block_images, restart_interval_minutes=restart_interval,
+                                         sink_flush_size=args.flush_size, sink_flush_interval=args.flush_interval,
+                                         incremental_crawl=not args.full_crawl, known_run_limit=args.known_run,
+                                         harvest_mode=args.harvest_mode, pacing_floor=args.pacing_floor,
+                                         require_make=args.require_make, io_workers=args.io_workers,
+                                         checkpoint=checkpoint, max_browser_rss_mb=args.max_browser_rss_mb,
+                                         max_renderers=args.max_renderers, warm_spare=args.warm_spare,
+                                         extract_mode=args.extract_mode, command_budget=args.command_budget,
+                                         snapshot_html=args.snapshot_html, download_images=args.download_images,
+                                         image_workers=args.image_workers, near_dup=args.near_dup,
+                                         near_dup_threshold=args.near_dup_threshold)
+                else:
+                    # Update settings for new account but keep same browser
+                    print(f"INFO: Reusing browser for {email}")
+                    worker.update_account_settings(city_code, email, password)
+                    # Update restart interval if it changed
+                    if worker.restart_interval_minutes != restart_interval:
+                        worker.update_restart_interval(restart_interval)
             
-            # No login required - go directly to marketplace
-            worker.execute_scrap_process()
+                # Between cities is a safe point for a pending browser restart
+                worker.lifecycle.maybe_restart()
 
-            # Track statistics and profile counter
-            profile_counter = 0
+                city_start = time.time()
+                if scheduler:
+                    scheduler.begin(city_code)
 
-            for product_id, link in worker.links.items():
-                try:
-                    # Scrape publication and profile data
-                    publication = worker.scrap_link(link)    
-                    
-                    if publication is None:
-                        worker.print_and_log(f"ERROR: Failed to scrape publication {product_id}, skipping...")
-                        worker.failed_scrapes += 1
-                        continue
-                    
-                    # Upload all data to Firebase without any verification
-                    success = worker.upload_to_firestore(publication["publication_id"], publication)
-                    
-                    if success:
-                        worker.successful_scrapes += 1
+                # Before link collection, so the marketplace load and scroll waits are in this city's summary
+                worker.waits.reset()
+                worker.command_budget.reset()
+
+                # No login required - go directly to marketplace
+                worker.execute_scrap_process()
+
+                # Track statistics and profile counter
+                profile_counter = 0
+                worker.sink.reset_counts()
+                worker.seller_cache.reset_stats()
+                worker.trim_report.reset()
+                if worker.near_dup:
+                    worker.near_dup.reset_stats()
+
+                worker.pipeline.reset_stats()
+
+                for product_id, link in worker.links.items():
+                    try:
+                        # No scrape is in flight here - restart the browser if a lifecycle trigger fired
+                        worker.lifecycle.maybe_restart()
+
+                        # Scrape publication and profile data; parsing and upload run in the pipeline
+                        capture_start = time.time()
+                        publication = worker.scrap_link(link, enrich=False)
+
+                        if publication is None:
+                            worker.pipeline.record_capture_failure(time.time() - capture_start)
+                            worker.checkpoint.mark_failed(city_code, product_id)
+                            worker.print_and_log(f"ERROR: Failed to scrape publication {product_id}, skipping...")
+                            worker.failed_scrapes += 1
+                            continue
+
+                        worker.pipeline.submit(publication, time.time() - capture_start)
                         profile_counter += 1
                         worker.print_and_log(f"SUCCESS: Processed publication {product_id} (Profile #{profile_counter})")
-                    else:
-                        worker.failed_scrapes += 1
-                        worker.print_and_log(f"ERROR: Failed to upload publication {product_id}")
                     
-                    # Take 2-minute break with random activity every 15 profiles (optimized from 5min/10 profiles)
-                    if profile_counter % 15 == 0 and profile_counter > 0:
-                        worker.print_and_log(f"INFO: Processed {profile_counter} profiles. Taking 2-minute break with random activity...")
+                        # Take 2-minute break with random activity every 15 profiles (optimized from 5min/10 profiles)
+                        if profile_counter % 15 == 0 and profile_counter > 0:
+                            worker.print_and_log(f"INFO: Processed {profile_counter} profiles. Taking 2-minute break with random activity...")
 
-                        # Split the break into smaller chunks with activity
-                        break_chunks = 2  # Split 2 minutes into 2 chunks
-                        chunk_time = 60 // break_chunks  # 30 seconds per chunk
+                            # Split the break into smaller chunks with activity
+                            break_chunks = 2  # Split 2 minutes into 2 chunks
+                            chunk_time = 60 // break_chunks  # 30 seconds per chunk
 
-                        for chunk in range(break_chunks):
-                            worker.print_and_log(f"INFO: Break chunk {chunk + 1}/{break_chunks} - doing random activity...")
-                            worker.random_activity_during_break()
-                            time.sleep(chunk_time)
+                            for chunk in range(break_chunks):
+                                worker.print_and_log(f"INFO: Break chunk {chunk + 1}/{break_chunks} - doing random activity...")
+                                worker.random_activity_during_break()
+                                worker.waits.pause("break", chunk_time)
 
-                        worker.print_and_log(f"INFO: Break complete. Resuming scraping...")
-                    
-                    time.sleep(0.5)
-                    
-                except Exception as e:
-                    worker.print_and_log(f"ERROR: Unexpected error processing publication {product_id}: {str(e)}")
-                    worker.print_and_log(f"Full traceback: {traceback.format_exc()}")
-                    worker.failed_scrapes += 1
-                    continue
+                            worker.print_and_log(f"INFO: Break complete. Resuming scraping...")
+
+                    except Exception as e:
+                        worker.checkpoint.mark_failed(city_code, product_id)
+                        worker.print_and_log(f"ERROR: Unexpected error processing publication {product_id}: {str(e)}")
+                        worker.print_and_log(f"Full traceback: {traceback.format_exc()}")
+                        worker.failed_scrapes += 1
+                        continue
             
-            # Print final statistics for this account
-            total_processed = worker.successful_scrapes + worker.failed_scrapes
-            success_rate = (worker.successful_scrapes / total_processed * 100) if total_processed > 0 else 0
-            worker.print_and_log(f"SUMMARY for {email}: Processed {total_processed} publications")
-            worker.print_and_log(f"SUMMARY: {worker.successful_scrapes} successful, {worker.failed_scrapes} failed")
-            worker.print_and_log(f"SUMMARY: Success rate: {success_rate:.2f}%")
+                # Let the pipeline finish, write whatever is still buffered and collect per-document results
+                worker.pipeline.drain()
+                worker.sink.flush()
+                worker.complete_city(city_code)
+                upload_counts = worker.sink.reset_counts()
+                worker.successful_scrapes += upload_counts[CREATED] + upload_counts[DUPLICATE]
+                worker.failed_scrapes += upload_counts[FAILED]
+                if scheduler:
+                    scheduler.record(city_code, upload_counts[CREATED], upload_counts[DUPLICATE], city_start)
+
+                # Print final statistics for this account
+                total_processed = worker.successful_scrapes + worker.failed_scrapes
+                success_rate = (worker.successful_scrapes / total_processed * 100) if total_processed > 0 else 0
+                worker.print_and_log(f"SUMMARY for {email}: Processed {total_processed} publications")
+                worker.print_and_log(f"SUMMARY: {worker.successful_scrapes} successful, {worker.failed_scrapes} failed")
+                worker.print_and_log(f"SUMMARY: {upload_counts[CREATED]} new, {upload_counts[DUPLICATE]} duplicates skipped, "
+                                     f"{worker.known_links_skipped} known links never visited")
+                cache_hits, cache_misses = worker.seller_cache.reset_stats()
+                cache_lookups = cache_hits + cache_misses
+                worker.print_and_log(f"SUMMARY: Seller cache hit rate: {(cache_hits / cache_lookups * 100) if cache_lookups else 0:.1f}% "
+                                     f"({cache_hits}/{cache_lookups})")
+                worker.seller_cache.save()
+                worker.print_and_log(worker.waits.summary())
+                worker.print_and_log(worker.command_budget.summary())
+                worker.print_and_log(worker.trim_report.summary())
+                if worker.near_dup:
+                    worker.print_and_log(worker.near_dup.summary())
+                    worker.near_dup.flush()
+                worker.print_and_log(worker.pipeline.summary())
+                worker.print_and_log(worker.lifecycle.summary())
+                if worker.image_store:
+                    worker.print_and_log(worker.image_store.summary())
+                    worker.image_store.save()
+                if scheduler:
+                    worker.print_and_log(scheduler.summary())
+                worker.print_and_log(f"SUMMARY: Success rate: {success_rate:.2f}%")
             
-            # Reset counters for next account (but keep browser open)
-            worker.successful_scrapes = 0
-            worker.failed_scrapes = 0
+                # Reset counters for next account (but keep browser open)
+                worker.successful_scrapes = 0
+                worker.failed_scrapes = 0
         
-        # Do NOT close browser at end of CSV cycle - reuse it for next cycle
-        print("INFO: Finished processing all accounts in CSV. Starting next cycle with same browser...")
-        time.sleep(5)  # Brief pause before next cycle
\ No newline at end of file
+            # Do NOT close browser at end of CSV cycle - reuse it for next cycle
+            checkpoint.set_cycle_row(0)
+            print("INFO: Finished processing all accounts in CSV. Starting next cycle with same browser...")
+            time.sleep(5)  # Brief pause before next cycle
+    except KeyboardInterrupt:
+        print("\nINFO: Shutdown requested. Draining pipeline and flushing buffered publications...")
+        if worker:
+            worker.pipeline.drain(timeout=120)
+            worker.sink.flush()
+            worker.print_and_log(worker.pipeline.summary())
+    finally:
+        if worker:
+            worker.close()
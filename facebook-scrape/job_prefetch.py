@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Coordinator Job Prefetch
+
+Leases the next coordinator job in a background thread while the current city
+is still being processed, so a worker can start the next city as soon as the
+current one is reported instead of sleeping and polling synchronously.
+
+- Prefetched jobs expire locally after the coordinator's assignment lease
+  (leaseSeconds) and are fetched again if they were not started in time
+- When no job is available, polling backs off from min_poll to max_poll and
+  wakes up early at the coordinator's nextAvailableInSeconds hint
+- Time the worker spends waiting for a job is reported as idle seconds per hour
+"""
+
+import time
+import threading
+from typing import Any, Dict, Optional
+
+DEFAULT_LEASE_SECONDS = 15 * 60
+
+
+class JobPrefetcher:
+    """Background job lookahead for run_coordinator_mode"""
+
+    def __init__(self, coordinator, min_poll: float = 15, max_poll: float = 300, lease_margin: float = 60, log=print):
+        """
+        Args:
+            coordinator: CoordinatorClient used for get-job
+            min_poll: Seconds before the first re-poll when no job is available
+            max_poll: Upper bound on the poll backoff
+            lease_margin: Seconds before lease expiry at which a held job counts as expired
+            log: Logging callable
+        """
+        self.coordinator = coordinator
+        self.min_poll = min_poll
+        self.max_poll = max(min_poll, max_poll)
+        self.lease_margin = lease_margin
+        self.log = log
+
+        self.condition = threading.Condition()
+        self.wake_event = threading.Event()
+        self.wanted = False
+        self.job = None
+        self.job_expires_at = 0.0
+        self.attempts = 0
+        self.stopped = False
+
+        self.started_at = time.time()
+        self.idle_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name="job-prefetch", daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.wake_event.set()
+
+    def prefetch(self):
+        """Ask the background thread to lease the next job now (non-blocking)"""
+        with self.condition:
+            if self.wanted:
+                return
+            self.wanted = True
+            self.condition.notify_all()
+        self.wake_event.set()
+
+    def wake(self):
+        """Cut a no-job backoff short and poll again immediately"""
+        self.wake_event.set()
+
+    def _held_job_valid(self) -> bool:
+        return self.job is not None and time.time() < self.job_expires_at
+
+    def next_job(self, wait: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Take the prefetched job, fetching one if none is held.
+
+        Args:
+            wait: Block until a job is available; otherwise return None after one empty poll
+
+        Returns:
+            Job dict (also set as coordinator.current_job), or None
+        """
+        start = time.time()
+        with self.condition:
+            if not self._held_job_valid():
+                self.wanted = True
+                self.condition.notify_all()
+                self.wake_event.set()
+            attempts_at_call = self.attempts
+            while not self.stopped:
+                if self._held_job_valid():
+                    break
+                if self.job is not None:
+                    self.log(f"INFO: Prefetched job {self.job.get('jobId')} lease expired, fetching again")
+                    self.job = None
+                    self.wanted = True
+                    self.condition.notify_all()
+                    self.wake_event.set()
+                if not wait and self.attempts > attempts_at_call and self.job is None:
+                    break
+                self.condition.wait(timeout=1.0)
+
+            job = self.job if self._held_job_valid() else None
+            self.job = None
+            if job:
+                # The next lookahead is requested explicitly via prefetch()
+                self.wanted = False
+
+        self.idle_seconds += time.time() - start
+        if job:
+            self.coordinator.current_job = job
+        return job
+
+    def _run(self):
+        backoff = self.min_poll
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.wanted or self.job is not None):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+
+            self.wake_event.clear()
+            job = None
+            try:
+                job = self.coordinator.get_job(set_current=False)
+            except Exception as e:
+                self.log(f"WARNING: Job prefetch failed: {str(e)}")
+
+            with self.condition:
+                self.attempts += 1
+                if job:
+                    lease = job.get('leaseSeconds') or DEFAULT_LEASE_SECONDS
+                    self.job = job
+                    self.job_expires_at = time.time() + max(0, lease - self.lease_margin)
+                    self.wanted = False
+                    backoff = self.min_poll
+                self.condition.notify_all()
+            if job:
+                continue
+
+            # Nothing available: back off, but wake up when the coordinator says a city frees up
+            delay = backoff
+            hint = self.coordinator.next_available_in
+            if hint is not None:
+                delay = min(delay, max(1.0, float(hint)))
+            backoff = min(self.max_poll, backoff * 2)
+            self.log(f"INFO: No job available, polling again in {delay:.0f}s")
+            self.wake_event.wait(delay)
+
+    def idle_per_hour(self) -> float:
+        """Seconds per hour of uptime spent waiting for a job"""
+        uptime = time.time() - self.started_at
+        return self.idle_seconds / uptime * 3600 if uptime > 0 else 0.0
+
+    def idle_summary(self) -> str:
+        uptime = time.time() - self.started_at
+        return (f"Job wait: {self.idle_seconds:.0f}s idle over {uptime / 3600:.2f}h uptime "
+                f"({self.idle_per_hour():.0f}s idle per hour)")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Incremental Marketplace Link Harvester
+
+Instead of find_elements() over every item anchor plus one get_attribute("href")
+round trip per anchor after each scroll, a single script execution returns only
+the item links that appeared since the previous call and then scrolls. The set
+of already-returned hrefs lives on the page, so the cost per scroll no longer
+grows with everything loaded so far.
+"""
+
+import re
+from typing import List, Tuple
+
+ITEM_ID_RE = re.compile(r"/marketplace/item/(\d+)")
+
+# Returns {items: [[href, card text], ...], count: N} - item anchors not returned before,
+# plus the total anchor count (used to detect when a scroll has loaded more), then
+# optionally scrolls. The card text (price, title, location) allows cheap pre-filtering.
+# Anchors are tagged so later calls skip them without re-reading their href.
+HARVEST_SCRIPT = """
+var seen = window.__fbmHarvested || (window.__fbmHarvested = new Set());
+var anchors = document.querySelectorAll("a[href*='/marketplace/item/']");
+var fresh = [];
+for (var i = 0; i < anchors.length; i++) {
+    var a = anchors[i];
+    if (a.__fbmHarvested) continue;
+    a.__fbmHarvested = true;
+    var href = a.href;
+    if (!href || seen.has(href)) continue;
+    seen.add(href);
+    fresh.push([href, (a.innerText || "").slice(0, 300)]);
+}
+if (arguments[0]) {
+    window.scrollTo(0, document.body.scrollHeight);
+}
+return {items: fresh, count: anchors.length};
+"""
+
+# Number of item anchors currently on the page
+ANCHOR_COUNT_SCRIPT = "return document.querySelectorAll(\"a[href*='/marketplace/item/']\").length;"
+
+
+def product_id_from_href(href: str):
+    """Extract the publication ID from a /marketplace/item/<id>/ link"""
+    match = ITEM_ID_RE.search(href or "")
+    if match:
+        return match.group(1)
+    return None
+
+
+class LinkHarvester:
+    """Returns only the marketplace item links that are new since the last call"""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.anchor_count = 0
+        self.card_texts = {}
+
+    def harvest(self, scroll: bool = True) -> List[Tuple[str, str]]:
+        """
+        Collect new item links in one WebDriver call, then scroll if requested.
+        Card texts are kept in self.card_texts by product ID.
+
+        Returns:
+            (product_id, href) pairs in page order
+        """
+        result = self.browser.execute_script(HARVEST_SCRIPT, bool(scroll)) or {}
+        self.anchor_count = result.get("count", self.anchor_count)
+        links = []
+        for href, card_text in result.get("items", []):
+            product_id = product_id_from_href(href)
+            if product_id:
+                links.append((product_id, href))
+                self.card_texts.setdefault(product_id, card_text)
+        return links
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Single-Call Listing Extraction
+
+Reading a listing through element handles costs one WebDriver round trip per
+find_element attempt (five seller XPaths, repeated after every scroll), one for
+body.text, one for current_url and one get_attribute("src") per image. The
+scripts here do the same work page-side and return everything as one JSON
+object, so capturing a listing is a single execute_script call:
+
+    {"url": ..., "text": body innerText, "title": ..., "sellerFound": bool, "sellerLink": href or null,
+     "images": [first 3 scontent URLs], "attributes": {"mileage": "...", ...}}
+
+The seller anchor found by the extraction is kept on the page, so the profile
+click that follows is one more call instead of a lookup plus a click.
+"""
+
+from typing import Dict, Optional
+
+# Seller profile link candidates, in order of preference
+SELLER_XPATHS = [
+    "//a[contains(@href, '/marketplace/profile')]",
+    "//a[contains(@href, '/profile.php')]",
+    "//a[contains(@href, '/user/')]",
+    "//a[contains(@aria-label, 'profile')]",
+    "//span[contains(text(), 'Seller information')]/following::a[1]",
+]
+
+# Clicks the first "See more" button of the description; returns whether one was found
+EXPAND_SCRIPT = """
+var node = document.evaluate(
+    "//span[normalize-space(.)='See more']/ancestor::div[@role='button'][1] " +
+    "| //span[normalize-space(.)='See more']/ancestor::div[1][@role='button']",
+    document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!node) return false;
+node.click();
+return true;
+"""
+
+# arguments[0] = {sellerXPaths, imageXPath, titleXPath, maxImages, sprites: {name: "-21px -63px"}, scrollBy}
+EXTRACT_SCRIPT = """
+var opts = arguments[0];
+function first(xpath) {
+    return document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+
+var seller = null;
+for (var i = 0; i < opts.sellerXPaths.length && !seller; i++) {
+    seller = first(opts.sellerXPaths[i]);
+}
+window.__fbmSellerAnchor = seller;
+if (!seller && opts.scrollBy) {
+    window.scrollBy(0, opts.scrollBy);
+}
+
+var images = [];
+var imgs = document.evaluate(opts.imageXPath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var j = 0; j < imgs.snapshotLength && images.length < opts.maxImages; j++) {
+    var src = imgs.snapshotItem(j).src;
+    if (src && src.indexOf("https://scontent") !== -1) images.push(src);
+}
+
+// Attribute rows are an icon sprite (identified by its background-position) next to their text
+var attributes = {};
+var icons = document.querySelectorAll("i[style*='background-position']");
+for (var name in opts.sprites) {
+    for (var k = 0; k < icons.length; k++) {
+        if (icons[k].style.backgroundPosition !== opts.sprites[name]) continue;
+        var row = icons[k].parentElement;
+        for (var depth = 0; row && depth < 4 && !(row.innerText || "").trim(); depth++) {
+            row = row.parentElement;
+        }
+        if (row) attributes[name] = row.innerText.trim();
+        break;
+    }
+}
+
+var title = first(opts.titleXPath);
+return {
+    url: location.href,
+    text: document.body ? document.body.innerText : "",
+    title: title ? title.innerText : null,
+    sellerFound: !!seller,
+    sellerLink: seller ? seller.href || null : null,
+    images: images,
+    attributes: attributes
+};
+"""
+
+# Clicks the seller anchor remembered by EXTRACT_SCRIPT; returns false if it is gone
+CLICK_SELLER_SCRIPT = """
+var a = window.__fbmSellerAnchor;
+if (!a || !a.isConnected) return false;
+a.click();
+return true;
+"""
+
+BODY_TEXT_SCRIPT = "return document.body ? document.body.innerText : '';"
+
+
+def extract_listing(browser, image_xpath: str, title_xpath: str, sprites: Optional[Dict[str, str]] = None,
+                    scroll_by: int = 0, max_images: int = 3) -> Dict:
+    """
+    Capture a listing page in one execute_script call.
+
+    Args:
+        browser: WebDriver on the listing page
+        image_xpath: XPath of the listing photos
+        title_xpath: XPath of the listing title
+        sprites: Attribute name -> normalized icon background-position (sprite_extractor.sprite_positions())
+        scroll_by: Pixels to scroll when no seller link was found (lazy-loaded seller section)
+        max_images: Image URLs to return
+    """
+    result = browser.execute_script(EXTRACT_SCRIPT, {
+        "sellerXPaths": SELLER_XPATHS,
+        "imageXPath": image_xpath,
+        "titleXPath": title_xpath,
+        "maxImages": max_images,
+        "sprites": sprites or {},
+        "scrollBy": scroll_by,
+    }) or {}
+    result.setdefault("text", "")
+    result.setdefault("images", [])
+    result.setdefault("attributes", {})
+    return result
+
+
+def expand_description(browser) -> bool:
+    """Click "See more" if present; one call whether or not it exists"""
+    return bool(browser.execute_script(EXPAND_SCRIPT))
+
+
+def click_seller(browser) -> bool:
+    return bool(browser.execute_script(CLICK_SELLER_SCRIPT))
+
+
+def body_text(browser) -> str:
+    return browser.execute_script(BODY_TEXT_SCRIPT) or ""
+
+
+def seller_xpath_union() -> str:
+    """All seller candidates as one XPath, for presence waits"""
+    return " | ".join(SELLER_XPATHS)
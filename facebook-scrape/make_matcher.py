@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Vehicle Make/Year/Model Matcher
+
+Compiles the VEHICLE_MAKES list (plus common aliases) into an Aho-Corasick
+automaton. A single left-to-right pass over a title or description finds every
+make with word-boundary checks and detects model years on the way; overlapping
+hits resolve to the longest match ("honda motorcycles" over "honda").
+
+The batch API scores many texts at once so non-vehicle or out-of-scope items
+can be dropped before any browser visit.
+"""
+
+import datetime
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Alternative spellings mapped onto a canonical make
+MAKE_ALIASES = {
+    "chevy": "chevrolet",
+    "vw": "volkswagen",
+    "mercedes": "mercedes-benz",
+    "mercedes benz": "mercedes-benz",
+    "benz": "mercedes-benz",
+    "landrover": "land rover",
+    "range rover": "land rover",
+    "harley": "harley-davidson",
+    "harley davidson": "harley-davidson",
+    "alfa": "alfa romeo",
+    "citroen": "citroën",
+    "rolls royce": "rolls-royce",
+    "can am": "can-am",
+}
+
+MIN_YEAR = 1950
+MODEL_TOKENS = 2
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum()
+
+
+def _lower_same_length(text: str) -> str:
+    """Lowercase character by character, keeping characters whose lowercase form is longer
+    (e.g. 'İ'), so offsets into the result are offsets into text"""
+    lower = text.lower()
+    if len(lower) == len(text):
+        return lower
+    return "".join(ch if len(ch.lower()) != 1 else ch.lower() for ch in text)
+
+
+class MakeMatcher:
+    """Aho-Corasick automaton over vehicle make names"""
+
+    def __init__(self, makes: Iterable[str], aliases: Optional[Dict[str, str]] = None, max_year: Optional[int] = None):
+        """
+        Args:
+            makes: Canonical make names (duplicates are ignored)
+            aliases: Extra spelling -> canonical make mappings
+            max_year: Latest plausible model year (default: next calendar year)
+        """
+        patterns = {}
+        for make in makes:
+            make = make.strip().lower()
+            if make:
+                patterns.setdefault(make, make)
+        for alias, canonical in (aliases if aliases is not None else MAKE_ALIASES).items():
+            patterns.setdefault(alias.lower(), canonical.lower())
+
+        self.makes = sorted(set(patterns.values()))
+        self.max_year = max_year or datetime.date.today().year + 1
+        self._build(patterns)
+
+    def _build(self, patterns: Dict[str, str]):
+        # Node arrays: goto transitions, failure link, and the longest pattern ending here
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Optional[Tuple[int, str]]] = [None]  # (pattern length, canonical make)
+
+        for pattern, canonical in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                node = nxt
+            self.output[node] = (len(pattern), canonical)
+
+        # Breadth-first failure links; every node also records its outputs along the fail chain
+        self.all_outputs: List[List[Tuple[int, str]]] = [[] for _ in self.goto]
+        queue = deque()
+        for child in self.goto[0].values():
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+            own = [self.output[node]] if self.output[node] else []
+            self.all_outputs[node] = own + self.all_outputs[self.fail[node]]
+
+    def scan(self, text: str):
+        """
+        Single pass over text.
+
+        Returns:
+            (make_hits, years) where make_hits are non-overlapping (start, end, make)
+            using longest match, and years are (start, end, year) tuples; offsets index text
+        """
+        lower = _lower_same_length(text)
+        goto, fail, all_outputs = self.goto, self.fail, self.all_outputs
+        length = len(lower)
+        candidates = []
+        years = []
+        state = 0
+        digit_start = -1
+
+        for i, ch in enumerate(lower):
+            # Model years: a 4-digit run bounded by non-word characters
+            if ch.isdigit():
+                if digit_start < 0:
+                    digit_start = i
+            else:
+                if digit_start >= 0:
+                    self._check_year(lower, digit_start, i, years)
+                digit_start = -1
+
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for pattern_length, make in all_outputs[state]:
+                start = i - pattern_length + 1
+                end = i + 1
+                if (start == 0 or not _is_word_char(lower[start - 1])) and \
+                        (end == length or not _is_word_char(lower[end])):
+                    candidates.append((start, end, make))
+
+        if digit_start >= 0:
+            self._check_year(lower, digit_start, length, years)
+
+        # Leftmost-longest, non-overlapping
+        candidates.sort(key=lambda hit: (hit[0], -(hit[1] - hit[0])))
+        hits = []
+        last_end = -1
+        for start, end, make in candidates:
+            if start >= last_end:
+                hits.append((start, end, make))
+                last_end = end
+        return hits, years
+
+    def _check_year(self, lower, start, end, years):
+        if end - start != 4:
+            return
+        if start > 0 and lower[start - 1].isalpha():
+            return
+        if end < len(lower) and lower[end].isalpha():
+            return
+        year = int(lower[start:end])
+        if MIN_YEAR <= year <= self.max_year:
+            years.append((start, end, year))
+
+    def match(self, text: str) -> Dict:
+        """
+        Identify make, year and model in a title or description.
+
+        Returns:
+            {"make", "year", "model", "score"} - score in [0, 1] is higher the more
+            confidently the text describes a vehicle
+        """
+        text = text or ""
+        hits, years = self.scan(text)
+
+        make = hits[0][2] if hits else None
+        year = years[0][2] if years else None
+        model = None
+        if hits:
+            tokens = []
+            for token in text[hits[0][1]:].split():
+                token = token.strip(",.;:!|()[]")
+                if not token or token.startswith("$"):
+                    break
+                if token.isdigit() and len(token) == 4 and MIN_YEAR <= int(token) <= self.max_year:
+                    break
+                tokens.append(token)
+                if len(tokens) >= MODEL_TOKENS:
+                    break
+            model = " ".join(tokens) or None
+
+        score = (0.6 if make else 0.0) + (0.3 if year else 0.0) + (0.1 if model else 0.0)
+        return {"make": make, "year": year, "model": model, "score": round(score, 2)}
+
+    def match_many(self, texts: Iterable[str]) -> List[Dict]:
+        """Batch API - match() for every text"""
+        return [self.match(text) for text in texts]
+
+    def is_vehicle(self, text: str, min_score: float = 0.6) -> bool:
+        """Cheap pre-filter: does the text name a known make (and optionally a year)"""
+        return self.match(text)["score"] >= min_score
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Listing Index (MinHash/LSH)
+
+Neighbouring cities in config/cities.json (los-angeles, glendale, pasadena,
+long-beach, ...) have overlapping search radii, and dealers repost the same
+vehicle under new publication IDs. The seen index only knows IDs, so every
+repost costs a profile visit and an upload. This index remembers a MinHash
+signature of each stored listing's normalized title + price + description and
+answers "is this a repost of a listing we already have?" right after the
+listing page is captured.
+
+- Signature: word 3-gram shingles, num_perm 32-bit MinHash values (fixed seed,
+  so signatures are comparable across processes and restarts)
+- Lookup: LSH with `bands` bands of num_perm / bands rows; only listings that
+  share a band are compared, and a candidate counts as a repost when the
+  estimated Jaccard similarity reaches `threshold`
+- Persistence: append-only segment files under state/near_dup/, one per flush,
+  merged into a single segment by compaction; entries older than max_age_days
+  are dropped on load and compaction
+
+Usage:
+    python near_dup.py --stats
+    python near_dup.py --compact
+    python near_dup.py --input docs.jsonl [--add]         # report reposts among stored documents
+    python near_dup.py --firestore --limit 5000 [--add]   # warm start from vehicles_initial
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_DIR = os.path.join(SCRIPT_DIR, "state", "near_dup")
+
+SEGMENT_PATTERN = "segment-*.jsonl"
+SHINGLE_SIZE = 3
+SEED = 0x5EED
+MERSENNE_PRIME = (1 << 61) - 1
+MASK32 = 0xFFFFFFFF
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_listing(title: Optional[str], price, description: Optional[str]) -> List[str]:
+    """Lowercase alphanumeric tokens of title, price and description ("$12,500" -> "12500")"""
+    price_token = re.sub(r"[^0-9]", "", str(price)) if price is not None else ""
+    text = f"{title or ''} {price_token} {description or ''}".lower()
+    return TOKEN_RE.findall(text)
+
+
+def shingles(tokens: List[str], size: int = SHINGLE_SIZE) -> set:
+    """64-bit hashes of the word n-grams of a token list"""
+    if len(tokens) < size:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return {int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little") for gram in grams}
+
+
+class MinHasher:
+    """MinHash over universal hash functions (a * x + b) mod 2^61-1, truncated to 32 bits"""
+
+    def __init__(self, num_perm: int = 64, seed: int = SEED):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, hashes: Iterable[int]) -> array:
+        hashes = list(hashes)
+        return array("I", [min((a * x + b) % MERSENNE_PRIME for x in hashes) & MASK32 for a, b in self.params])
+
+
+def similarity(left: array, right: array) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class NearDupIndex:
+    """Persistent MinHash/LSH index of stored listings"""
+
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, num_perm: int = 64, bands: int = 16,
+                 threshold: float = 0.8, min_shingles: int = 8, max_age_days: float = 30,
+                 segment_size: int = 500, max_segments: int = 16, log=print):
+        """
+        Args:
+            index_dir: Directory holding the segment files
+            num_perm: MinHash values per signature (changing it invalidates existing segments)
+            bands: LSH bands; more bands catch less similar listings, at more candidate comparisons
+            threshold: Estimated Jaccard similarity at which a listing counts as a repost
+            min_shingles: Listings with fewer shingles (title and price only) are never compared
+            max_age_days: Entries older than this are dropped
+            segment_size: Write a segment after this many new entries
+            max_segments: Merge all segments into one when there are more than this
+            log: Logging callable
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.index_dir = index_dir
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.min_shingles = min_shingles
+        self.max_age_seconds = max_age_days * 86400
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.log = log
+
+        self.hasher = MinHasher(num_perm)
+        self.lock = threading.Lock()
+        self.signatures: Dict[str, array] = {}
+        self.entries: Dict[str, Dict] = {}
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self.unconfirmed: Dict[str, Dict] = {}
+        self.unsaved: List[Dict] = []
+        self.stats = {"checked": 0, "flagged": 0, "too_short": 0}
+        self._load()
+
+    # --- signatures ----------------------------------------------------------
+
+    def signature(self, title: Optional[str], price, description: Optional[str]) -> Optional[array]:
+        """MinHash signature of a listing, or None when it has too little text to compare"""
+        hashes = shingles(normalize_listing(title, price, description))
+        if len(hashes) < self.min_shingles:
+            return None
+        return self.hasher.signature(hashes)
+
+    def _band_keys(self, sig: array) -> List[bytes]:
+        data = sig.tobytes()
+        width = self.rows * sig.itemsize
+        return [data[band * width:(band + 1) * width] for band in range(self.bands)]
+
+    # --- lookup --------------------------------------------------------------
+
+    def query(self, sig: array, exclude_id=None) -> Optional[Tuple[str, float]]:
+        """(doc_id, similarity) of the most similar indexed listing at or above threshold, or None"""
+        exclude_id = str(exclude_id) if exclude_id is not None else None
+        with self.lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(sig)):
+                candidates.update(self.buckets[band].get(key, ()))
+            candidates.discard(exclude_id)
+            best = None
+            for doc_id in candidates:
+                score = similarity(sig, self.signatures[doc_id])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (doc_id, score)
+        return best
+
+    def check(self, doc_id, title: Optional[str], price, description: Optional[str],
+              city: Optional[str] = None) -> Optional[Dict]:
+        """
+        Look a freshly captured listing up, and index it if it is not a repost.
+
+        The listing is searchable right away but only persisted once confirm() is
+        called for it (the sink resolved its upload); discard() takes it back out.
+
+        Returns:
+            {"doc_id", "similarity", "city"} of the original listing, or None
+        """
+        doc_id = str(doc_id)
+        sig = self.signature(title, price, description)
+        with self.lock:
+            self.stats["checked"] += 1
+            if sig is None:
+                self.stats["too_short"] += 1
+        if sig is None:
+            return None
+
+        match = self.query(sig, exclude_id=doc_id)
+        if match:
+            original_id, score = match
+            with self.lock:
+                self.stats["flagged"] += 1
+                city_of_original = self.entries.get(original_id, {}).get("city")
+            return {"doc_id": original_id, "similarity": round(score, 3), "city": city_of_original}
+
+        entry = {"id": doc_id, "city": city, "added_at": time.time()}
+        with self.lock:
+            self._insert(doc_id, sig, entry)
+            self.unconfirmed[doc_id] = entry
+        return None
+
+    # --- updates -------------------------------------------------------------
+
+    def _insert(self, doc_id: str, sig: array, entry: Dict):
+        if doc_id in self.signatures:
+            self._remove(doc_id)
+        self.signatures[doc_id] = sig
+        self.entries[doc_id] = entry
+        for band, key in enumerate(self._band_keys(sig)):
+            self.buckets[band].setdefault(key, []).append(doc_id)
+
+    def _remove(self, doc_id: str):
+        sig = self.signatures.pop(doc_id, None)
+        self.entries.pop(doc_id, None)
+        if sig is None:
+            return
+        for band, key in enumerate(self._band_keys(sig)):
+            bucket = self.buckets[band].get(key)
+            if bucket and doc_id in bucket:
+                bucket.remove(doc_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def add(self, doc_id, sig: array, city: Optional[str] = None, added_at: Optional[float] = None):
+        """Index and persist a listing unconditionally (warm start)"""
+        doc_id = str(doc_id)
+        entry = {"id": doc_id, "city": city, "added_at": added_at or time.time()}
+        with self.lock:
+            self._insert(doc_id, sig, entry)
+            self.unsaved.append(entry)
+            flush_due = len(self.unsaved) >= self.segment_size
+        if flush_due:
+            self.flush()
+
+    def confirm(self, doc_id):
+        """Persist a listing indexed by check()"""
+        doc_id = str(doc_id)
+        with self.lock:
+            entry = self.unconfirmed.pop(doc_id, None)
+            if entry is None or doc_id not in self.signatures:
+                return
+            self.unsaved.append(entry)
+            flush_due = len(self.unsaved) >= self.segment_size
+        if flush_due:
+            self.flush()
+
+    def discard(self, doc_id):
+        """Take a listing indexed by check() back out (its upload failed)"""
+        doc_id = str(doc_id)
+        with self.lock:
+            if self.unconfirmed.pop(doc_id, None) is not None:
+                self._remove(doc_id)
+
+    def on_resolved(self, doc_id, result, publication=None):
+        """Sink listener - persist listings that are in Firestore, forget failed ones"""
+        from firestore_sink import CREATED, DUPLICATE, FAILED
+
+        if result in (CREATED, DUPLICATE):
+            self.confirm(doc_id)
+        elif result == FAILED:
+            self.discard(doc_id)
+
+    # --- segments ------------------------------------------------------------
+
+    def _segment_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.index_dir, SEGMENT_PATTERN)))
+
+    def _new_segment_path(self) -> str:
+        return os.path.join(self.index_dir, f"segment-{time.time_ns()}.jsonl")
+
+    def _segment_rows(self, doc_ids: Iterable[str]) -> List[Dict]:
+        """Persisted form of indexed entries: the entry plus its base64 signature (caller holds the lock)"""
+        return [dict(self.entries[doc_id], sig=base64.b64encode(self.signatures[doc_id].tobytes()).decode("ascii"))
+                for doc_id in doc_ids if doc_id in self.signatures]
+
+    def _write_segment(self, path: str, rows: List[Dict]):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(tmp_path, path)
+
+    def _load(self):
+        cutoff = time.time() - self.max_age_seconds
+        expected_size = self.num_perm * array("I").itemsize
+        loaded = expired = 0
+        for path in self._segment_files():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        row = json.loads(line)
+                        if row.get("added_at", 0) < cutoff:
+                            expired += 1
+                            continue
+                        raw = base64.b64decode(row.pop("sig"))
+                        if len(raw) != expected_size:
+                            continue
+                        sig = array("I")
+                        sig.frombytes(raw)
+                        self._insert(row["id"], sig, row)
+                        loaded += 1
+            except (OSError, ValueError, KeyError) as e:
+                self.log(f"WARNING: Could not read near-duplicate segment {path}: {str(e)}")
+        if loaded or expired:
+            self.log(f"INFO: Near-duplicate index loaded {len(self.signatures)} listings "
+                     f"from {len(self._segment_files())} segments ({expired} expired)")
+
+    def flush(self):
+        """Write entries persisted since the last flush as a new segment, compacting when there are too many"""
+        with self.lock:
+            rows = self._segment_rows(entry["id"] for entry in self.unsaved)
+            self.unsaved = []
+        if rows:
+            try:
+                self._write_segment(self._new_segment_path(), rows)
+            except OSError as e:
+                self.log(f"WARNING: Could not save near-duplicate segment: {str(e)}")
+        if len(self._segment_files()) > self.max_segments:
+            self.compact()
+
+    def compact(self):
+        """Merge all segments into one, dropping expired and unconfirmed entries"""
+        cutoff = time.time() - self.max_age_seconds
+        old_segments = self._segment_files()
+        with self.lock:
+            for doc_id in [doc_id for doc_id, entry in self.entries.items() if entry["added_at"] < cutoff]:
+                self._remove(doc_id)
+            pending = {entry["id"] for entry in self.unsaved} | set(self.unconfirmed)
+            rows = self._segment_rows(doc_id for doc_id in list(self.entries) if doc_id not in pending)
+        try:
+            # New segment first: a crash in between leaves duplicates, which load collapses
+            self._write_segment(self._new_segment_path(), rows)
+            for path in old_segments:
+                os.remove(path)
+        except OSError as e:
+            self.log(f"WARNING: Could not compact near-duplicate index: {str(e)}")
+            return
+        self.log(f"INFO: Compacted {len(old_segments)} near-duplicate segments into one ({len(rows)} listings)")
+
+    def close(self):
+        self.flush()
+
+    # --- stats ---------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def reset_stats(self) -> Dict[str, int]:
+        """Return counters since the last reset and zero them"""
+        with self.lock:
+            stats = self.stats
+            self.stats = {"checked": 0, "flagged": 0, "too_short": 0}
+        return stats
+
+    def summary(self) -> str:
+        with self.lock:
+            stats = dict(self.stats)
+            size = len(self.signatures)
+        return (f"Near-duplicates: {stats['flagged']} of {stats['checked']} listings flagged as reposts "
+                f"({stats['too_short']} too short to compare, {size} listings indexed)")
+
+
+def document_fields(doc: Dict) -> Tuple[Optional[str], object, Optional[str]]:
+    """(title, price, description) of a stored document, parsing publicationText when needed"""
+    if doc.get("product_title") is None and doc.get("publicationText"):
+        from vehicle_parser import parse_publication
+        doc = dict(doc, **parse_publication(doc["publicationText"]))
+    return doc.get("product_title"), doc.get("product_price"), doc.get("publication_description")
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or warm the near-duplicate listing index")
+    parser.add_argument("--stats", action="store_true", help="Show index size and segment count")
+    parser.add_argument("--compact", action="store_true", help="Merge all segments into one")
+    parser.add_argument("--input", type=str, help="JSON-lines file of stored documents")
+    parser.add_argument("--firestore", action="store_true", help="Read documents from vehicles_initial")
+    parser.add_argument("--limit", type=int, default=1000, help="Max Firestore documents to read (default: 1000)")
+    parser.add_argument("--add", action="store_true", help="Index documents that are not reposts")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Similarity threshold (default: 0.8)")
+    args = parser.parse_args()
+
+    index = NearDupIndex(threshold=args.threshold)
+    if args.stats:
+        print(f"{len(index)} listings in {len(index._segment_files())} segments ({index.index_dir})")
+        return
+    if args.compact:
+        index.compact()
+        return
+
+    if args.firestore:
+        from vehicle_parser import _firestore_collection
+        _, collection = _firestore_collection()
+        documents = (snap.to_dict() for snap in collection.limit(args.limit).stream())
+    elif args.input:
+        documents = _read_jsonl(args.input)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    start = time.perf_counter()
+    for doc in documents:
+        doc_id = doc.get("publication_id")
+        if doc_id is None:
+            continue
+        title, price, description = document_fields(doc)
+        match = index.check(doc_id, title, price, description, city=doc.get("city_code"))
+        if match:
+            print(json.dumps({"publication_id": str(doc_id), "city_code": doc.get("city_code"),
+                              "near_duplicate_of": match["doc_id"], "similarity": match["similarity"],
+                              "original_city_code": match["city"]}))
+        elif args.add:
+            index.confirm(doc_id)
+    elapsed = time.perf_counter() - start
+
+    if args.add:
+        index.close()
+    print(f"{index.summary()} in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
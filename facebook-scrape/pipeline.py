@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Staged Scrape Pipeline
+
+Decouples the single browser from parsing and storage:
+
+    capture (browser, caller thread) -> parse (1 thread) -> I/O (thread pool)
+
+Stages are connected by bounded queues. When parsing or storage falls behind,
+submit() blocks the browser (backpressure) instead of letting memory grow; in
+the normal case the browser only hands a captured publication over and moves
+on to the next listing. drain() waits for everything in flight to finish,
+which is also how a KeyboardInterrupt shuts down without losing publications.
+"""
+
+import time
+import queue
+import threading
+from typing import Callable, Dict, Optional
+
+_STOP = object()
+
+
+class StageStats:
+    """Item count, errors, busy time and peak input queue depth for one stage"""
+
+    def __init__(self):
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+
+    def as_dict(self, elapsed: float) -> Dict:
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "per_minute": round(self.items / elapsed * 60, 1) if elapsed > 0 else 0.0,
+            "max_depth": self.max_depth,
+        }
+
+
+class ScrapePipeline:
+    """Bounded capture -> parse -> I/O pipeline with per-stage stats"""
+
+    def __init__(self, parse_fn: Callable, io_fn: Callable, io_workers: int = 4, queue_size: int = 16,
+                 on_drop: Optional[Callable] = None, log=print):
+        """
+        Args:
+            parse_fn: CPU stage, item -> item (or None to drop it)
+            io_fn: I/O stage, item -> None (Firestore, images, ...); runs on io_workers threads
+            io_workers: I/O thread pool size
+            queue_size: Capacity of each inter-stage queue
+            on_drop: Called with an item that parse_fn dropped or the I/O stage failed on
+            log: Logging callable
+        """
+        self.parse_fn = parse_fn
+        self.io_fn = io_fn
+        self.io_workers = max(1, io_workers)
+        self.on_drop = on_drop
+        self.log = log
+
+        self.parse_queue = queue.Queue(maxsize=queue_size)
+        self.io_queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.started = False
+        self.reset_stats()
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self.threads = [threading.Thread(target=self._parse_loop, name="pipeline-parse", daemon=True)]
+        self.threads += [threading.Thread(target=self._io_loop, name=f"pipeline-io-{i}", daemon=True)
+                         for i in range(self.io_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"capture": StageStats(), "parse": StageStats(), "io": StageStats()}
+            self.backpressure_seconds = 0.0
+            self.stats_since = time.time()
+
+    # --- capture -------------------------------------------------------------
+
+    def submit(self, item, capture_seconds: float = 0.0):
+        """Hand a captured item to the parse stage, blocking only while the pipeline is full"""
+        self.start()
+        start = time.time()
+        self.parse_queue.put(item)
+        blocked = time.time() - start
+        with self.lock:
+            stats = self.stats["capture"]
+            stats.items += 1
+            stats.busy_seconds += capture_seconds
+            self.backpressure_seconds += blocked
+            self.stats["parse"].max_depth = max(self.stats["parse"].max_depth, self.parse_queue.qsize())
+
+    def record_capture_failure(self, capture_seconds: float = 0.0):
+        with self.lock:
+            self.stats["capture"].errors += 1
+            self.stats["capture"].busy_seconds += capture_seconds
+
+    # --- worker stages -------------------------------------------------------
+
+    def _parse_loop(self):
+        while True:
+            item = self.parse_queue.get()
+            try:
+                if item is _STOP:
+                    for _ in range(self.io_workers):
+                        self.io_queue.put(_STOP)
+                    return
+                start = time.time()
+                try:
+                    result = self.parse_fn(item)
+                    error = False
+                except Exception as e:
+                    self.log(f"ERROR: Parse stage failed: {str(e)}")
+                    result, error = item, True  # store unparsed rather than lose the capture
+                self._record("parse", time.time() - start, error)
+                if result is not None:
+                    self.io_queue.put(result)
+                    with self.lock:
+                        self.stats["io"].max_depth = max(self.stats["io"].max_depth, self.io_queue.qsize())
+                else:
+                    self._dropped(item)
+            finally:
+                self.parse_queue.task_done()
+
+    def _io_loop(self):
+        while True:
+            item = self.io_queue.get()
+            try:
+                if item is _STOP:
+                    return
+                start = time.time()
+                error = False
+                try:
+                    self.io_fn(item)
+                except Exception as e:
+                    self.log(f"ERROR: I/O stage failed: {str(e)}")
+                    error = True
+                    self._dropped(item)
+                self._record("io", time.time() - start, error)
+            finally:
+                self.io_queue.task_done()
+
+    def _dropped(self, item):
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop(item)
+        except Exception as e:
+            self.log(f"WARNING: Pipeline drop callback failed: {str(e)}")
+
+    def _record(self, stage: str, seconds: float, error: bool):
+        with self.lock:
+            stats = self.stats[stage]
+            stats.items += 1
+            stats.busy_seconds += seconds
+            if error:
+                stats.errors += 1
+
+    # --- shutdown ------------------------------------------------------------
+
+    def pending(self) -> int:
+        """Items submitted but not yet fully processed"""
+        return self.parse_queue.unfinished_tasks + self.io_queue.unfinished_tasks
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every submitted item has passed the I/O stage.
+
+        Returns:
+            True if drained, False if timeout expired first
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending():
+            if deadline is not None and time.time() >= deadline:
+                self.log(f"WARNING: Pipeline drain timed out with {self.pending()} items in flight")
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Drain, then stop the worker threads"""
+        if not self.started:
+            return
+        self.drain(timeout)
+        self.parse_queue.put(_STOP)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.started = False
+
+    # --- reporting -----------------------------------------------------------
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            elapsed = time.time() - self.stats_since
+            result = {stage: stats.as_dict(elapsed) for stage, stats in self.stats.items()}
+            result["capture"]["backpressure_seconds"] = round(self.backpressure_seconds, 2)
+        result["parse"]["depth"] = self.parse_queue.qsize()
+        result["io"]["depth"] = self.io_queue.qsize()
+        return result
+
+    def summary(self) -> str:
+        """Human-readable per-stage throughput and queue depth"""
+        stats = self.get_stats()
+        lines = ["Pipeline stages:"]
+        for stage in ("capture", "parse", "io"):
+            stage_stats = stats[stage]
+            line = (f"  {stage}: n={stage_stats['items']} errors={stage_stats['errors']} "
+                    f"{stage_stats['per_minute']:.1f}/min busy={stage_stats['busy_seconds']:.1f}s")
+            if stage == "capture":
+                line += f" blocked={stage_stats['backpressure_seconds']:.1f}s"
+            else:
+                line += f" depth={stage_stats['depth']} max_depth={stage_stats['max_depth']}"
+            lines.append(line)
+        return "\n".join(lines)
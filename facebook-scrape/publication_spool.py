@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Durable Publication Spool
+
+Every scraped publication is committed to a local SQLite database (WAL mode)
+before it is handed to the Firestore sink, and removed only once the sink
+reports it written or already present. Anything Firestore did not accept -
+init_firestore failed, a batch commit errored, the process died with a
+buffer still pending - stays spooled, and a background replayer feeds it back
+through the sink when connectivity returns. The sink checks existence before
+writing, so replays are idempotent.
+
+Disk usage is bounded: once the database reaches max_bytes new publications
+are not spooled (they still go to the sink directly) until the backlog drains.
+
+Usage:
+    python publication_spool.py --stats
+    python publication_spool.py --list 20
+    python publication_spool.py --replay          # drain the backlog into Firestore now
+    python publication_spool.py --vacuum          # give freed pages back to the filesystem
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from firestore_sink import CREATED, DUPLICATE, FAILED
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SPOOL_PATH = os.path.join(SCRIPT_DIR, "state", "spool.sqlite3")
+
+# Placeholder for firestore.SERVER_TIMESTAMP, which is not JSON serializable
+SERVER_TIMESTAMP_MARKER = {"__fbm_sentinel__": "SERVER_TIMESTAMP"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS publications (
+    doc_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    city_code TEXT,
+    spooled_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+"""
+
+
+def encode_publication(publication: Dict) -> str:
+    return json.dumps({
+        key: (SERVER_TIMESTAMP_MARKER if value is firestore.SERVER_TIMESTAMP else value)
+        for key, value in publication.items()
+    }, ensure_ascii=False, default=str)
+
+
+def decode_publication(payload: str) -> Dict:
+    return {
+        key: (firestore.SERVER_TIMESTAMP if value == SERVER_TIMESTAMP_MARKER else value)
+        for key, value in json.loads(payload).items()
+    }
+
+
+class PublicationSpool:
+    """SQLite-backed write-ahead spool of publications awaiting Firestore"""
+
+    def __init__(self, path: str = DEFAULT_SPOOL_PATH, max_bytes: int = 500 * 1024 * 1024, log=print):
+        """
+        Args:
+            path: SQLite database file
+            max_bytes: Stop spooling new publications above this database size
+            log: Logging callable
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.log = log
+        self.lock = threading.Lock()
+        self.full_warned = False
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(SCHEMA)
+
+    def size_bytes(self) -> int:
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def put(self, doc_id, publication: Dict) -> bool:
+        """Durably record a publication before upload; False if the spool is full"""
+        payload = encode_publication(publication)
+        with self.lock:
+            if self.size_bytes() + len(payload) > self.max_bytes:
+                if not self.full_warned:
+                    self.log(f"WARNING: Publication spool is full ({self.max_bytes // (1024 * 1024)} MB), "
+                             f"new publications are not spooled until the backlog drains")
+                    self.full_warned = True
+                return False
+            self.full_warned = False
+            self.conn.execute(
+                "INSERT OR REPLACE INTO publications (doc_id, payload, city_code, spooled_at) VALUES (?, ?, ?, ?)",
+                (str(doc_id), payload, publication.get("city_code"), time.time()),
+            )
+        return True
+
+    def on_resolved(self, doc_id, result, publication=None):
+        """Sink listener - drop confirmed publications, count failed attempts"""
+        with self.lock:
+            if result in (CREATED, DUPLICATE):
+                self.conn.execute("DELETE FROM publications WHERE doc_id = ?", (str(doc_id),))
+            elif result == FAILED:
+                self.conn.execute("UPDATE publications SET attempts = attempts + 1, last_error = ? WHERE doc_id = ?",
+                                  ("upload failed", str(doc_id)))
+
+    def backlog(self, limit: int = 100, older_than: float = 0.0) -> List[Tuple[str, Dict]]:
+        """Oldest spooled publications first, skipping those spooled in the last older_than seconds"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT doc_id, payload FROM publications WHERE spooled_at <= ? ORDER BY spooled_at LIMIT ?",
+                (time.time() - older_than, limit),
+            ).fetchall()
+        return [(doc_id, decode_publication(payload)) for doc_id, payload in rows]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            count, oldest, failed_attempts = self.conn.execute(
+                "SELECT COUNT(*), MIN(spooled_at), COALESCE(SUM(attempts), 0) FROM publications"
+            ).fetchone()
+            by_city = self.conn.execute(
+                "SELECT COALESCE(city_code, '?'), COUNT(*) FROM publications GROUP BY city_code ORDER BY 2 DESC"
+            ).fetchall()
+            size = self.size_bytes()
+        return {
+            "pending": count,
+            "oldest_age_seconds": round(time.time() - oldest) if oldest else 0,
+            "failed_attempts": failed_attempts,
+            "size_bytes": size,
+            "by_city": dict(by_city),
+        }
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM publications").fetchone()[0]
+
+    def vacuum(self):
+        with self.lock:
+            self.conn.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SpoolReplayer:
+    """Background thread that re-submits spooled publications through the sink"""
+
+    def __init__(self, spool: PublicationSpool, sink, interval: float = 60, batch_size: int = 100,
+                 grace_seconds: float = 120, reconnect: Optional[Callable[[], bool]] = None, live_sink=None,
+                 log=print):
+        """
+        Args:
+            spool: Spool to drain
+            sink: FirestoreSink the publications are replayed through - a separate instance from the
+                  scraper's, so replayed results stay out of per-job and per-city counts
+            interval: Seconds between replay passes
+            batch_size: Publications replayed per pass
+            grace_seconds: Leave recently spooled publications alone (they are still on their first attempt)
+            reconnect: Called when the sink has no database; returns True once Firestore is available
+            live_sink: The scraper's sink; publications still buffered there are not replayed
+            log: Logging callable
+        """
+        self.spool = spool
+        self.sink = sink
+        self.interval = interval
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self.reconnect = reconnect
+        self.live_sink = live_sink
+        self.log = log
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.replayed = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(self.interval)
+            self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.replay_once()
+            except Exception as e:
+                self.log(f"WARNING: Spool replay failed: {str(e)}")
+
+    def replay_once(self, older_than: Optional[float] = None) -> int:
+        """Replay one batch; returns the number of publications confirmed in Firestore"""
+        if not self.sink.db:
+            if not (self.reconnect and self.reconnect()):
+                return 0
+
+        grace = self.grace_seconds if older_than is None else older_than
+        pending_ids = set()
+        for sink in (self.sink, self.live_sink):
+            if sink is not None:
+                with sink.lock:
+                    pending_ids.update(sink.pending)
+        batch = [(doc_id, pub) for doc_id, pub in self.spool.backlog(self.batch_size, grace)
+                 if doc_id not in pending_ids]
+        if not batch:
+            return 0
+
+        for doc_id, publication in batch:
+            self.sink.add(doc_id, publication)
+        resolved = self.sink.flush()
+        confirmed = sum(1 for _, result in resolved if result in (CREATED, DUPLICATE))
+        self.replayed += confirmed
+        self.log(f"INFO: Replayed {len(batch)} spooled publications ({confirmed} confirmed, {len(self.spool)} left)")
+        return confirmed
+
+    def drain(self) -> int:
+        """Replay until the backlog is empty or a pass makes no progress"""
+        total = 0
+        while len(self.spool):
+            confirmed = self.replay_once(older_than=0)
+            if not confirmed:
+                break
+            total += confirmed
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay the local publication spool")
+    parser.add_argument("--path", type=str, default=DEFAULT_SPOOL_PATH, help="Spool database")
+    parser.add_argument("--stats", action="store_true", help="Print backlog statistics")
+    parser.add_argument("--list", type=int, metavar="N", help="Show the N oldest spooled publications")
+    parser.add_argument("--replay", action="store_true", help="Drain the backlog into Firestore")
+    parser.add_argument("--vacuum", action="store_true", help="Compact the database file")
+    args = parser.parse_args()
+
+    spool = PublicationSpool(args.path)
+
+    if args.list:
+        for doc_id, publication in spool.backlog(args.list):
+            print(f"{doc_id}  {publication.get('city_code')}  {(publication.get('publicationText') or '')[:60]!r}")
+
+    if args.replay:
+        from index import firestore_client
+        from firestore_sink import FirestoreSink
+
+        db = firestore_client()
+        if not db:
+            sys.exit(1)
+        sink = FirestoreSink(db, flush_size=100)
+        sink.add_listener(spool.on_resolved)
+        replayer = SpoolReplayer(spool, sink)
+        print(f"SUCCESS: Replayed {replayer.drain()} publications, {len(spool)} left in spool")
+
+    if args.vacuum:
+        spool.vacuum()
+
+    if args.stats or not (args.list or args.replay or args.vacuum):
+        stats = spool.stats()
+        print(f"Spool: {args.path}")
+        print(f"  Pending publications: {stats['pending']}")
+        print(f"  Oldest: {stats['oldest_age_seconds']}s ago")
+        print(f"  Failed upload attempts: {stats['failed_attempts']}")
+        print(f"  Size: {stats['size_bytes'] / (1024 * 1024):.1f} MB")
+        for city, count in stats["by_city"].items():
+            print(f"    {city}: {count}")
+
+    spool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -24,11 +24,17 @@ import traceback
 
 # Import the scraper and coordinator
 from index import fbm_scraper, get_or_create_profile, test_proxy
-from coordinator_client import CoordinatorClient
+from coordinator_client import CoordinatorClient, JobProgress
+from job_prefetch import JobPrefetcher
+from scraper_logging import configure_logging
 
 
 def run_coordinator_mode(vps_id: str, proxy: str = None, headless: bool = False,
-                         continuous: bool = True, wait_time: int = 300):
+                         continuous: bool = True, wait_time: int = 300,
+                         flush_size: int = 20, flush_interval: float = 30,
+                         incremental_crawl: bool = True, known_run_limit: int = 20,
+                         prefetch_remaining: int = 10, min_poll: float = 15, warm_spare: bool = False,
+                         near_dup: str = "flag"):
     """
     Run the scraper in coordinator mode.
 
@@ -37,7 +43,15 @@ def run_coordinator_mode(vps_id: str, proxy: str = None, headless: bool = False,
         proxy: Proxy string in format username:password@host:port
         headless: Run browser in headless mode
         continuous: Keep running and requesting new jobs
-        wait_time: Seconds to wait when no jobs available (default 5 minutes)
+        wait_time: Max seconds between polls when no jobs are available (default 5 minutes)
+        flush_size: Publications buffered before a Firestore batch write
+        flush_interval: Max seconds a publication stays buffered before being written
+        incremental_crawl: Stop scrolling once a run of already-seen listings is reached
+        known_run_limit: Consecutive already-seen listings that end an incremental crawl
+        prefetch_remaining: Lease the next job once this many listings of the current city remain
+        min_poll: Seconds before the first re-poll when no jobs are available
+        warm_spare: Launch the replacement browser in the background before a planned restart
+        near_dup: What to do with reposts of stored listings - "flag", "skip" or "off"
     """
     print(f"\n{'='*70}")
     print(f"COORDINATOR MODE - VPS: {vps_id}")
@@ -47,8 +61,10 @@ def run_coordinator_mode(vps_id: str, proxy: str = None, headless: bool = False,
     print(f"Continuous: {continuous}")
     print(f"{'='*70}\n")
 
-    # Initialize coordinator client
+    # Initialize coordinator client; the next job is leased in the background near the end of each city
     coordinator = CoordinatorClient(vps_id)
+    prefetcher = JobPrefetcher(coordinator, min_poll=min_poll, max_poll=wait_time)
+    prefetcher.start()
 
     # Test proxy if provided
     if proxy:
@@ -60,136 +76,204 @@ def run_coordinator_mode(vps_id: str, proxy: str = None, headless: bool = False,
     worker = None
     profile = get_or_create_profile()
 
-    while True:
-        try:
-            # Request job from coordinator
-            job = coordinator.get_job()
+    try:
+        while True:
+            progress = None
+            try:
+                # Take the prefetched job, or wait for one (adaptive polling happens in the prefetcher)
+                job = prefetcher.next_job(wait=continuous)
 
-            if not job:
-                if continuous:
-                    print(f"\nNo jobs available. Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
-                    continue
-                else:
+                if not job:
                     print("No jobs available and not in continuous mode. Exiting.")
                     break
 
-            city = job['city']
-            state = job['state']
-            job_id = job['jobId']
-
-            print(f"\n{'='*60}")
-            print(f"STARTING JOB: {city}, {state}")
-            print(f"Job ID: {job_id}")
-            print(f"{'='*60}\n")
-
-            # Report job started
-            coordinator.report_in_progress()
-
-            start_time = time.time()
-
-            # Initialize or update worker
-            if worker is None:
-                print(f"Creating new browser instance for {city}")
-                worker = fbm_scraper(
-                    city_code=city,
-                    profile=profile,
-                    proxy=proxy,
-                    threshold=500,  # Max listings per city
-                    headless=headless,
-                    block_images=True,
-                    restart_interval_minutes=180
-                )
-            else:
-                print(f"Reusing browser for {city}")
-                worker.update_account_settings(city, "", "")  # No login needed
-                worker.threshold = 500
-
-            # Execute scraping
-            worker.execute_scrap_process()
-
-            # Process scraped links
-            total_found = len(worker.links)
-            new_listings = 0
-            duplicates = 0
-            failed = 0
-
-            print(f"\nProcessing {total_found} listings...")
-
-            profile_counter = 0
-            for product_id, link in worker.links.items():
-                try:
-                    publication = worker.scrap_link(link)
+                city = job['city']
+                state = job['state']
+                job_id = job['jobId']
+
+                print(f"\n{'='*60}")
+                print(f"STARTING JOB: {city}, {state}")
+                print(f"Job ID: {job_id}")
+                print(f"{'='*60}\n")
+
+                # Report job started, then keep the lease alive with partial progress
+                coordinator.report_in_progress()
+                progress = JobProgress(job)
+                if progress.resumed:
+                    print(f"Resuming interrupted job: {progress.processed} listings already processed "
+                          f"({len(progress.done_ids)} in resume cursor)")
+                coordinator.start_heartbeat(progress)
+
+                start_time = time.time()
+
+                # Initialize or update worker
+                if worker is None:
+                    print(f"Creating new browser instance for {city}")
+                    worker = fbm_scraper(
+                        city_code=city,
+                        profile=profile,
+                        proxy=proxy,
+                        threshold=500,  # Max listings per city
+                        headless=headless,
+                        block_images=True,
+                        restart_interval_minutes=180,
+                        sink_flush_size=flush_size,
+                        sink_flush_interval=flush_interval,
+                        incremental_crawl=incremental_crawl,
+                        known_run_limit=known_run_limit,
+                        warm_spare=warm_spare,
+                        near_dup=near_dup
+                    )
+                else:
+                    print(f"Reusing browser for {city}")
+                    worker.update_account_settings(city, "", "")  # No login needed
+                    worker.threshold = 500
+
+                # Resolved publications advance the resume cursor reported by the heartbeat
+                worker.sink.add_listener(progress.record)
+                worker.resume_ids = set(progress.done_ids)
+
+                # Between jobs is a safe point for a pending browser restart
+                worker.lifecycle.maybe_restart()
+
+                # Before link collection, so the marketplace load and scroll waits are in this job's summary
+                worker.waits.reset()
+                worker.command_budget.reset()
+
+                # Execute scraping
+                worker.execute_scrap_process()
+
+                # Process scraped links (already-ingested and resumed ones were dropped)
+                total_found = worker.links_found
+
+                print(f"\nProcessing {len(worker.links)} of {total_found} listings...")
+
+                profile_counter = 0
+                worker.sink.reset_counts()
+                worker.seller_cache.reset_stats()
+                worker.trim_report.reset()
+                if worker.near_dup:
+                    worker.near_dup.reset_stats()
+                worker.pipeline.reset_stats()
+                remaining = len(worker.links)
+                for product_id, link in worker.links.items():
+                    remaining -= 1
+                    if remaining < prefetch_remaining:
+                        prefetcher.prefetch()
+                    try:
+                        # No scrape is in flight here - restart the browser if a lifecycle trigger fired
+                        worker.lifecycle.maybe_restart()
+
+                        # The browser only captures; parsing and upload run in the pipeline
+                        capture_start = time.time()
+                        publication = worker.scrap_link(link, enrich=False)
+
+                        if publication is None:
+                            worker.pipeline.record_capture_failure(time.time() - capture_start)
+                            worker.checkpoint.mark_failed(city, product_id)
+                            progress.record_failure()
+                            continue
+
+                        worker.pipeline.submit(publication, time.time() - capture_start)
+                        profile_counter += 1
 
-                    if publication is None:
-                        failed += 1
+                        # Break every 15 profiles
+                        if profile_counter % 15 == 0 and profile_counter > 0:
+                            worker.print_and_log(f"Taking 2-minute break after {profile_counter} profiles...")
+                            for chunk in range(2):
+                                worker.random_activity_during_break()
+                                worker.waits.pause("break", 30)
+
+                    except Exception as e:
+                        worker.print_and_log(f"ERROR processing {product_id}: {str(e)}")
+                        worker.checkpoint.mark_failed(city, product_id)
+                        progress.record_failure()
                         continue
 
-                    # Check if upload was successful (returns True for both new and duplicates)
-                    success = worker.upload_to_firestore(publication["publication_id"], publication)
-
-                    if success:
-                        # Check if it was a duplicate by looking at the log message pattern
-                        # The upload_to_firestore function logs "SKIP:" for duplicates
-                        # We need to track this differently
-                        new_listings += 1  # For now, count all successes
-                        profile_counter += 1
-                    else:
-                        failed += 1
-
-                    # Break every 15 profiles
-                    if profile_counter % 15 == 0 and profile_counter > 0:
-                        worker.print_and_log(f"Taking 2-minute break after {profile_counter} profiles...")
-                        for chunk in range(2):
-                            worker.random_activity_during_break()
-                            time.sleep(30)
-
-                    time.sleep(0.5)
-
-                except Exception as e:
-                    worker.print_and_log(f"ERROR processing {product_id}: {str(e)}")
-                    failed += 1
-                    continue
-
-            # Calculate duration
-            duration = time.time() - start_time
-
-            # Report completion
-            # Note: In the current implementation, we're counting all successful uploads as new
-            # The scraper logs duplicates but doesn't expose a counter for them
-            # TODO: Update scraper to track duplicate count separately
-            coordinator.report_completed(
-                listings_found=total_found,
-                new_listings=new_listings,
-                duplicates_skipped=duplicates,
-                duration_seconds=duration
-            )
-
-            # Brief pause before next job
-            print(f"\nJob completed. Waiting 30 seconds before next job...")
-            time.sleep(30)
-
-        except KeyboardInterrupt:
-            print("\n\nShutdown requested. Cleaning up...")
-            if worker:
-                try:
-                    worker.browser.quit()
-                except:
-                    pass
-            break
-
-        except Exception as e:
-            print(f"\nCRITICAL ERROR: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
-
-            # Report failure to coordinator
-            if coordinator.current_job:
-                coordinator.report_failed(str(e))
-
-            # Wait before retrying
-            print(f"Waiting 60 seconds before retrying...")
-            time.sleep(60)
-
+                # Also covers cities where no listings were left to process
+                prefetcher.prefetch()
+
+                # Finish the pipeline and write whatever is still buffered; totals include work done before a resume
+                worker.pipeline.drain()
+                worker.sink.flush()
+                worker.complete_city(city)
+                worker.sink.reset_counts()
+                coordinator.stop_heartbeat()
+                worker.sink.remove_listener(progress.record)
+                new_listings = progress.created
+                duplicates = progress.duplicates + worker.known_links_skipped
+
+                cache_hits, cache_misses = worker.seller_cache.reset_stats()
+                cache_lookups = cache_hits + cache_misses
+                worker.print_and_log(f"Seller cache hit rate for {city}: "
+                                     f"{(cache_hits / cache_lookups * 100) if cache_lookups else 0:.1f}% ({cache_hits}/{cache_lookups})")
+                worker.seller_cache.save()
+                worker.print_and_log(worker.waits.summary())
+                worker.print_and_log(worker.command_budget.summary())
+                worker.print_and_log(worker.trim_report.summary())
+                if worker.near_dup:
+                    worker.print_and_log(worker.near_dup.summary())
+                    worker.near_dup.flush()
+                worker.print_and_log(worker.pipeline.summary())
+                worker.print_and_log(worker.lifecycle.summary())
+
+                # Calculate duration
+                duration = time.time() - start_time
+
+                # Report completion
+                coordinator.report_completed(
+                    listings_found=total_found,
+                    new_listings=new_listings,
+                    duplicates_skipped=duplicates,
+                    duration_seconds=duration
+                )
+                worker.print_and_log(coordinator.stats_summary())
+                worker.print_and_log(prefetcher.idle_summary())
+
+            except KeyboardInterrupt:
+                print("\n\nShutdown requested. Cleaning up...")
+                prefetcher.stop()
+                if worker:
+                    try:
+                        worker.pipeline.drain(timeout=120)
+                        worker.sink.flush()
+                    except Exception:
+                        pass
+                # Leave the job in progress with an up-to-date cursor; it is re-leased once heartbeats stop
+                coordinator.stop_heartbeat()
+                if progress and coordinator.current_job:
+                    coordinator.report_progress(progress)
+                if worker:
+                    try:
+                        worker.browser.quit()
+                    except:
+                        pass
+                break
+
+            except Exception as e:
+                print(f"\nCRITICAL ERROR: {str(e)}")
+                print(f"Traceback: {traceback.format_exc()}")
+
+                # Report failure to coordinator; a failed city is retried from scratch, here and on the server
+                coordinator.stop_heartbeat()
+                if worker and progress:
+                    try:
+                        worker.pipeline.drain(timeout=120)
+                        worker.sink.flush()
+                    except Exception:
+                        pass
+                    worker.sink.remove_listener(progress.record)
+                    worker.checkpoint.discard_city(city)
+                if coordinator.current_job:
+                    coordinator.report_failed(str(e))
+
+                # Wait before retrying
+                print(f"Waiting 60 seconds before retrying...")
+                time.sleep(60)
+    finally:
+        prefetcher.stop()
+        if worker:
+            worker.close()
     print("\nScraper shutdown complete.")
 
 
@@ -243,11 +327,74 @@ Examples:
         '--wait-time',
         type=int,
         default=300,
-        help='Seconds to wait when no jobs available (default: 300)'
+        help='Max seconds between polls when no jobs are available (default: 300)'
+    )
+
+    parser.add_argument(
+        '--min-poll',
+        type=float,
+        default=15,
+        help='Seconds before the first re-poll when no jobs are available; doubles up to --wait-time (default: 15)'
+    )
+
+    parser.add_argument(
+        '--prefetch-remaining',
+        type=int,
+        default=10,
+        help='Lease the next job once this many listings of the current city remain (default: 10)'
+    )
+
+    parser.add_argument(
+        '--flush-size',
+        type=int,
+        default=20,
+        help='Publications buffered before a Firestore batch write (default: 20)'
+    )
+
+    parser.add_argument(
+        '--flush-interval',
+        type=float,
+        default=30,
+        help='Max seconds a publication stays buffered before being written (default: 30)'
+    )
+
+    parser.add_argument(
+        '--full-crawl',
+        action='store_true',
+        help='Always scroll to the listing threshold instead of stopping at already-seen listings'
+    )
+
+    parser.add_argument(
+        '--known-run',
+        type=int,
+        default=20,
+        help='Consecutive already-seen listings that end an incremental crawl (default: 20)'
+    )
+
+    parser.add_argument(
+        '--warm-spare',
+        action='store_true',
+        help='Launch the replacement browser in the background before a planned restart (needs SE_NODE_MAX_SESSIONS=2 with Remote WebDriver)'
+    )
+
+    parser.add_argument(
+        '--near-dup',
+        choices=['flag', 'skip', 'off'],
+        default='flag',
+        help='Reposts of stored listings under a new ID: upload with nearDuplicateOf and no profile visit (flag), do not upload (skip), or no check (default: flag)'
+    )
+
+    parser.add_argument(
+        '--log-format',
+        choices=['text', 'json'],
+        default='text',
+        help='scraper.log format: plain text or JSON lines with structured fields (default: text)'
     )
 
     args = parser.parse_args()
 
+    configure_logging(fmt=args.log_format)
+
     # Validate environment
     if not os.environ.get('INTERNAL_API_SECRET'):
         print("ERROR: INTERNAL_API_SECRET environment variable not set")
@@ -265,7 +412,15 @@ Examples:
         proxy=proxy,
         headless=args.headless,
         continuous=not args.once,
-        wait_time=args.wait_time
+        wait_time=args.wait_time,
+        flush_size=args.flush_size,
+        flush_interval=args.flush_interval,
+        incremental_crawl=not args.full_crawl,
+        known_run_limit=args.known_run,
+        prefetch_remaining=args.prefetch_remaining,
+        min_poll=args.min_poll,
+        warm_spare=args.warm_spare,
+        near_dup=args.near_dup
     )
 
 
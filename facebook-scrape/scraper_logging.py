@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Buffered Scraper Logging
+
+Log records are printed immediately but written to disk by a background thread:
+- Bounded queue between callers and the writer (records are dropped, and
+  counted, rather than blocking the scrape when the disk stalls)
+- Batched writes and flushes instead of open/append/close per message
+- Size- and time-based rotation (scraper.log -> scraper.log.1 -> ...)
+- Optional JSON-lines format with structured fields
+  (city_code, publication_id, stage, duration_ms)
+
+fbm_scraper.print_and_log stays a thin wrapper around ScraperLogger.log.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import datetime
+import threading
+from typing import Optional
+
+DEFAULT_LOG_FILE = "scraper.log"
+LEVEL_PREFIXES = ("CRITICAL ERROR", "CRITICAL", "ERROR", "WARNING", "SUCCESS", "SKIP", "SUMMARY", "DEBUG", "INFO")
+
+
+def _level_of(message: str) -> str:
+    """Level from the existing 'LEVEL: message' convention"""
+    head = message.lstrip()[:20].upper()
+    for prefix in LEVEL_PREFIXES:
+        if head.startswith(prefix):
+            return prefix
+    return "INFO"
+
+
+class ScraperLogger:
+    """Console + file logger with a background writer thread"""
+
+    def __init__(self, path: str = DEFAULT_LOG_FILE, fmt: str = "text", max_bytes: int = 50 * 1024 * 1024,
+                 backup_count: int = 5, rotate_hours: Optional[float] = 24, queue_size: int = 10000,
+                 batch_size: int = 200, flush_interval: float = 1.0, echo: bool = True):
+        """
+        Args:
+            path: Log file path
+            fmt: "text" ([timestamp] message) or "json" (one JSON object per line)
+            max_bytes: Rotate once the file would exceed this size
+            backup_count: Rotated files to keep
+            rotate_hours: Also rotate after this many hours (None disables)
+            queue_size: Max records waiting for the writer
+            batch_size: Max records written per batch
+            flush_interval: Max seconds a record waits before being written
+            echo: Print records to the console as well
+        """
+        self.path = path
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_seconds = rotate_hours * 3600 if rotate_hours else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.echo = echo
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.file = None
+        self.opened_at = 0.0
+        self.closed = False
+
+        self.writer = threading.Thread(target=self._run, name="scraper-log-writer", daemon=True)
+        self.writer.start()
+
+    def log(self, message: str, **fields):
+        """Print the message and queue it for the log file"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        human_readable_time = now.strftime('%Y-%m-%d %H:%M:%S')
+
+        if self.echo:
+            print(f"[{human_readable_time}] {message}")
+
+        if self.fmt == "json":
+            record = {"ts": now.isoformat(timespec="milliseconds"), "level": _level_of(message), "message": message}
+            record.update({key: value for key, value in fields.items() if value is not None})
+            line = json.dumps(record, ensure_ascii=False, default=str)
+        else:
+            line = f"[{human_readable_time}] {message}"
+
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    # --- writer thread -----------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self.closed:
+                    return
+                continue
+            if first is None:
+                return
+
+            lines = [first]
+            stop = False
+            while len(lines) < self.batch_size:
+                try:
+                    line = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if line is None:
+                    stop = True
+                    break
+                lines.append(line)
+
+            self._write(lines)
+            if stop:
+                return
+
+    def _write(self, lines):
+        data = "\n".join(lines) + "\n"
+        try:
+            self._maybe_rotate(len(data.encode("utf-8")))
+            if self.file is None:
+                self._open()
+            self.file.write(data)
+            self.file.flush()
+        except Exception as e:
+            print(f"WARNING: Could not write to log file: {str(e)}")
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.opened_at = time.time()
+
+    def _maybe_rotate(self, incoming_bytes):
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return
+            self._open()
+        size = self.file.tell()
+        too_big = self.max_bytes and size + incoming_bytes > self.max_bytes and size > 0
+        too_old = self.rotate_seconds and time.time() - self.opened_at >= self.rotate_seconds and size > 0
+        if not (too_big or too_old):
+            return
+
+        self.file.close()
+        self.file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self, timeout: float = 5.0):
+        """Write everything still queued and stop the writer"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.writer.join(timeout)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.dropped:
+            print(f"WARNING: {self.dropped} log records were dropped because the log queue was full")
+
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def configure_logging(**options) -> ScraperLogger:
+    """Replace the shared logger (call once at startup, before the scraper logs anything)"""
+    global _logger
+    with _logger_lock:
+        if _logger is not None:
+            _logger.close()
+        _logger = ScraperLogger(**options)
+        return _logger
+
+
+def get_logger() -> ScraperLogger:
+    """Shared logger, created with defaults on first use"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = ScraperLogger()
+        return _logger
+
+
+@atexit.register
+def _close_shared_logger():
+    if _logger is not None:
+        _logger.close()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Persistent Seen-Publication Index
+
+Compact on-disk set of publication IDs that are already in Firestore, consulted
+right after link collection so known listings never get a browser visit.
+
+Layout of the index directory:
+    ids.bin      Sorted uint64 array (native byte order), memory-mapped for binary search
+    bloom.bin    Bloom filter in front of ids.bin (header + bit array)
+    pending.log  Append-only uint64 log of IDs added since the last compaction
+
+Usage:
+    python seen_index.py --stats
+    python seen_index.py --import ids_export.txt     # one ID per line / CSV / JSON list
+    python seen_index.py --from-firestore            # warm start from vehicles_initial
+    python seen_index.py --check 2780589125467956
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import bisect
+import argparse
+import threading
+from array import array
+from typing import Iterable, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_DIR = os.path.join(SCRIPT_DIR, "state", "seen_index")
+
+IDS_FILE = "ids.bin"
+BLOOM_FILE = "bloom.bin"
+PENDING_FILE = "pending.log"
+
+BLOOM_MAGIC = b"FBMBLOOM"
+BLOOM_HEADER = struct.Struct("<8sQQQ")  # magic, bit count, hash count, capacity
+BLOOM_HASHES = 7
+BLOOM_BITS_PER_ID = 10  # ~1% false positive rate with 7 hashes
+MIN_BLOOM_CAPACITY = 100000
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _mix64(x):
+    """splitmix64 finalizer - spreads sequential publication IDs over the bit array"""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit integers using double hashing"""
+
+    def __init__(self, capacity: int, num_hashes: int = BLOOM_HASHES, bits: Optional[bytearray] = None):
+        self.capacity = max(int(capacity), MIN_BLOOM_CAPACITY)
+        self.num_hashes = num_hashes
+        self.num_bits = self.capacity * BLOOM_BITS_PER_ID
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, value):
+        h = _mix64(value & MASK64)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        bits = self.bits
+        for pos in self._positions(value):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.num_bits, self.num_hashes, self.capacity))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved filter, or return None if the file is missing or corrupt"""
+        try:
+            with open(path, "rb") as f:
+                magic, num_bits, num_hashes, capacity = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        bloom = cls(capacity, num_hashes, bits)
+        if magic != BLOOM_MAGIC or bloom.num_bits != num_bits or len(bits) != (num_bits + 7) // 8:
+            return None
+        return bloom
+
+
+class SeenIndex:
+    """Set of already-ingested publication IDs that survives process restarts"""
+
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, compact_threshold: int = 5000):
+        """
+        Args:
+            index_dir: Directory holding ids.bin, bloom.bin and pending.log
+            compact_threshold: Pending IDs that trigger a merge into ids.bin
+        """
+        self.index_dir = index_dir
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+
+        self._mmap = None
+        self._view = None
+        self._sorted = None  # memoryview of uint64 over the mmap
+        self.pending = set()
+        self._pending_file = None
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    # --- persistence -------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        self._open_sorted()
+
+        # Replay IDs added since the last compaction; ignore a torn trailing record
+        pending_path = self._path(PENDING_FILE)
+        if os.path.exists(pending_path):
+            with open(pending_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % 8
+            self.pending = set(array("Q", data[:usable])) if usable else set()
+
+        bloom = BloomFilter.load(self._path(BLOOM_FILE))
+        if bloom is None or bloom.capacity < self.sorted_count() + len(self.pending):
+            bloom = self._build_bloom()
+        else:
+            for pid in self.pending:
+                bloom.add(pid)
+        self.bloom = bloom
+
+        self._pending_file = open(pending_path, "ab")
+
+    def _open_sorted(self):
+        self._close_sorted()
+        ids_path = self._path(IDS_FILE)
+        if os.path.exists(ids_path) and os.path.getsize(ids_path) >= 8:
+            with open(ids_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            usable = len(self._mmap) - len(self._mmap) % 8
+            self._view = memoryview(self._mmap)[:usable]
+            self._sorted = self._view.cast("Q")
+
+    def _close_sorted(self):
+        # Every exported view has to be released before the mmap can close
+        if self._sorted is not None:
+            self._sorted.release()
+            self._view.release()
+            self._sorted = None
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _build_bloom(self, extra_capacity=0):
+        total = self.sorted_count() + len(self.pending)
+        bloom = BloomFilter(max(2 * total, total + extra_capacity))
+        if self._sorted is not None:
+            for pid in self._sorted:
+                bloom.add(pid)
+        for pid in self.pending:
+            bloom.add(pid)
+        return bloom
+
+    def compact(self):
+        """Merge pending IDs into the sorted file and persist the Bloom filter"""
+        with self.lock:
+            if self.pending:
+                merged = array("Q", self._sorted if self._sorted is not None else [])
+                merged.extend(self.pending)
+                merged = array("Q", sorted(set(merged)))
+
+                tmp_path = self._path(IDS_FILE) + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    merged.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # The mmap must be released before the file can be replaced on Windows
+                self._close_sorted()
+                os.replace(tmp_path, self._path(IDS_FILE))
+                self._open_sorted()
+
+                self._pending_file.close()
+                self._pending_file = open(self._path(PENDING_FILE), "wb")
+                self.pending = set()
+
+            if self.sorted_count() > self.bloom.capacity:
+                self.bloom = self._build_bloom()
+            self.bloom.save(self._path(BLOOM_FILE))
+
+    def close(self):
+        """Compact and release file handles"""
+        with self.lock:
+            self.compact()
+            self._pending_file.close()
+            self._close_sorted()
+
+    # --- queries -----------------------------------------------------------
+
+    def sorted_count(self):
+        return len(self._sorted) if self._sorted is not None else 0
+
+    def __len__(self):
+        return self.sorted_count() + len(self.pending)
+
+    def __contains__(self, publication_id):
+        try:
+            pid = int(publication_id)
+        except (TypeError, ValueError):
+            return False
+        with self.lock:
+            if pid not in self.bloom:
+                return False
+            if pid in self.pending:
+                return True
+            if self._sorted is None:
+                return False
+            pos = bisect.bisect_left(self._sorted, pid)
+            return pos < len(self._sorted) and self._sorted[pos] == pid
+
+    # --- updates -----------------------------------------------------------
+
+    def add(self, publication_id):
+        """Record one ingested publication ID"""
+        self.add_many([publication_id])
+
+    def add_many(self, publication_ids: Iterable):
+        """Record ingested publication IDs, compacting when the pending log grows large"""
+        with self.lock:
+            new_ids = array("Q")
+            for publication_id in publication_ids:
+                try:
+                    pid = int(publication_id)
+                except (TypeError, ValueError):
+                    continue
+                if pid < 0 or pid > MASK64 or pid in self:
+                    continue
+                self.pending.add(pid)
+                self.bloom.add(pid)
+                new_ids.append(pid)
+
+            if new_ids:
+                new_ids.tofile(self._pending_file)
+                self._pending_file.flush()
+
+            if len(self.pending) >= self.compact_threshold:
+                self.compact()
+            return len(new_ids)
+
+    def import_ids(self, publication_ids: Iterable):
+        """Bulk warm start - merges straight into the sorted file"""
+        with self.lock:
+            ids = set()
+            for publication_id in publication_ids:
+                try:
+                    ids.add(int(publication_id))
+                except (TypeError, ValueError):
+                    continue
+            ids.update(self.pending)
+            self.pending = ids
+            self.bloom = self._build_bloom(extra_capacity=len(ids))
+            self.compact()
+            return len(self)
+
+
+def read_id_export(path):
+    """Yield publication IDs from an export file (JSON list, CSV or one ID per line)"""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            for value in json.load(f):
+                yield value
+            return
+        for line in f:
+            value = line.strip().split(",")[0].strip().strip('"')
+            if value.isdigit():
+                yield value
+
+
+def firestore_ids(collection="vehicles_initial"):
+    """Yield document IDs from Firestore without fetching document bodies"""
+    from index import firestore_client
+
+    db = firestore_client()
+    if not db:
+        sys.exit(1)
+    for snapshot in db.collection(collection).select([]).stream():
+        yield snapshot.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local seen-publication index")
+    parser.add_argument("--index-dir", type=str, default=DEFAULT_INDEX_DIR, help="Index directory")
+    parser.add_argument("--import", dest="import_path", type=str, help="Warm start from an ID export file")
+    parser.add_argument("--from-firestore", action="store_true", help="Warm start from the vehicles_initial collection")
+    parser.add_argument("--check", type=str, help="Check whether a publication ID is known")
+    parser.add_argument("--stats", action="store_true", help="Print index statistics")
+    args = parser.parse_args()
+
+    index = SeenIndex(args.index_dir)
+
+    if args.import_path:
+        count = index.import_ids(read_id_export(args.import_path))
+        print(f"SUCCESS: Index now holds {count} publication IDs")
+    if args.from_firestore:
+        count = index.import_ids(firestore_ids())
+        print(f"SUCCESS: Index now holds {count} publication IDs")
+    if args.check:
+        print(f"{args.check}: {'KNOWN' if args.check in index else 'NEW'}")
+    if args.stats or not (args.import_path or args.from_firestore or args.check):
+        print(f"Index directory: {args.index_dir}")
+        print(f"  Sorted IDs: {index.sorted_count()}")
+        print(f"  Pending IDs: {len(index.pending)}")
+        print(f"  Bloom capacity: {index.bloom.capacity}")
+
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
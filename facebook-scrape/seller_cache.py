@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Seller Profile Cache
+
+Dealers post dozens of vehicles per city, so the same seller profile would be
+opened again for every listing. The cache maps a seller (profile ID, or the
+profile URL when no ID can be parsed) to its trimmed dealership text, with a
+TTL and LRU eviction. It is persisted as JSON so it is shared across cities
+and process restarts.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_FILE = os.path.join(SCRIPT_DIR, "state", "seller_cache.json")
+
+PROFILE_ID_PATTERNS = [
+    re.compile(r"/marketplace/profile/(\d+)"),
+    re.compile(r"profile\.php\?(?:.*&)?id=(\d+)"),
+    re.compile(r"/user/(\d+)"),
+]
+
+
+def seller_key(profile_url: Optional[str]) -> Optional[str]:
+    """Stable cache key for a seller profile link"""
+    if not profile_url:
+        return None
+    for pattern in PROFILE_ID_PATTERNS:
+        match = pattern.search(profile_url)
+        if match:
+            return match.group(1)
+    return profile_url.split("?")[0].rstrip("/") or None
+
+
+class SellerCache:
+    """Persistent TTL + LRU cache of seller profile text"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, ttl_hours: float = 72, max_entries: int = 20000,
+                 save_every: int = 25):
+        """
+        Args:
+            path: JSON file holding the cache
+            ttl_hours: Entries older than this are refetched
+            max_entries: Least recently used entries beyond this are evicted
+            save_every: Persist after this many new entries
+        """
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Stored least recently used first
+            for key, entry in data.get("entries", []):
+                self.entries[key] = entry
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not read seller cache from {self.path}: {str(e)}")
+
+    def save(self):
+        """Write the cache to disk atomically"""
+        with self.lock:
+            data = {"entries": list(self.entries.items())}
+            self.unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"WARNING: Could not save seller cache: {str(e)}")
+
+    def get(self, profile_url: Optional[str]) -> Optional[str]:
+        """Cached dealership text for this seller, or None on a miss/expired entry"""
+        key = seller_key(profile_url)
+        if not key:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry["fetched_at"] <= self.ttl_seconds:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry["text"]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, profile_url: Optional[str], text: str):
+        """Store trimmed dealership text for this seller"""
+        key = seller_key(profile_url)
+        if not key or not text:
+            return
+        with self.lock:
+            self.entries[key] = {"text": text, "fetched_at": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.unsaved += 1
+            should_save = self.unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return (self.hits / lookups) if lookups else 0.0
+
+    def reset_stats(self):
+        """Return (hits, misses) since the last reset and zero them"""
+        with self.lock:
+            stats = (self.hits, self.misses)
+            self.hits = 0
+            self.misses = 0
+        return stats
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Offline Vehicle Attribute Extractor
+
+Marketplace renders the vehicle attribute rows (mileage, transmission, colors,
+owners, title status, ...) as an icon from a shared sprite sheet next to the
+row text; the sprite's background-position identifies which attribute a row
+is. This module pulls those rows out of one page_source snapshot with lxml, in
+a single pass over the icons and without further browser calls, so it runs
+in the pipeline parse stage during a scrape and as a batch job over saved
+snapshots afterwards.
+
+Usage:
+    python sprite_extractor.py state/snapshots --output attributes.jsonl
+    python sprite_extractor.py state/snapshots/123.html.gz
+    python sprite_extractor.py state/snapshots --write      # merge listingAttributes into Firestore
+    python sprite_extractor.py state/snapshots --prune-days 14
+"""
+
+import os
+import re
+import sys
+import gzip
+import glob
+import json
+import time
+import argparse
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from lxml import html as lxml_html
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SNAPSHOT_DIR = os.path.join(SCRIPT_DIR, "state", "snapshots")
+
+MILEAGE = "background-position: -21px -63px;"
+FUEL_TYPE_AND_TRANSMISSION = "background-position: -42px -63px;"
+INTERIOR_EXTERIOR_COLOR = "background-position: -84px -21px;"
+CONSUMPTION = "background-position: -84px -63px;"
+DEBT = "background-position: -84px -63px;"
+TITLE = "background-position: -84px -105px;"
+OWNERS = 'background-position: -21px -181px;'
+PAID_OFF = 'background-position: 0px 0px;'
+CLEAN_TITLE = 'background-position: -63px -105px;'
+
+# Attribute name -> icon sprite (DEBT shares its sprite with CONSUMPTION and is not listed separately)
+SPRITE_ATTRIBUTES = {
+    "mileage": MILEAGE,
+    "fuel_type_and_transmission": FUEL_TYPE_AND_TRANSMISSION,
+    "interior_exterior_color": INTERIOR_EXTERIOR_COLOR,
+    "consumption": CONSUMPTION,
+    "title_status": TITLE,
+    "owners": OWNERS,
+    "paid_off": PAID_OFF,
+    "clean_title": CLEAN_TITLE,
+}
+
+POSITION_RE = re.compile(r"background-position\s*:\s*([^;\"]+)")
+
+# Ancestors climbed from an icon to reach the element holding the row text
+MAX_ROW_DEPTH = 4
+
+
+def sprite_position(style: str) -> Optional[str]:
+    """Normalized background-position of an inline style ("-21px -63px"), or None"""
+    match = POSITION_RE.search(style or "")
+    if not match:
+        return None
+    return " ".join(match.group(1).split())
+
+
+def sprite_positions() -> Dict[str, str]:
+    """Attribute name -> normalized background-position, as compared against the page"""
+    return {name: sprite_position(style) for name, style in SPRITE_ATTRIBUTES.items()}
+
+
+# Normalized position -> attribute name
+_POSITION_NAMES = {position: name for name, position in sprite_positions().items()}
+
+
+def _row_text(icon) -> Optional[str]:
+    row = icon.getparent()
+    for _ in range(MAX_ROW_DEPTH):
+        if row is None:
+            return None
+        text = " ".join(row.text_content().split())
+        if text:
+            return text
+        row = row.getparent()
+    return None
+
+
+def extract_attributes(page_source: str) -> Dict[str, str]:
+    """Attribute rows of a listing page, keyed like SPRITE_ATTRIBUTES; first row per attribute wins"""
+    if not page_source:
+        return {}
+    root = lxml_html.fromstring(page_source)
+    attributes = {}
+    for icon in root.iter("i"):
+        name = _POSITION_NAMES.get(sprite_position(icon.get("style")))
+        if name is None or name in attributes:
+            continue
+        text = _row_text(icon)
+        if text:
+            attributes[name] = text
+            if len(attributes) == len(_POSITION_NAMES):
+                break
+    return attributes
+
+
+# --- snapshots -----------------------------------------------------------------
+
+def save_snapshot(publication_id, page_source: str, directory: str = DEFAULT_SNAPSHOT_DIR) -> str:
+    """Store a gzipped page_source snapshot (atomic), returns its path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{publication_id}.html.gz")
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(page_source)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot(path: str) -> str:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def snapshot_paths(inputs: Iterable[str]) -> Iterator[str]:
+    """Expand directories into their .html / .html.gz files"""
+    for item in inputs:
+        if os.path.isdir(item):
+            yield from sorted(glob.glob(os.path.join(item, "*.html.gz")) + glob.glob(os.path.join(item, "*.html")))
+        else:
+            yield item
+
+
+def publication_id_from_path(path: str) -> str:
+    name = os.path.basename(path)
+    for suffix in (".html.gz", ".html"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def extract_files(paths: Iterable[str]) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Batch mode - yield (publication_id, attributes) for saved snapshots"""
+    for path in paths:
+        try:
+            yield publication_id_from_path(path), extract_attributes(read_snapshot(path))
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Could not extract {path}: {str(e)}")
+
+
+def prune_snapshots(directory: str, max_age_days: float) -> int:
+    """Delete snapshots older than max_age_days; returns how many were removed"""
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in snapshot_paths([directory]):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract vehicle attribute rows from saved page snapshots")
+    parser.add_argument("inputs", nargs="*", default=[DEFAULT_SNAPSHOT_DIR], help="Snapshot files or directories")
+    parser.add_argument("--output", type=str, help="JSON-lines output file (default: stdout)")
+    parser.add_argument("--write", action="store_true", help="Merge listingAttributes into vehicles_initial")
+    parser.add_argument("--prune-days", type=float, help="Delete snapshots older than this many days instead")
+    args = parser.parse_args()
+
+    if args.prune_days is not None:
+        for directory in args.inputs:
+            print(f"Removed {prune_snapshots(directory, args.prune_days)} snapshots from {directory}")
+        return
+
+    db = collection = None
+    if args.write:
+        from index import firestore_client
+
+        db = firestore_client()
+        if not db:
+            sys.exit(1)
+        collection = db.collection("vehicles_initial")
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    batch = db.batch() if db else None
+    pending = 0
+    count = 0
+    start = time.perf_counter()
+    for publication_id, attributes in extract_files(snapshot_paths(args.inputs)):
+        out.write(json.dumps({"publication_id": publication_id, "listingAttributes": attributes}) + "\n")
+        if batch is not None and attributes:
+            batch.set(collection.document(publication_id), {"listingAttributes": attributes}, merge=True)
+            pending += 1
+            if pending % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+        count += 1
+    if batch is not None and pending % 400:
+        batch.commit()
+    elapsed = time.perf_counter() - start
+
+    if out is not sys.stdout:
+        out.close()
+    print(f"Extracted {count} snapshots in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Listing Text Segmenter
+
+body.text of a listing page carries the whole Marketplace chrome: the
+notification counter, the category list, "Buy and sell groups", sponsored
+blocks and the "Today's picks" feed. Every byte of it ends up in the
+Firestore document. The segmenter keeps only the regions that matter:
+
+    publicationText: listing region (title, price, listed time, location,
+                     description, vehicle details) + seller-info region
+    dealershipBody:  seller header (name, join year, active listings)
+                     + the seller's listings
+
+Regions are described by line rules (see PUBLICATION_RULES / PROFILE_RULES),
+so a layout change is a rule edit. Text where no rule matches - for example
+already trimmed text - is returned unchanged, so trimming is idempotent and
+safe to re-run over stored documents.
+
+Usage:
+    python text_segmenter.py --fixtures
+    python text_segmenter.py --input docs.jsonl --output trimmed.jsonl
+    python text_segmenter.py --firestore --limit 5000 [--write]
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# A rule keeps one region of lines. It starts at the first (or, with "occurrence": "last", the
+# last) line matching "start" - kept unless "skip_start" - plus "context_before" lines above it,
+# and ends before the first following line matching one of "end". With "missing_start":
+# "from_top" the region starts at the first line when "start" never matches.
+# Patterns match whole stripped lines, case-insensitively.
+PUBLICATION_RULES = [
+    {
+        "name": "listing",
+        "start": r"buy and sell groups",
+        "skip_start": True,
+        "missing_start": "from_top",
+        "end": [r"seller information", r"sponsored", r"send seller a message", r"today's picks"],
+    },
+    {
+        "name": "seller",
+        "start": r"seller information",
+        "end": [r"sponsored", r"send seller a message", r"hello, is this still available\?", r"today's picks"],
+    },
+]
+
+PROFILE_RULES = [
+    {
+        "name": "seller",
+        "start": r"\d[\d,]* active listings?",
+        "context_before": 2,
+        "end": [r"follow", r"message", r"view profile", r"about", r"joined facebook\b.*"],
+    },
+    {
+        "name": "listings",
+        "start": r"joined facebook\b.*",
+        "occurrence": "last",
+        "end": [r"today's picks", r"sponsored"],
+    },
+]
+
+
+def _compile(rules: List[Dict]) -> List[Dict]:
+    compiled = []
+    for rule in rules:
+        compiled.append(dict(
+            rule,
+            start_re=re.compile(rf"^(?:{rule['start']})$", re.IGNORECASE),
+            end_re=re.compile(rf"^(?:{'|'.join(rule.get('end', []))})$", re.IGNORECASE) if rule.get("end") else None,
+        ))
+    return compiled
+
+
+_PUBLICATION = _compile(PUBLICATION_RULES)
+_PROFILE = _compile(PROFILE_RULES)
+
+
+def _region(lines: List[str], stripped: List[str], rule: Dict) -> Optional[List[str]]:
+    starts = [i for i, line in enumerate(stripped) if rule["start_re"].match(line)]
+    if starts:
+        start = starts[-1] if rule.get("occurrence") == "last" else starts[0]
+        first = start + 1 if rule.get("skip_start") else max(0, start - rule.get("context_before", 0))
+        search_from = start + 1
+    elif rule.get("missing_start") == "from_top":
+        first = search_from = 0
+    else:
+        return None
+
+    last = len(lines)
+    if rule["end_re"] is not None:
+        for i in range(search_from, len(lines)):
+            if rule["end_re"].match(stripped[i]):
+                last = i
+                break
+    return lines[first:last]
+
+
+def segment(text: str, rules: List[Dict]) -> Tuple[str, Dict[str, str]]:
+    """
+    Apply compiled rules to text.
+
+    Returns:
+        (kept text, {region name: region text}); the original text if no rule found its start
+    """
+    if not text:
+        return text or "", {}
+    lines = text.split("\n")
+    stripped = [line.strip() for line in lines]
+
+    regions = {}
+    anchored = False
+    for rule in rules:
+        region = _region(lines, stripped, rule)
+        if region is None:
+            continue
+        anchored = anchored or any(rule["start_re"].match(line) for line in stripped)
+        region_text = "\n".join(region).strip()
+        if region_text:
+            regions[rule["name"]] = region_text
+
+    if not anchored:
+        return text, {}
+    return "\n".join(regions.values()), regions
+
+
+def trim_publication_text(text: str) -> str:
+    return segment(text, _PUBLICATION)[0]
+
+
+def trim_dealership_text(text: str) -> str:
+    return segment(text, _PROFILE)[0]
+
+
+def utf8_size(text: str) -> int:
+    return len((text or "").encode("utf-8"))
+
+
+class TrimReport:
+    """Bytes before/after trimming, per document and in total"""
+
+    def __init__(self):
+        self.reset()
+
+    def record(self, doc_id, before: int, after: int) -> Dict:
+        row = {"publication_id": doc_id, "bytes_before": before, "bytes_after": after}
+        self.documents += 1
+        self.bytes_before += before
+        self.bytes_after += after
+        return row
+
+    def reset(self):
+        self.documents = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def summary(self) -> str:
+        saved = self.bytes_before - self.bytes_after
+        percent = saved / self.bytes_before * 100 if self.bytes_before else 0.0
+        return (f"Text trimming: {self.documents} documents, {self.bytes_before / 1024:.1f} KB -> "
+                f"{self.bytes_after / 1024:.1f} KB ({percent:.0f}% saved)")
+
+
+def trim_document(doc: Dict) -> Tuple[Dict, int, int]:
+    """Trimmed publicationText/dealershipBody fields of a stored document, with total bytes before and after"""
+    fields = {}
+    before = after = 0
+    for field, trim in (("publicationText", trim_publication_text), ("dealershipBody", trim_dealership_text)):
+        text = doc.get(field) or ""
+        trimmed = trim(text)
+        before += utf8_size(text)
+        after += utf8_size(trimmed)
+        if trimmed != text:
+            fields[field] = trimmed
+    return fields, before, after
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _fixture_documents() -> Iterable[Dict]:
+    from vehicle_parser import FIXTURES, html_fixture_text
+
+    for path in FIXTURES:
+        text = html_fixture_text(path)
+        yield {"publication_id": path.rsplit("/", 1)[-1].split(".")[0], "publicationText": text, "dealershipBody": text}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trim stored publication text down to the listing and seller regions")
+    parser.add_argument("--input", type=str, help="JSON-lines file of stored documents")
+    parser.add_argument("--output", type=str, help="JSON-lines output file of trimmed fields (default: stdout)")
+    parser.add_argument("--firestore", action="store_true", help="Read documents from vehicles_initial")
+    parser.add_argument("--limit", type=int, default=1000, help="Max Firestore documents to trim (default: 1000)")
+    parser.add_argument("--write", action="store_true", help="Write trimmed fields back into Firestore")
+    parser.add_argument("--fixtures", action="store_true", help="Report on the checked-in HTML fixtures")
+    args = parser.parse_args()
+
+    db = collection = None
+    if args.firestore:
+        from vehicle_parser import _firestore_collection
+        db, collection = _firestore_collection()
+        documents = (snap.to_dict() for snap in collection.limit(args.limit).stream())
+    elif args.input:
+        documents = _read_jsonl(args.input)
+    elif args.fixtures:
+        documents = _fixture_documents()
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    batch = db.batch() if (db and args.write) else None
+    report = TrimReport()
+    changed = 0
+    start = time.perf_counter()
+    for doc in documents:
+        fields, before, after = trim_document(doc)
+        row = report.record(doc.get("publication_id"), before, after)
+        out.write(json.dumps(dict(row, **fields), ensure_ascii=False) + "\n")
+        if batch is not None and fields and doc.get("publication_id"):
+            batch.set(collection.document(str(doc["publication_id"])), fields, merge=True)
+            changed += 1
+            if changed % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+    if batch is not None and changed % 400:
+        batch.commit()
+    elapsed = time.perf_counter() - start
+
+    if out is not sys.stdout:
+        out.close()
+    print(f"{report.summary()} in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
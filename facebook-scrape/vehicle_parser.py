@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Structured Vehicle Parser
+
+Turns the captured publicationText of a listing into the vehicle schema used by
+the app (see 503383609465845.json):
+
+    product_title, product_price, publication_description, location,
+    vehicle_info: mileage, transmission, interior_color, exterior_color,
+                  fuel_type, consumption {city, highway}, title
+
+All patterns are precompiled at import time. The parser runs inline from
+scrap_link and in batch mode over stored documents.
+
+Usage:
+    python vehicle_parser.py --input docs.jsonl --output parsed.jsonl
+    python vehicle_parser.py --firestore --limit 5000 [--write]
+    python vehicle_parser.py --benchmark
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Iterable, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = [
+    os.path.join(SCRIPT_DIR, "2780589125467956.html"),
+    os.path.join(SCRIPT_DIR, "2858364961038616.html"),
+]
+
+# Marketplace chrome that precedes / follows the listing when the text was not trimmed
+LISTING_START_RE = re.compile(r"^Buy and sell groups[ \t]*$", re.MULTILINE)
+LISTING_END_MARKER = "Today's picks"
+PRICE_LINE_RE = re.compile(r"^\s*(?:(?:US)?\$\s?([\d,]+)|(Free))\s*$")
+LOCATION_RE = re.compile(r"^\s*in ([^\n]+?)\s*$", re.MULTILINE)
+DESCRIPTION_RE = re.compile(
+    r"Seller's description\s*\n(.*?)(?:\s*See less|\nSee translation|\nLocation is approximate|\nSeller information|$)",
+    re.DOTALL,
+)
+
+# "About this vehicle" section. Case-insensitive patterns run on the lowercased text
+# without re.IGNORECASE, and each is guarded by a cheap substring check.
+DRIVEN_RE = re.compile(r"driven ([\d,.]+)\s*(miles|km)\b")
+TRANSMISSION_RE = re.compile(r"\b(automatic|manual) transmission\b")
+EXTERIOR_RE = re.compile(r"Exterior colou?r:\s*([A-Za-z][A-Za-z ]*?)\s*(?:·|\n|$)")
+INTERIOR_RE = re.compile(r"Interior colou?r:\s*([A-Za-z][A-Za-z ]*?)\s*(?:·|\n|$)")
+FUEL_RE = re.compile(r"Fuel type:\s*([A-Za-z][A-Za-z /-]*?)\s*(?:·|\n|$)")
+CONSUMPTION_RE = re.compile(r"([\d.]+)\s*mpg city\s*·?\s*([\d.]+)\s*mpg highway")
+TITLE_STATUS_RE = re.compile(r"\b(clean|rebuilt|salvage|reconstructed|lien|missing)\s+title\b")
+
+# Free-text fallbacks for descriptions like "127,000 miles" or "47k Miles"
+MILEAGE_TEXT_RE = re.compile(r"\b(\d{1,3}(?:[,.]\d{3})+|\d+(?:\.\d+)?)\s*(k)?\s*(?:miles|mi)\b")
+
+KM_PER_MILE = 1.609344
+
+
+def _to_int(digits: str) -> Optional[int]:
+    digits = re.sub(r"[^\d]", "", digits or "")
+    return int(digits) if digits else None
+
+
+def _parse_mileage(lower: str) -> Optional[int]:
+    if "driven " in lower:
+        match = DRIVEN_RE.search(lower)
+        if match:
+            value = _to_int(match.group(1))
+            if value is not None and match.group(2) == "km":
+                value = int(round(value / KM_PER_MILE))
+            return value
+
+    if "mi" in lower:
+        match = MILEAGE_TEXT_RE.search(lower)
+        if match:
+            number, thousands = match.group(1), match.group(2)
+            if thousands:
+                try:
+                    return int(float(number.replace(",", "")) * 1000)
+                except ValueError:
+                    return None
+            return _to_int(number)
+    return None
+
+
+def _search(pattern, text, marker):
+    """Run pattern only when its literal marker occurs in text"""
+    return pattern.search(text) if marker in text else None
+
+
+def parse_publication(publication_text: str) -> Dict:
+    """Extract the vehicle schema from captured listing text"""
+    text = publication_text or ""
+
+    # Drop the navigation chrome and recommendations if the text was never trimmed
+    end = text.find(LISTING_END_MARKER)
+    if end != -1:
+        text = text[:end]
+    if "Buy and sell groups" in text:
+        start = LISTING_START_RE.search(text)
+        if start:
+            text = text[start.end():]
+
+    lower = text.lower()
+
+    product_title = None
+    product_price = None
+    previous = None
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if previous and (line[0] == "$" or line[:3] == "US$" or line == "Free"):
+            match = PRICE_LINE_RE.match(line)
+            if match:
+                product_title = previous
+                product_price = 0 if match.group(2) else _to_int(match.group(1))
+                break
+        previous = line
+
+    description = None
+    match = _search(DESCRIPTION_RE, text, "Seller's description")
+    if match:
+        description = match.group(1).strip() or None
+
+    location = None
+    match = LOCATION_RE.search(text)
+    if match:
+        location = match.group(1)
+
+    transmission = _search(TRANSMISSION_RE, lower, "transmission")
+    exterior = _search(EXTERIOR_RE, text, "Exterior colo")
+    interior = _search(INTERIOR_RE, text, "Interior colo")
+    fuel = _search(FUEL_RE, text, "Fuel type:")
+    consumption = _search(CONSUMPTION_RE, lower, "mpg highway")
+    title_status = _search(TITLE_STATUS_RE, lower, "title")
+
+    return {
+        "product_title": product_title,
+        "product_price": product_price,
+        "publication_description": description,
+        "location": location,
+        "vehicle_info": {
+            "mileage": _parse_mileage(lower),
+            "transmission": f"{transmission.group(1).capitalize()} transmission" if transmission else None,
+            "interior_color": interior.group(1) if interior else None,
+            "exterior_color": exterior.group(1) if exterior else None,
+            "fuel_type": fuel.group(1) if fuel else None,
+            "consumption": {
+                "city": float(consumption.group(1)) if consumption else None,
+                "highway": float(consumption.group(2)) if consumption else None,
+            },
+            "title": title_status.group(1).capitalize() if title_status else None,
+        },
+    }
+
+
+def parse_documents(documents: Iterable[Dict]) -> Iterable[Dict]:
+    """Batch mode - yield {publication_id, ...parsed fields} for stored documents"""
+    for doc in documents:
+        parsed = parse_publication(doc.get("publicationText", ""))
+        parsed["publication_id"] = doc.get("publication_id")
+        yield parsed
+
+
+def html_fixture_text(path: str) -> str:
+    """Body text of a saved page, approximating what body.text returns in the browser"""
+    from bs4 import BeautifulSoup
+    with open(path, "r", encoding="utf-8") as f:
+        return BeautifulSoup(f.read(), "lxml").get_text()
+
+
+def benchmark(rounds: int = 20000):
+    """Measure parser throughput on the checked-in HTML fixtures"""
+    texts = [html_fixture_text(path) for path in FIXTURES]
+    for path, text in zip(FIXTURES, texts):
+        parsed = parse_publication(text)
+        print(f"{os.path.basename(path)}: {json.dumps(parsed)}")
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        parse_publication(texts[i % len(texts)])
+    elapsed = time.perf_counter() - start
+    print(f"\nParsed {rounds} documents in {elapsed:.2f}s: {rounds / elapsed:,.0f} docs/sec")
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _firestore_collection():
+    from index import firestore_client
+
+    db = firestore_client()
+    if not db:
+        sys.exit(1)
+    return db, db.collection("vehicles_initial")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse stored publications into the vehicle schema")
+    parser.add_argument("--input", type=str, help="JSON-lines file of stored documents")
+    parser.add_argument("--output", type=str, help="JSON-lines output file (default: stdout)")
+    parser.add_argument("--firestore", action="store_true", help="Read documents from vehicles_initial")
+    parser.add_argument("--limit", type=int, default=1000, help="Max Firestore documents to parse (default: 1000)")
+    parser.add_argument("--write", action="store_true", help="Merge parsed fields back into Firestore")
+    parser.add_argument("--benchmark", action="store_true", help="Measure throughput on the HTML fixtures")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+
+    if args.firestore:
+        db, collection = _firestore_collection()
+        documents = (snap.to_dict() for snap in collection.limit(args.limit).stream())
+    elif args.input:
+        db = None
+        documents = _read_jsonl(args.input)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    batch = db.batch() if (db and args.write) else None
+    count = 0
+    start = time.perf_counter()
+    for parsed in parse_documents(documents):
+        out.write(json.dumps(parsed) + "\n")
+        if batch is not None and parsed["publication_id"]:
+            fields = {k: v for k, v in parsed.items() if k != "publication_id"}
+            batch.set(collection.document(str(parsed["publication_id"])), fields, merge=True)
+            if (count + 1) % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+        count += 1
+    if batch is not None:
+        batch.commit()
+    elapsed = time.perf_counter() - start
+
+    if out is not sys.stdout:
+        out.close()
+    print(f"Parsed {count} documents in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Condition-Driven Wait Policy
+
+Replaces fixed sleeps in the scrape hot path with waits on real readiness
+signals (document.readyState, presence of key nodes, URL change, network idle).
+Every wait has a per-step upper bound, and an explicit minimum pacing floor
+keeps request pacing a setting instead of a side effect of hard-coded sleeps.
+Actual wait times are collected per step into a histogram.
+"""
+
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+from selenium.webdriver.common.by import By
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+HISTOGRAM_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000]
+
+
+# --- conditions ------------------------------------------------------------
+# Each returns a callable(browser) -> bool evaluated on every poll.
+
+def document_ready():
+    return lambda browser: browser.execute_script("return document.readyState") == "complete"
+
+
+def element_present(xpath: str):
+    return lambda browser: len(browser.find_elements(By.XPATH, xpath)) > 0
+
+
+def url_changed(original_url: str):
+    return lambda browser: browser.current_url != original_url
+
+
+def element_gone(element):
+    """True once a located element is hidden or detached from the DOM (e.g. a dismissed dialog)"""
+    def check(browser):
+        try:
+            return not element.is_displayed()
+        except Exception:
+            return True
+
+    return check
+
+
+def script_value_above(script: str, previous: int):
+    """True once the numeric result of script exceeds previous (e.g. a growing anchor count)"""
+    return lambda browser: (browser.execute_script(script) or 0) > previous
+
+
+def network_idle(quiet_seconds: float = 0.5):
+    """True once no new resource entries have been recorded for quiet_seconds"""
+    state = {"count": -1, "since": time.time()}
+
+    def check(browser):
+        count = browser.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.time()
+        if count != state["count"]:
+            state["count"] = count
+            state["since"] = now
+            return False
+        return now - state["since"] >= quiet_seconds
+
+    return check
+
+
+def all_of(*conditions):
+    return lambda browser: all(condition(browser) for condition in conditions)
+
+
+class WaitPolicy:
+    """Bounded condition waits with a pacing floor and per-step wait-time histograms"""
+
+    def __init__(self, get_browser: Callable, pacing_floor: float = 0.5, poll_interval: float = 0.25,
+                 step_floors: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            get_browser: Returns the current driver (the browser object changes on restart)
+            pacing_floor: Minimum seconds spent in every wait, even if ready immediately
+            poll_interval: Seconds between condition checks
+            step_floors: Per-step overrides of pacing_floor
+        """
+        self.get_browser = get_browser
+        self.pacing_floor = pacing_floor
+        self.poll_interval = poll_interval
+        self.step_floors = step_floors or {}
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def wait(self, step: str, condition, timeout: float, floor: Optional[float] = None) -> bool:
+        """
+        Wait until condition(browser) is true or timeout expires.
+
+        Returns:
+            True if the condition was met, False on timeout
+        """
+        start = time.time()
+        browser = self.get_browser()
+        met = False
+        while True:
+            try:
+                met = bool(condition(browser))
+            except Exception:
+                met = False
+            if met or time.time() - start >= timeout:
+                break
+            time.sleep(self.poll_interval)
+
+        if floor is None:
+            floor = self.step_floors.get(step, self.pacing_floor)
+        remaining = floor - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+        self.record(step, time.time() - start, met)
+        return met
+
+    def pause(self, step: str, seconds: float):
+        """Deliberate fixed pause (pacing only, no readiness signal), still recorded per step"""
+        time.sleep(seconds)
+        self.record(step, seconds, True)
+
+    def record(self, step: str, seconds: float, met: bool = True):
+        elapsed_ms = seconds * 1000
+        with self.lock:
+            hist = self.histograms.setdefault(step, {
+                "buckets": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0,
+            })
+            bucket = len(HISTOGRAM_BUCKETS_MS)
+            for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    bucket = i
+                    break
+            hist["buckets"][bucket] += 1
+            hist["count"] += 1
+            hist["total_ms"] += elapsed_ms
+            hist["max_ms"] = max(hist["max_ms"], elapsed_ms)
+            if not met:
+                hist["timeouts"] += 1
+
+    def summary(self) -> str:
+        """Human-readable histogram of wait times per step"""
+        with self.lock:
+            if not self.histograms:
+                return "Wait times: no waits recorded"
+            labels = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+            lines = ["Wait times per step:"]
+            for step, hist in sorted(self.histograms.items(), key=lambda item: -item[1]["total_ms"]):
+                avg_ms = hist["total_ms"] / hist["count"]
+                buckets = " ".join(f"{label}:{n}" for label, n in zip(labels, hist["buckets"]) if n)
+                lines.append(f"  {step}: n={hist['count']} avg={avg_ms:.0f}ms max={hist['max_ms']:.0f}ms "
+                             f"total={hist['total_ms'] / 1000:.1f}s timeouts={hist['timeouts']} [{buckets}]")
+            return "\n".join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
@@ -134,6 +134,17 @@ const CITIES_BY_STATE: Record<string, string[]> = {
 // How long before a city can be re-scraped (in milliseconds)
 const SCRAPE_COOLDOWN_MS = 4 * 60 * 60 * 1000; // 4 hours
 
+// How long an assigned (not yet started) job stays reserved for the VPS that
+// fetched it. Workers prefetch their next job while the current city is still
+// running; an unused prefetch becomes available again once this expires.
+const ASSIGNMENT_LEASE_MS = 15 * 60 * 1000; // 15 minutes
+
+// An in_progress job whose worker stopped sending heartbeats is considered
+// abandoned and re-leased with its resume cursor. Workers that predate
+// heartbeats only refresh updatedAt, so they get a much longer allowance.
+const STALE_HEARTBEAT_MS = 10 * 60 * 1000; // 10 minutes
+const STALE_LEGACY_IN_PROGRESS_MS = 6 * 60 * 60 * 1000; // 6 hours
+
 interface JobAssignment {
   vpsId: string;
   city: string;
@@ -141,8 +152,12 @@ interface JobAssignment {
   assignedAt: FirebaseFirestore.Timestamp;
   status: 'assigned' | 'in_progress' | 'completed' | 'failed';
   lastScrapedAt?: FirebaseFirestore.Timestamp;
+  heartbeatAt?: FirebaseFirestore.Timestamp;
+  updatedAt?: FirebaseFirestore.Timestamp;
   listingsFound?: number;
   errorCount?: number;
+  progress?: Record<string, number> | null;
+  resumeCursor?: Record<string, unknown> | null;
 }
 
 export async function POST(request: NextRequest) {
@@ -176,6 +191,11 @@ export async function POST(request: NextRequest) {
     const assignedStates = VPS_STATES[vpsId];
     const now = new Date();
     const cooldownThreshold = new Date(now.getTime() - SCRAPE_COOLDOWN_MS);
+    const leaseThreshold = new Date(now.getTime() - ASSIGNMENT_LEASE_MS);
+    const leaseSeconds = ASSIGNMENT_LEASE_MS / 1000;
+
+    // Earliest time (ms from now) a skipped city becomes available, so idle workers can poll on time
+    let nextAvailableMs = SCRAPE_COOLDOWN_MS;
 
     // Get all cities for this VPS's assigned states
     const allCities: { city: string; state: string }[] = [];
@@ -216,21 +236,58 @@ export async function POST(request: NextRequest) {
             state,
             jobId: docId,
             isNewJob: true,
+            leaseSeconds,
           },
         });
       }
 
       const jobData = jobDoc.data() as JobAssignment;
 
-      // Skip if currently in progress
+      // Skip if currently in progress, unless the worker stopped sending heartbeats
       if (jobData.status === 'in_progress') {
+        const lastSign = (jobData.heartbeatAt ?? jobData.updatedAt ?? jobData.assignedAt)?.toDate();
+        const staleAfterMs = jobData.heartbeatAt ? STALE_HEARTBEAT_MS : STALE_LEGACY_IN_PROGRESS_MS;
+        if (!lastSign || lastSign.getTime() > now.getTime() - staleAfterMs) {
+          continue;
+        }
+
+        // Abandoned mid-city: hand it out again so the next worker resumes from the cursor
+        await jobsRef.doc(docId).update({
+          assignedAt: FieldValue.serverTimestamp(),
+          status: 'assigned',
+        });
+
+        return NextResponse.json({
+          success: true,
+          job: {
+            city,
+            state,
+            jobId: docId,
+            isNewJob: false,
+            resumed: true,
+            progress: jobData.progress ?? null,
+            resumeCursor: jobData.resumeCursor ?? null,
+            leaseSeconds,
+          },
+        });
+      }
+
+      // Skip if another fetch still holds an unexpired assignment lease
+      const assignedAt = jobData.assignedAt?.toDate();
+      if (jobData.status === 'assigned' && assignedAt && assignedAt > leaseThreshold) {
+        nextAvailableMs = Math.min(nextAvailableMs, assignedAt.getTime() - leaseThreshold.getTime());
         continue;
       }
 
       // Check if cooldown has passed
       const lastScraped = jobData.lastScrapedAt?.toDate();
+      if (lastScraped && lastScraped >= cooldownThreshold) {
+        nextAvailableMs = Math.min(nextAvailableMs, lastScraped.getTime() - cooldownThreshold.getTime());
+      }
       if (!lastScraped || lastScraped < cooldownThreshold) {
-        // City is ready to be scraped again
+        // City is ready to be scraped again; failed jobs written before report-status
+        // cleared their cursor must not resume from it
+        const resumable = jobData.status !== 'failed';
         await jobsRef.doc(docId).update({
           assignedAt: FieldValue.serverTimestamp(),
           status: 'assigned',
@@ -244,6 +301,9 @@ export async function POST(request: NextRequest) {
             jobId: docId,
             isNewJob: false,
             lastScrapedAt: lastScraped?.toISOString(),
+            progress: resumable ? jobData.progress ?? null : null,
+            resumeCursor: resumable ? jobData.resumeCursor ?? null : null,
+            leaseSeconds,
           },
         });
       }
@@ -255,6 +315,7 @@ export async function POST(request: NextRequest) {
       job: null,
       message: 'All cities are on cooldown or being scraped',
       nextAvailableIn: '4 hours or less',
+      nextAvailableInSeconds: Math.max(0, Math.ceil(nextAvailableMs / 1000)),
     });
   } catch (error) {
     console.error('Error getting job:', error);
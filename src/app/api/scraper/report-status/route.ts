@@ -15,6 +15,13 @@ if (!getApps().length) {
 
 const db = getFirestore();
 
+interface JobProgress {
+  processed: number;
+  created: number;
+  duplicates: number;
+  failed: number;
+}
+
 interface StatusReport {
   vpsId: string;
   jobId: string;
@@ -24,6 +31,9 @@ interface StatusReport {
   duplicatesSkipped?: number;
   errorMessage?: string;
   scrapeDuration?: number; // in seconds
+  heartbeat?: boolean; // lease renewal with partial progress, not a status change
+  progress?: JobProgress;
+  resumeCursor?: Record<string, unknown>; // opaque to the coordinator, returned by get-job on re-lease
 }
 
 export async function POST(request: NextRequest) {
@@ -36,7 +46,10 @@ export async function POST(request: NextRequest) {
     }
 
     const body = await request.json() as StatusReport;
-    const { vpsId, jobId, status, listingsFound, newListingsAdded, duplicatesSkipped, errorMessage, scrapeDuration } = body;
+    const {
+      vpsId, jobId, status, listingsFound, newListingsAdded, duplicatesSkipped, errorMessage, scrapeDuration,
+      heartbeat, progress, resumeCursor,
+    } = body;
 
     if (!vpsId || !jobId || !status) {
       return NextResponse.json(
@@ -45,18 +58,29 @@ export async function POST(request: NextRequest) {
       );
     }
 
-    const jobRef = db.collection('scraper_jobs').doc(jobId);
-    const jobDoc = await jobRef.get();
+    // Retried reports carry the same key; apply each report only once
+    const idempotencyKey = request.headers.get('idempotency-key')?.trim() || null;
 
-    if (!jobDoc.exists) {
-      return NextResponse.json({ error: 'Job not found' }, { status: 404 });
-    }
+    const jobRef = db.collection('scraper_jobs').doc(jobId);
 
     const updateData: Record<string, unknown> = {
       status,
       updatedAt: FieldValue.serverTimestamp(),
+      lastIdempotencyKey: idempotencyKey,
     };
 
+    if (progress) {
+      updateData.progress = progress;
+    }
+    if (resumeCursor) {
+      updateData.resumeCursor = resumeCursor;
+    }
+
+    if (status === 'in_progress') {
+      // Renews the lease; get-job re-leases in_progress jobs whose heartbeat went stale
+      updateData.heartbeatAt = FieldValue.serverTimestamp();
+    }
+
     if (status === 'completed') {
       updateData.lastScrapedAt = FieldValue.serverTimestamp();
       updateData.listingsFound = listingsFound || 0;
@@ -64,15 +88,69 @@ export async function POST(request: NextRequest) {
       updateData.duplicatesSkipped = duplicatesSkipped || 0;
       updateData.scrapeDuration = scrapeDuration || 0;
       updateData.lastError = null;
+      updateData.progress = null;
+      updateData.resumeCursor = null;
     } else if (status === 'failed') {
       updateData.lastError = errorMessage || 'Unknown error';
       updateData.errorCount = FieldValue.increment(1);
+      // A failed city is retried from scratch, not from the failed run's cursor
+      updateData.progress = null;
+      updateData.resumeCursor = null;
+    }
+
+    // Read and write in one transaction, so a retried report or a late heartbeat
+    // cannot interleave with a completed/failed report
+    const outcome = await db.runTransaction(async (tx) => {
+      const jobDoc = await tx.get(jobRef);
+      if (!jobDoc.exists) {
+        return 'missing';
+      }
+
+      const jobData = jobDoc.data() ?? {};
+      if (idempotencyKey && jobData.lastIdempotencyKey === idempotencyKey) {
+        return 'replayed';
+      }
+
+      // A heartbeat that arrives after the job finished or was re-leased to another
+      // VPS must not put it back in progress
+      if (heartbeat && (jobData.status !== 'in_progress' || jobData.vpsId !== vpsId)) {
+        return 'stale';
+      }
+
+      tx.update(jobRef, updateData);
+      return 'applied';
+    });
+
+    if (outcome === 'missing') {
+      return NextResponse.json({ error: 'Job not found' }, { status: 404 });
     }
 
-    await jobRef.update(updateData);
+    if (outcome === 'replayed') {
+      return NextResponse.json({
+        success: true,
+        replayed: true,
+        message: `Job ${jobId} status already updated to ${status}`,
+      });
+    }
+
+    if (outcome === 'stale') {
+      return NextResponse.json(
+        { error: `Job ${jobId} is not in progress for ${vpsId}, heartbeat ignored` },
+        { status: 409 }
+      );
+    }
+
+    if (heartbeat) {
+      // Heartbeats are frequent; keep them out of scraper_logs
+      return NextResponse.json({
+        success: true,
+        message: `Job ${jobId} heartbeat recorded`,
+      });
+    }
 
-    // Also log to scraper_logs collection for analytics
-    await db.collection('scraper_logs').add({
+    // Also log to scraper_logs collection for analytics (keyed by the idempotency key when present)
+    const logsRef = db.collection('scraper_logs');
+    await (idempotencyKey ? logsRef.doc(idempotencyKey) : logsRef.doc()).set({
       vpsId,
       jobId,
       status,